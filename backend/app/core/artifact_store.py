@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import joblib
+
+from backend.app.core.singleflight import SingleFlight
+
+try:  # POSIX only; without it workers may occasionally compute the same key twice
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_CACHE_DIR", "backend/app/storage/artifacts"))
+ARTIFACT_CACHE_MAX_MB = int(os.getenv("ARTIFACT_CACHE_MAX_MB", "512"))
+# scored uploads (customer data) live in a separate store: their own size budget, so they never
+# evict the demo artifacts, and each entry expires with the runs that use it
+SCORED_CACHE_DIR = Path(os.getenv("SCORED_CACHE_DIR", "backend/app/storage/scored_cache"))
+SCORED_CACHE_MAX_MB = int(os.getenv("SCORED_CACHE_MAX_MB", "512"))
+
+_MISSING = object()
+
+def artifact_key(*parts: Any) -> str:
+    """
+    Content address for a computation: sha256 over its JSON-encoded inputs.
+    """
+    raw = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+class ArtifactStore:
+    """
+    Host-wide cache shared by every worker process:
+      - blobs/<aa>/<key>.joblib  one joblib file per artifact (frames, arrays, fitted models)
+      - index.sqlite             key -> size / last access / expiry, used for size-bounded LRU
+                                 eviction and for dropping expired entries
+      - locks/store.lock         one byte-range lock per key (fcntl.lockf), so only one worker
+                                 computes a missing key; a single file whatever the number of keys
+    Blobs are written to a temp file and renamed into place, so readers never see partial files.
+    Entries stored with an expiry are never returned after it and are removed by purge_expired().
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        (root / "blobs").mkdir(parents=True, exist_ok=True)
+        (root / "locks").mkdir(parents=True, exist_ok=True)
+        self._flight = SingleFlight()
+        # held open for the life of the process: closing any descriptor of the file would drop
+        # every record lock this process holds on it
+        self._lock_fd = os.open(root / "locks" / "store.lock", os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                " key TEXT PRIMARY KEY, size_bytes INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL, expires_at REAL)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(artifacts)")}
+            if "expires_at" not in columns:  # index created before entries could expire
+                db.execute("ALTER TABLE artifacts ADD COLUMN expires_at REAL")
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.root / "index.sqlite", timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _blob_path(self, key: str) -> Path:
+        return self.root / "blobs" / key[:2] / f"{key}.joblib"
+
+    @contextmanager
+    def _host_lock(self, key: str) -> Iterator[None]:
+        # the key's own byte of store.lock (60 bits of the key as offset). Record locks belong to
+        # the process, so nested computations (demo features -> raw) never block on themselves
+        # and threads of one process are kept apart by single-flight on the key
+        if self._lock_fd is None:
+            yield
+            return
+        offset = int(key[:15], 16)
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, offset)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._db() as db:
+            row = db.execute("SELECT expires_at FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] is not None and row[0] <= time.time():
+            self.delete(key)
+            return default
+
+        path = self._blob_path(key)
+        try:
+            value = joblib.load(path)
+        except FileNotFoundError:
+            return default
+        except Exception:
+            # corrupted / incompatible blob: drop it and let the caller recompute
+            self.delete(key)
+            return default
+        with self._db() as db:
+            db.execute("UPDATE artifacts SET last_access = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def put(self, key: str, value: Any, expires_at: float | None = None) -> None:
+        path = self._blob_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            joblib.dump(value, tmp)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+        now = time.time()
+        with self._db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, size_bytes, created_at, last_access, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, path.stat().st_size, now, now, expires_at),
+            )
+        self._evict()
+
+    def extend(self, key: str, expires_at: float) -> None:
+        # keeps an expiring entry at least until expires_at (never shortens it)
+        with self._db() as db:
+            db.execute(
+                "UPDATE artifacts SET expires_at = MAX(expires_at, ?) WHERE key = ? AND expires_at IS NOT NULL",
+                (expires_at, key),
+            )
+
+    def delete(self, key: str) -> None:
+        self._blob_path(key).unlink(missing_ok=True)
+        with self._db() as db:
+            db.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._db() as db:
+            keys = [row[0] for row in db.execute("SELECT key FROM artifacts WHERE expires_at <= ?", (time.time(),))]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def _evict(self) -> None:
+        self.purge_expired()
+        with self._db() as db:
+            total = db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM artifacts").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = db.execute("SELECT key, size_bytes FROM artifacts ORDER BY last_access ASC").fetchall()
+
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.delete(key)
+            total -= size
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl_seconds: int | None = None) -> Any:
+        """
+        Returns the cached artifact, or computes and stores it. Threads in this process coalesce
+        via single-flight; across processes the host-wide lock means that when several workers
+        miss at once, one computes and the others load its result.
+        With ttl_seconds the entry expires that long after its last use (each hit extends it).
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            if ttl_seconds is not None:
+                self.extend(key, time.time() + ttl_seconds)
+            return value
+        return self._flight.do(key, lambda: self._compute_locked(key, compute, ttl_seconds))
+
+    def _compute_locked(self, key: str, compute: Callable[[], Any], ttl_seconds: int | None) -> Any:
+        with self._host_lock(key):
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                if ttl_seconds is not None:
+                    self.extend(key, time.time() + ttl_seconds)
+                return value
+            value = compute()
+            try:
+                self.put(key, value, None if ttl_seconds is None else time.time() + ttl_seconds)
+            except (OSError, sqlite3.Error):
+                pass  # cache is best-effort; the computed value is still valid
+            return value
+
+
+_store: ArtifactStore | None = None
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        _store = ArtifactStore(ARTIFACT_DIR, ARTIFACT_CACHE_MAX_MB * 1024 * 1024)
+    return _store
+
+_scored_store: ArtifactStore | None = None
+
+def get_scored_store() -> ArtifactStore:
+    global _scored_store
+    if _scored_store is None:
+        _scored_store = ArtifactStore(SCORED_CACHE_DIR, SCORED_CACHE_MAX_MB * 1024 * 1024)
+    return _scored_store
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import RobustScaler, StandardScaler
+
+# layout version of bundle.json; bumped when its keys change meaning
+ARRAY_FORMAT_VERSION = 1
+
+class AffineScaler:
+    """
+    A fitted StandardScaler / RobustScaler as plain arrays: transform is (X - center) / scale,
+    with the same float operations as sklearn, so scaled values are identical.
+    StandardScaler exports also keep var / n_samples_seen, so to_sklearn() can partial_fit.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        center: np.ndarray,
+        scale: np.ndarray,
+        feature_names: list[str],
+        var: np.ndarray | None = None,
+        n_samples_seen: int | None = None,
+    ):
+        self.kind = kind
+        self.center = center
+        self.scale = scale
+        self.feature_names = list(feature_names)
+        self.var = var
+        self.n_samples_seen = n_samples_seen
+
+    @classmethod
+    def from_sklearn(cls, scaler, feature_names: list[str]) -> "AffineScaler":
+        d = len(feature_names)
+        if isinstance(scaler, StandardScaler):
+            center = scaler.mean_ if scaler.mean_ is not None and scaler.with_mean else np.zeros(d)
+            scale = scaler.scale_ if scaler.scale_ is not None else np.ones(d)
+            var = scaler.var_ if scaler.var_ is not None else None
+            return cls("standard", center, scale, feature_names, var, int(np.max(scaler.n_samples_seen_)))
+        if isinstance(scaler, RobustScaler):
+            center = scaler.center_ if scaler.center_ is not None else np.zeros(d)
+            scale = scaler.scale_ if scaler.scale_ is not None else np.ones(d)
+            return cls("robust", center, scale, feature_names)
+        raise ValueError(f"Cannot export a {type(scaler).__name__} as an affine scaler.")
+
+    def to_sklearn(self):
+        """
+        An equivalent fitted sklearn scaler (e.g. for StandardScaler.partial_fit).
+        """
+        names = np.asarray(self.feature_names, dtype=object)
+        if self.kind == "standard":
+            scaler = StandardScaler()
+            scaler.mean_ = np.array(self.center, dtype=np.float64)
+            scaler.scale_ = np.array(self.scale, dtype=np.float64)
+            scaler.var_ = np.array(self.var if self.var is not None else self.scale ** 2, dtype=np.float64)
+            scaler.n_samples_seen_ = int(self.n_samples_seen or 0)
+        else:
+            scaler = RobustScaler()
+            scaler.center_ = np.array(self.center, dtype=np.float64)
+            scaler.scale_ = np.array(self.scale, dtype=np.float64)
+        scaler.n_features_in_ = len(names)
+        scaler.feature_names_in_ = names
+        return scaler
+
+    def _matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_names]
+        return np.array(X, dtype=np.float64)  # always a copy: scaled in place below
+
+    def transform(self, X) -> np.ndarray:
+        X = self._matrix(X)
+        X -= self.center
+        X /= self.scale
+        return X
+
+    def inverse_transform(self, X) -> np.ndarray:
+        X = self._matrix(X)
+        X *= self.scale
+        X += self.center
+        return X
+
+class CentroidModel:
+    """
+    KMeans stand-in for scoring: the centroids and nearest-centroid predict in float64
+    (same half-norm formulation as sklearn's predict).
+    """
+
+    def __init__(self, cluster_centers: np.ndarray):
+        self.cluster_centers_ = cluster_centers
+        self.n_clusters = len(cluster_centers)
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        centers = np.asarray(self.cluster_centers_, dtype=np.float64)
+        scores = 0.5 * (centers ** 2).sum(axis=1) - X @ centers.T
+        return scores.argmin(axis=1).astype(np.int32)
+
+def _save_npy(path: Path, values: np.ndarray) -> None:
+    # through a file object: np.save would append ".npy" to other names
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(values), allow_pickle=False)
+
+def write_array_bundle(header_path: Path, header: dict[str, Any], arrays: dict[str, np.ndarray]) -> None:
+    """
+    Writes the arrays as .npy files next to header_path (fresh names per save), then the JSON
+    header atomically: readers see the old bundle or the new one, never a mix. Arrays of
+    generations older than the replaced one are removed (already mapped pages stay valid).
+    """
+    directory = header_path.parent
+    directory.mkdir(parents=True, exist_ok=True)
+    token = uuid.uuid4().hex[:12]
+
+    previous: set[str] = set()
+    if header_path.exists():
+        previous = set(json.loads(header_path.read_text(encoding="utf-8")).get("arrays", {}).values())
+
+    files = {}
+    for name, values in arrays.items():
+        files[name] = f"{name}.{token}.npy"
+        _save_npy(directory / files[name], values)
+
+    tmp = header_path.with_name(f".{header_path.name}.{token}.tmp")
+    try:
+        tmp.write_text(json.dumps({**header, "format": ARRAY_FORMAT_VERSION, "arrays": files}, indent=2), encoding="utf-8")
+        os.replace(tmp, header_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    keep = previous | set(files.values())
+    for stale in directory.glob("*.npy"):
+        if stale.name not in keep:
+            stale.unlink(missing_ok=True)
+
+def read_array_bundle(header_path: Path, mmap: bool = True) -> tuple[dict[str, Any], dict[str, np.ndarray]]:
+    """
+    (header, arrays) of a bundle written by write_array_bundle; the arrays are read-only memory
+    maps by default, so every worker process shares the same page-cache pages.
+    """
+    header = json.loads(header_path.read_text(encoding="utf-8"))
+    if header.get("format") != ARRAY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle format {header.get('format')!r} in {header_path}.")
+    arrays = {
+        name: np.load(header_path.parent / filename, mmap_mode="r" if mmap else None, allow_pickle=False)
+        for name, filename in header["arrays"].items()
+    }
+    return header, arrays
@@ -0,0 +1,434 @@
+from __future__ import annotations
+
+import os
+import shutil
+from typing import Callable, Iterable
+
+import numpy as np
+import pandas as pd
+
+from backend.app.core.model_store import get_bundle
+from backend.app.core.pipeline import (
+    IQR_CAP_COLUMNS,
+    SPEND_COLUMNS,
+    PURCHASE_COLUMNS,
+    quality_summaries,
+    iqr_bounds,
+    cap_outliers_iqr,
+    feature_engineering,
+    PreprocessingStats,
+)
+from backend.app.core.profiler import column_hash, profile_frame, row_hashes
+from backend.app.core.scoring import CentroidScorer
+from backend.app.core.shadow import ShadowScorer
+from backend.app.core.personas import (
+    attach_cluster_names,
+    cluster_partials,
+    merge_cluster_partials,
+    partial_means,
+    compute_cluster_tables_from_partials,
+    CLUSTER_NAMES,
+    TABLE_COLUMNS,
+)
+from backend.app.core.clustering import feature_matrix
+from backend.app.core.visuals import (
+    build_normalized_heatmap_from_profile,
+    build_pca_payload,
+    build_cluster_bar_data,
+    pca_sample_index,
+)
+from backend.app.core.simulation_clusters import run_cluster_budget_simulation
+from backend.app.core.runs import RunConfig, build_run_manifest, new_run_dir, finalize_run
+from backend.app.core.run_base import BaseWriter, take_base_rows
+
+# uploads with at least this many rows are scored chunk by chunk instead of in one frame
+CHUNKED_MIN_ROWS = int(os.getenv("CHUNKED_MIN_ROWS", "500000"))
+CHUNK_ROWS = int(os.getenv("CHUNK_ROWS", "100000"))
+# rows kept for the order statistics (income median, IQR bounds, avg-spend median);
+# below this many rows they are exact, above it they come from a uniform sample
+STATS_RESERVOIR_ROWS = int(os.getenv("STATS_RESERVOIR_ROWS", "1000000"))
+
+_INCOME_SLOT = 1 << 16
+
+class RowReservoir:
+    """
+    Uniform sample of at most `capacity` rows from a stream of column arrays
+    (Algorithm R, vectorized per chunk). Until the stream exceeds capacity it holds every row
+    in arrival order, so statistics computed on it are exact.
+    """
+
+    def __init__(self, capacity: int, seed: int = 42):
+        self.capacity = capacity
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._parts: list[dict[str, np.ndarray]] = []
+        self._sample: dict[str, np.ndarray] | None = None
+
+    @property
+    def exact(self) -> bool:
+        return self.seen <= self.capacity
+
+    def add(self, columns: dict[str, np.ndarray]) -> None:
+        n = len(next(iter(columns.values()))) if columns else 0
+        if n == 0:
+            return
+
+        if self._sample is None:
+            room = self.capacity - self.seen
+            self._parts.append({c: v[:room] for c, v in columns.items()})
+            self.seen += min(room, n)
+            if n <= room:
+                return
+            self._sample = self.values()
+            self._parts = []
+            columns = {c: v[room:] for c, v in columns.items()}
+            n -= room
+
+        # row i of the stream (0-based) replaces slot j ~ U[0, i] when j < capacity;
+        # when several rows of this chunk draw the same slot the last one wins, as sequentially
+        positions = self.seen + np.arange(n)
+        slots = (self._rng.random(n) * (positions + 1)).astype(np.int64)
+        rows = np.flatnonzero(slots < self.capacity)
+        slots = slots[rows]
+        _, last = np.unique(slots[::-1], return_index=True)
+        pick = len(slots) - 1 - last
+        slots, rows = slots[pick], rows[pick]
+
+        for c, v in columns.items():
+            current = self._sample[c]
+            if current.dtype != v.dtype:
+                current = self._sample[c] = current.astype(np.result_type(current, v))
+            current[slots] = v[rows]
+        self.seen += n
+
+    def values(self) -> dict[str, np.ndarray]:
+        if self._sample is not None:
+            return self._sample
+        if not self._parts:
+            return {}
+        return {c: np.concatenate([p[c] for p in self._parts]) for c in self._parts[0]}
+
+class RowHashSet:
+    """
+    Set of 64-bit row hashes for dropping duplicate rows across chunks (a false match between
+    distinct rows has probability ~n^2 / 2^65). Hashes live in a few sorted uint64 runs merged
+    LSM-style, so memory is 8 bytes per distinct row and lookups are binary searches.
+    """
+
+    def __init__(self):
+        self._runs: list[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._runs)
+
+    def _contains(self, hashes: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self._runs:
+            idx = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[idx] == hashes
+        return found
+
+    def add_new(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Mask of rows whose hash was not seen before (first occurrence within the chunk wins),
+        as df.duplicated() would flag them over the whole stream. New hashes are added.
+        """
+        new = ~pd.Series(hashes).duplicated().to_numpy() & ~self._contains(hashes)
+        self._runs.append(np.sort(hashes[new]))
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            b, a = self._runs.pop(), self._runs.pop()
+            self._runs.append(np.sort(np.concatenate([a, b]), kind="stable"))
+        return new
+
+def _dedupe_keys(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (key of the row, hash of everything but Income). Income is hashed separately so the
+    key can be rebuilt once missing incomes are imputed.
+    """
+    rest = row_hashes(df, skip=["Income"])
+    if "Income" not in df.columns:
+        return rest, rest
+    return _combine(rest, df["Income"]), rest
+
+def _combine(rest_hashes: np.ndarray, income: pd.Series) -> np.ndarray:
+    # Income is salted with a slot past any real column position, so it never shares a salt
+    return rest_hashes ^ column_hash(income, _INCOME_SLOT)
+
+def _parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    if "Dt_Customer" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["Dt_Customer"]):
+        df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], errors="coerce")
+    return df
+
+class _ConstantTracker:
+    """
+    Streams df[c].nunique(dropna=False) == 1: keeps up to two distinct values per column plus
+    whether it has nulls. Income nulls are resolved against the imputed median at the end.
+    """
+
+    def __init__(self):
+        self.columns: list[str] = []
+        self.values: dict[str, set] = {}
+        self.has_null: dict[str, bool] = {}
+
+    def add(self, df: pd.DataFrame) -> None:
+        for c in df.columns:
+            if c not in self.values:
+                self.columns.append(c)
+                self.values[c] = set()
+                self.has_null[c] = False
+            if len(self.values[c]) + self.has_null[c] > 1:
+                continue
+            nulls = df[c].isna()
+            self.has_null[c] = self.has_null[c] or bool(nulls.any())
+            for v in pd.unique(df[c][~nulls]):
+                self.values[c].add(v)
+                if len(self.values[c]) > 1:
+                    break
+
+    def constant_columns(self, median_income: float | None) -> list[str]:
+        out = []
+        for c in self.columns:
+            values, has_null = self.values[c], self.has_null[c]
+            if c == "Income" and has_null and median_income is not None:
+                values, has_null = values | {median_income}, False
+            if len(values) + has_null == 1:
+                out.append(c)
+        return out
+
+def _fit_stats_pass(chunks: Iterable[pd.DataFrame], stats_rows: int) -> tuple[PreprocessingStats, dict]:
+    """
+    Pass 1 over the upload, for bundles without frozen PreprocessingStats: fits what
+    clean_data / cap_outliers_iqr / feature_engineering would derive from the whole dataset,
+    so pass 2 can process each chunk independently. Returns (stats, sampling metadata).
+    """
+    constants = _ConstantTracker()
+    seen = RowHashSet()
+    income_sample = RowReservoir(stats_rows)
+    stats_sample = RowReservoir(stats_rows)
+
+    for chunk in chunks:
+        chunk = _parse_dates(chunk)
+
+        if "Income" in chunk.columns:
+            chunk["Income"] = chunk["Income"].mask(chunk["Income"] == 0)
+            income_sample.add({"Income": chunk["Income"].dropna().to_numpy()})
+
+        if "ID" in chunk.columns:
+            chunk = chunk[chunk["ID"] != 0]
+
+        constants.add(chunk)
+
+        # rows that are duplicates even before imputation; the rest is resolved on the sample
+        key, rest = _dedupe_keys(chunk)
+        new = seen.add_new(key)
+        # enough columns for feature_engineering to derive Avg_Spend_Per_Purchase
+        stats_cols = [c for c in dict.fromkeys(IQR_CAP_COLUMNS + SPEND_COLUMNS + PURCHASE_COLUMNS + ["Kidhome", "Teenhome"]) if c in chunk.columns]
+        sample = {c: chunk[c].to_numpy()[new] for c in stats_cols}
+        sample["_rest_hash"] = rest[new]
+        stats_sample.add(sample)
+
+    del seen
+
+    stats = PreprocessingStats()
+    if "Income" in constants.values:
+        stats.median_income = float(pd.Series(income_sample.values().get("Income", np.array([], dtype="float32"))).median())
+    stats.constant_columns = constants.constant_columns(stats.median_income)
+
+    sample = pd.DataFrame(stats_sample.values())
+    if "Income" in sample.columns:
+        sample["Income"] = sample["Income"].fillna(stats.median_income)
+        sample = sample[~pd.Series(_combine(sample["_rest_hash"].to_numpy(), sample["Income"])).duplicated().to_numpy()]
+    sample = sample.drop(columns=["_rest_hash", *stats.constant_columns], errors="ignore").reset_index(drop=True)
+
+    stats.iqr_bounds = {c: tuple(float(b) for b in iqr_bounds(sample[c])) for c in IQR_CAP_COLUMNS if c in sample.columns}
+    sample = feature_engineering(cap_outliers_iqr(sample, stats.iqr_bounds))
+    stats.avg_spend_median = float(sample["Avg_Spend_Per_Purchase"].median())
+    stats.fitted_rows = int(len(sample))
+
+    return stats, {
+        "stats_exact": income_sample.exact and stats_sample.exact,
+        "stats_sample_rows": int(len(sample)),
+    }
+
+def run_chunked_inference(
+    read_chunks: Callable[[int], Iterable[pd.DataFrame]],
+    filename: str,
+    config: RunConfig,
+    ttl_seconds: int,
+    input_mode: str = "raw",
+    execution=None,
+    content_sha256: str | None = None,
+) -> dict:
+    """
+    Out-of-core counterpart of run_inference_pipeline + save_run_outputs, for uploads too large
+    to hold as one frame. `read_chunks(chunk_rows)` must return a fresh iterator over the upload
+    on every call.
+
+      - raw mode: dataset-wide cleaning statistics (income median, constant columns, IQR bounds,
+        avg-spend median) come frozen from the bundle, or for older bundles from a first
+        pass over the upload (_fit_stats_pass)
+      - pass 2: each chunk is cleaned with those frozen statistics, deduplicated against all
+        earlier chunks, engineered and assigned to the nearest centroid (CentroidScorer), then appended to base.parquet;
+        tables / heatmap / simulation are rebuilt from mergeable cluster partials
+        and the PCA plot from the rows the in-memory path would sample (pca_sample_index),
+        read back from base.parquet at the end.
+
+    Memory is bounded by one chunk plus the stats sample and 8 bytes per distinct row for dedupe.
+    Returns the same dict as save_run_outputs.
+    """
+    chunk_rows = config.chunk_rows or CHUNK_ROWS
+    bundle = get_bundle(config.model_version)
+    features = bundle.final_features
+    scorer = CentroidScorer.from_bundle(bundle)
+    shadow = ShadowScorer(bundle, config.shadow_version) if config.shadow_version else None
+
+    stats, stats_meta = None, {}
+    if input_mode != "features":
+        if bundle.preprocessing is not None:
+            # frozen training stats: a single row-independent pass
+            stats, stats_meta = bundle.preprocessing, {"stats_source": "bundle"}
+        else:
+            stats, stats_meta = _fit_stats_pass(read_chunks(chunk_rows), STATS_RESERVOIR_ROWS)
+            stats_meta["stats_source"] = "upload"
+
+    run_id, run_dir = new_run_dir()
+    try:
+        partials = None
+        seen = RowHashSet()
+        n_chunks = rows_read = rows_scored = duplicates = income_zeros = removed_id_0 = 0
+        n_cols = n_feature_cols = None
+        missing = zeros = None
+        constant_cols: list[str] = []
+
+        with BaseWriter(run_dir) as base:
+            for chunk in read_chunks(chunk_rows):
+                n_chunks += 1
+                if stats is not None:
+                    chunk = _parse_dates(chunk)
+                    rows_read += len(chunk)
+                    profile = profile_frame(chunk, constants=False, duplicates=False, sample_rows=0)
+                    m, z = profile.missing, profile.zeros
+                    missing = m if missing is None else missing.add(m, fill_value=0)
+                    zeros = z if zeros is None else zeros.add(z, fill_value=0)
+
+                    if "Income" in chunk.columns:
+                        is_zero = chunk["Income"] == 0
+                        income_zeros += int(is_zero.sum())
+                        chunk["Income"] = chunk["Income"].mask(is_zero).fillna(stats.median_income)
+                    if "ID" in chunk.columns:
+                        keep = chunk["ID"] != 0
+                        removed_id_0 += int((~keep).sum())
+                        chunk = chunk[keep]
+                    constant_cols = [c for c in stats.constant_columns if c in chunk.columns]
+                    chunk = chunk.drop(columns=constant_cols)
+
+                    new = seen.add_new(_dedupe_keys(chunk)[0])
+                    duplicates += int((~new).sum())
+                    chunk = chunk[new].reset_index(drop=True)
+                    n_cols = chunk.shape[1]
+
+                    chunk = cap_outliers_iqr(chunk, stats.iqr_bounds)
+                    chunk = feature_engineering(chunk, stats.avg_spend_median)
+                    n_feature_cols = chunk.shape[1]
+                else:
+                    chunk = chunk.reset_index(drop=True)
+
+                if chunk.empty:
+                    continue
+
+                labels, _ = scorer.predict(chunk)
+                if shadow is not None:
+                    shadow.add(chunk, labels)
+
+                chunk["Cluster"] = labels
+                chunk = attach_cluster_names(chunk)
+
+                base.append(chunk)
+                partials = merge_cluster_partials(
+                    partials, cluster_partials(chunk, list(dict.fromkeys(TABLE_COLUMNS + features)))
+                )
+                rows_scored += len(chunk)
+
+        if partials is None:
+            raise ValueError("No rows left to score after cleaning.")
+
+        # report: same keys as clean_data / build_features
+        chunk_meta = {
+            "chunk_rows": chunk_rows,
+            "chunks": n_chunks,
+            **stats_meta,
+            "pca_sampled_from_rows": rows_scored,
+        }
+        if stats is None:
+            report = {"mode": "features", "note": "Uploaded dataset already contains engineered FINAL_FEATURES."}
+        else:
+            report = quality_summaries(missing, zeros, rows_read)
+            if missing is not None and "Income" in missing.index:
+                report["income_imputation"] = {
+                    "income_zeros_converted_to_nan": income_zeros,
+                    "median_income_used": round(stats.median_income, 2),
+                }
+            if missing is not None and "ID" in missing.index:
+                report["removed_id_0_rows"] = removed_id_0
+            report["dropped_constant_columns"] = constant_cols
+            report["duplicates_removed"] = duplicates
+            report["shape_after_cleaning"] = {"rows": rows_scored, "cols": n_cols}
+            if bundle.preprocessing is not None:
+                report["preprocessing_stats"] = "bundle"
+            report["final_shape_with_features"] = {"rows": rows_scored, "cols": n_feature_cols}
+        report["chunked"] = chunk_meta
+
+        tables = compute_cluster_tables_from_partials(partials, total_rows=rows_scored)
+        heatmap = build_normalized_heatmap_from_profile(partial_means(partials, features))
+
+        rows_per_cluster = partials.groupby(level="Cluster")["Rows"].sum()
+        cluster_bar = build_cluster_bar_data(
+            [{"cluster_id": int(cid), "customers": int(n)} for cid, n in rows_per_cluster.items()]
+        )
+
+        # the rows run_inference_pipeline would plot (same pca_sample_index draw over the scored
+        # rows), read back from the finished base
+        pca_idx = pca_sample_index(rows_scored, config.sample_size)
+        pca_rows = take_base_rows(
+            base.path, np.arange(rows_scored) if pca_idx is None else pca_idx, features + ["Cluster"]
+        )
+        pca_payload = build_pca_payload(
+            scaled_X=bundle.scaler.transform(feature_matrix(pca_rows, features)),
+            labels=pca_rows["Cluster"].to_numpy(),
+            cluster_names=CLUSTER_NAMES,
+            kmeans_centers_scaled=bundle.kmeans.cluster_centers_,
+            sample_size=None,
+        )
+
+        # the simulation only needs revenue per cluster name
+        revenue_col = "Total_Spend" if "Total_Spend__sum" in partials.columns else "Monetary_RFM"
+        revenue = partials.groupby(level="Cluster_Name")[f"{revenue_col}__sum"].sum()
+        sim = run_cluster_budget_simulation(
+            df=pd.DataFrame({"Cluster_Name": revenue.index, revenue_col: revenue.values}),
+            source_cluster_name="Budget-Conscious Families",
+            target_cluster_name="High-Value Loyal Customers",
+            budget_shift_pct=0.15,
+            uplift_target=0.05,
+            loss_source=0.02,
+        )
+
+        manifest = build_run_manifest(
+            filename=filename,
+            bundle=bundle,
+            report=report,
+            tables=tables,
+            visuals={
+                "cluster_bar": cluster_bar,
+                "heatmap": heatmap,
+                "pca": pca_payload,
+            },
+            sim=sim,
+        )
+        if content_sha256 is not None:
+            manifest["run"]["content_sha256"] = content_sha256
+        if shadow is not None:
+            manifest["shadow"] = shadow.report()
+        return finalize_run(run_id, run_dir, manifest, ttl_seconds, execution)
+    except BaseException:
+        shutil.rmtree(run_dir, ignore_errors=True)
+        raise
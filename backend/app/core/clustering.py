@@ -1,7 +1,17 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler, RobustScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score, silhouette_samples
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_chunked, silhouette_samples
+from threadpoolctl import threadpool_limits
 
 FINAL_FEATURES = [
     "Income", "Age", "Total_Children",
@@ -12,27 +22,246 @@ FINAL_FEATURES = [
     "Product_Variety",
 ]
 
-def evaluate_scaler(X: pd.DataFrame, scaler, name: str, k: int = 4) -> dict:
+def feature_matrix(df: pd.DataFrame, features: list[str]) -> pd.DataFrame:
+    """
+    The model input: `features` as one contiguous float64 block (a single copy, whatever mix of
+    compact dtypes df holds), still labelled so fitted scalers recognise the feature names.
+    """
+    return pd.DataFrame(df[features].to_numpy(dtype=np.float64), columns=features, index=df.index, copy=False)
+
+# KMeans random_state values tried per scaler; each (scaler, seed) pair is one search candidate
+MODEL_SEARCH_SEEDS = tuple(int(s) for s in os.getenv("MODEL_SEARCH_SEEDS", "42").split(","))
+# processes evaluating candidates in parallel (1 = evaluate in the calling process; 0 = sized
+# per search from the candidate count and the cores, see _search_workers)
+MODEL_SEARCH_WORKERS = int(os.getenv("MODEL_SEARCH_WORKERS", "0"))
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+def _limit_worker_threads(threads: int) -> None:
+    # workers share the cores: cap each one's OpenMP/BLAS threads to avoid oversubscription
+    threadpool_limits(threads)
+
+def _search_workers(n_candidates: int) -> int:
+    # default: min(candidates, cores) processes, but only once each gets more than one candidate;
+    # at one candidate per core the worker start and the pickled inputs cost what the parallel
+    # fit saves, and every uvicorn worker would keep its own pool of cpu_count processes
+    if MODEL_SEARCH_WORKERS > 0:
+        return min(MODEL_SEARCH_WORKERS, n_candidates)
+    cores = os.cpu_count() or 1
+    return cores if n_candidates > cores else 1
+
+def _search_pool() -> Executor:
+    """
+    Process pool shared by every model search, created on first use. Workers come from a
+    forkserver (fresh interpreter state, no inherited OpenMP runtime or server threads) and
+    are only started as submissions need them.
+    """
+    global _pool
+    workers = MODEL_SEARCH_WORKERS or os.cpu_count() or 1
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if ctx.get_start_method() == "forkserver":
+                # imported once in the server, so each worker forks with sklearn already loaded
+                ctx.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=ctx,
+                initializer=_limit_worker_threads,
+                initargs=(max(1, (os.cpu_count() or 1) // workers),),
+            )
+        return _pool
+
+def _run_candidates(fn, candidates: list[tuple]) -> list:
+    # results come back in candidate order, so ties resolve the same way serially or in parallel
+    workers = _search_workers(len(candidates))
+    if workers <= 1:
+        return [fn(*c) for c in candidates]
+    pool = _search_pool()
+    return [f.result() for f in [pool.submit(fn, *c) for c in candidates]]
+
+# clustering engines: "kmeans" (full batch, n_init=10), "minibatch" (MiniBatchKMeans), or "auto"
+# (minibatch from MINIBATCH_MIN_ROWS rows on)
+KMEANS_ENGINES = ("auto", "kmeans", "minibatch")
+CLUSTER_ENGINE = os.getenv("CLUSTER_ENGINE", "auto")
+MINIBATCH_MIN_ROWS = int(os.getenv("MINIBATCH_MIN_ROWS", "100000"))
+MINIBATCH_BATCH_SIZE = int(os.getenv("MINIBATCH_BATCH_SIZE", "4096"))
+MINIBATCH_N_INIT = 3
+
+def resolve_engine(engine: str, n_rows: int) -> str:
+    engine = engine.lower()
+    if engine not in KMEANS_ENGINES:
+        raise ValueError(f"Unknown clustering engine {engine!r}; expected one of {KMEANS_ENGINES}")
+    if engine == "auto":
+        return "minibatch" if n_rows >= MINIBATCH_MIN_ROWS else "kmeans"
+    return engine
+
+def make_kmeans(
+    k: int,
+    seed: int = 42,
+    engine: str = "kmeans",
+    batch_size: int | None = None,
+    init: np.ndarray | None = None,
+) -> KMeans | MiniBatchKMeans:
+    """
+    engine must already be resolved ("kmeans" or "minibatch").
+    init: starting centroids (k x features) for a warm start; a single run from them replaces
+    the n_init k-means++ restarts.
+    """
+    start = {"init": init, "n_init": 1} if init is not None else {}
+    if engine == "minibatch":
+        return MiniBatchKMeans(
+            n_clusters=k,
+            random_state=seed,
+            **({"n_init": MINIBATCH_N_INIT} | start),
+            batch_size=batch_size or MINIBATCH_BATCH_SIZE,
+        )
+    return KMeans(n_clusters=k, random_state=seed, **({"n_init": 10} | start))
+
+def engine_report(requested: str, engine: str, batch_size: int | None, n_rows: int, fit_seconds: float) -> dict:
+    return {
+        "requested": requested,
+        "engine": engine,
+        "batch_size": (batch_size or MINIBATCH_BATCH_SIZE) if engine == "minibatch" else None,
+        "rows": int(n_rows),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+
+# silhouette is O(n^2): above this many rows it is estimated on a stratified sample
+SILHOUETTE_EXACT_MAX_ROWS = int(os.getenv("SILHOUETTE_EXACT_MAX_ROWS", "20000"))
+SILHOUETTE_SAMPLE_ROWS = int(os.getenv("SILHOUETTE_SAMPLE_ROWS", "10000"))
+SILHOUETTE_SAMPLE_SEED = 42
+SILHOUETTE_Z = 1.96
+
+def _stratified_sample(labels: np.ndarray, sample_rows: int, seed: int) -> tuple[np.ndarray, dict[int, tuple[int, int]]]:
+    """
+    Row indices drawn per cluster in proportion to its size (at least 2 rows, or all of a
+    smaller cluster), plus {cluster: (cluster rows, sampled rows)}.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(labels)
+    idx, strata = [], {}
+    for c in np.unique(labels):
+        rows = np.flatnonzero(labels == c)
+        take = min(len(rows), max(2, round(sample_rows * len(rows) / n)))
+        idx.append(np.sort(rng.choice(rows, size=take, replace=False)))
+        strata[int(c)] = (len(rows), take)
+    return np.concatenate(idx), strata
+
+def _stratified_estimate(values: np.ndarray, labels: np.ndarray, strata: dict[int, tuple[int, int]]) -> tuple[float, float]:
+    # stratified mean and its standard error (with finite-population correction)
+    n_total = sum(size for size, _ in strata.values())
+    mean = var = 0.0
+    for c, (size, taken) in strata.items():
+        v = values[labels == c]
+        w = size / n_total
+        mean += w * float(v.mean())
+        if taken > 1:
+            var += w * w * (1 - taken / size) * float(v.var(ddof=1)) / taken
+    return mean, var ** 0.5
+
+def _silhouette_of_rows(Xs: np.ndarray, labels: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Exact silhouette of the given rows (distances to every row, not just to the sample):
+    O(len(rows) * n) instead of O(n^2), computed in memory-bounded chunks.
+    """
+    clusters, codes = np.unique(labels, return_inverse=True)
+    onehot = np.zeros((len(labels), len(clusters)))
+    onehot[np.arange(len(labels)), codes] = 1.0
+    sizes = onehot.sum(axis=0)
+
+    # per sampled row: summed distance to each cluster
+    sums = np.vstack(list(pairwise_distances_chunked(Xs[rows], Xs, reduce_func=lambda D, start: D @ onehot)))
+    own = codes[rows]
+    own_size = sizes[own]
+    a = sums[np.arange(len(rows)), own] / np.maximum(own_size - 1, 1)
+    means = sums / sizes
+    means[np.arange(len(rows)), own] = np.inf
+    b = means.min(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sil = (b - a) / np.maximum(a, b)
+    # singleton clusters score 0, as in silhouette_samples
+    return np.nan_to_num(np.where(own_size > 1, sil, 0.0))
+
+def silhouette_summary(Xs: np.ndarray, labels: np.ndarray, sample_rows: int | None = None) -> dict:
+    """
+    Silhouette mean / min / negative share from one silhouette_samples pass.
+    sample_rows: None = exact up to SILHOUETTE_EXACT_MAX_ROWS rows, then SILHOUETTE_SAMPLE_ROWS;
+    0 = always exact. When sampled, rows are drawn per cluster (fixed seed), each sampled row's
+    silhouette is computed exactly against all rows, and the mean and negative share are
+    stratified estimates reported with 95% intervals; the min is the sample's.
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if sample_rows is None:
+        sample_rows = SILHOUETTE_SAMPLE_ROWS if n > SILHOUETTE_EXACT_MAX_ROWS else 0
+    if not sample_rows or sample_rows >= n:
+        sil = silhouette_samples(Xs, labels)
+        return {
+            "mean": float(np.mean(sil)),
+            "min": float(sil.min()),
+            "negative_pct": float((sil < 0).mean() * 100),
+            "sampling": None,
+        }
+
+    idx, strata = _stratified_sample(labels, sample_rows, SILHOUETTE_SAMPLE_SEED)
+    sil = _silhouette_of_rows(Xs, labels, idx)
+    sampled_labels = labels[idx]
+    mean, mean_se = _stratified_estimate(sil, sampled_labels, strata)
+    neg, neg_se = _stratified_estimate((sil < 0).astype(np.float64), sampled_labels, strata)
+    return {
+        "mean": mean,
+        "min": float(sil.min()),
+        "negative_pct": neg * 100,
+        "sampling": {
+            "rows": int(len(idx)),
+            "of_rows": n,
+            "seed": SILHOUETTE_SAMPLE_SEED,
+            "confidence": 0.95,
+            "mean_ci95": [round(mean - SILHOUETTE_Z * mean_se, 4), round(mean + SILHOUETTE_Z * mean_se, 4)],
+            "negative_pct_ci95": [
+                round(max(0.0, neg - SILHOUETTE_Z * neg_se) * 100, 4),
+                round(min(1.0, neg + SILHOUETTE_Z * neg_se) * 100, 4),
+            ],
+        },
+    }
+
+def evaluate_scaler(
+    X: pd.DataFrame,
+    scaler,
+    name: str,
+    k: int = 4,
+    seed: int = 42,
+    silhouette_rows: int | None = None,
+    engine: str = "kmeans",
+    batch_size: int | None = None,
+) -> dict:
     Xs = scaler.fit_transform(X)
 
-    km = KMeans(n_clusters=k, random_state=42, n_init=10)
+    started = time.perf_counter()
+    km = make_kmeans(k, seed, engine, batch_size)
     labels = km.fit_predict(Xs)
+    fit_seconds = time.perf_counter() - started
 
-    sil_mean = float(silhouette_score(Xs, labels))
-    sil_samp = silhouette_samples(Xs, labels)
-    neg_pct = float((sil_samp < 0).mean() * 100)
+    # one silhouette pass (sampled on large data): mean, min and negative share all come from it
+    sil = silhouette_summary(Xs, labels, silhouette_rows)
 
     props = pd.Series(labels).value_counts(normalize=True)
     return {
         "Scaler": name,
-        "Silhouette_Mean": sil_mean,
-        "Silhouette_Min": float(sil_samp.min()),
-        "Negative_Silhouette_%": neg_pct,
+        "Seed": seed,
+        "Silhouette_Mean": sil["mean"],
+        "Silhouette_Min": sil["min"],
+        "Negative_Silhouette_%": sil["negative_pct"],
         "Max_Cluster_%": float(props.max() * 100),
         "Min_Cluster_%": float(props.min() * 100),
         # keep internals for selected scaler
         "labels": labels,
         "Xs": Xs,
+        "silhouette_sampling": sil["sampling"],
+        "fit_seconds": fit_seconds,
         "model": km,
         "scaler": scaler,
     }
@@ -43,26 +272,79 @@ def scaler_score(r: dict) -> float:
     return (r["Silhouette_Mean"] * 100.0) - (r["Negative_Silhouette_%"] * 2.0)
 
 
-def run_kmeans_with_best_scaler(df: pd.DataFrame, k: int = 4) -> dict:
+def _best_by_score(results: list[dict]) -> dict:
+    # first candidate wins ties
+    best = results[0]
+    for r in results[1:]:
+        if scaler_score(r) > scaler_score(best):
+            best = r
+    return best
+
+def fit_kmeans(
+    Xs: np.ndarray,
+    k: int,
+    seeds: tuple[int, ...] = MODEL_SEARCH_SEEDS,
+    engine: str = "kmeans",
+    batch_size: int | None = None,
+) -> KMeans | MiniBatchKMeans:
+    """
+    Clusters already-scaled data with the (resolved) engine, one fit per seed (in parallel when
+    there are several), keeping the lowest inertia. With a single seed this is the plain fit.
+    """
+    models = _run_candidates(_fit_kmeans_seed, [(Xs, k, seed, engine, batch_size) for seed in seeds])
+    return min(models, key=lambda km: km.inertia_)
+
+def _fit_kmeans_seed(Xs: np.ndarray, k: int, seed: int, engine: str, batch_size: int | None) -> KMeans | MiniBatchKMeans:
+    return make_kmeans(k, seed, engine, batch_size).fit(Xs)
+
+def run_kmeans_with_best_scaler(
+    df: pd.DataFrame,
+    k: int = 4,
+    seeds: tuple[int, ...] = MODEL_SEARCH_SEEDS,
+    silhouette_rows: int | None = None,
+    engine: str = CLUSTER_ENGINE,
+    batch_size: int | None = None,
+) -> dict:
+    """
+    silhouette_rows: see silhouette_summary (None = sampled automatically on large data).
+    engine / batch_size: see resolve_engine / make_kmeans; "clustering_engine" reports the
+    engine used and the selected model's fit time.
+    When silhouettes were sampled, "silhouette_sampling" holds each scaler's sample size and
+    95% intervals; the comparison table itself keeps its columns.
+    """
     # ensure features exist
     missing = [c for c in FINAL_FEATURES if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required features for clustering: {missing}")
 
-    X = df[FINAL_FEATURES].copy()
+    X = feature_matrix(df, FINAL_FEATURES)
+    resolved = resolve_engine(engine, len(X))
 
-    res_std = evaluate_scaler(X, StandardScaler(), "StandardScaler", k=k)
-    res_rob = evaluate_scaler(X, RobustScaler(), "RobustScaler", k=k)
+    # every scaler x seed candidate is evaluated independently (in parallel across processes)
+    scalers = [(StandardScaler, "StandardScaler"), (RobustScaler, "RobustScaler")]
+    results = _run_candidates(
+        evaluate_scaler, [
+            (X, cls(), name, k, seed, silhouette_rows, resolved, batch_size)
+            for cls, name in scalers
+            for seed in seeds
+        ]
+    )
 
+    # one row per scaler (its best seed); RobustScaler wins ties, as before
+    res_std = _best_by_score(results[: len(seeds)])
+    res_rob = _best_by_score(results[len(seeds):])
     best = res_rob if scaler_score(res_rob) >= scaler_score(res_std) else res_std
 
+    internals = ["labels", "Xs", "model", "scaler", "silhouette_sampling", "fit_seconds"]
+    if len(seeds) == 1:
+        internals.append("Seed")
     comparison = pd.DataFrame([
-        {kk: vv for kk, vv in res_std.items() if kk not in ["labels", "Xs", "model", "scaler"]},
-        {kk: vv for kk, vv in res_rob.items() if kk not in ["labels", "Xs", "model", "scaler"]},
+        {kk: vv for kk, vv in res_std.items() if kk not in internals},
+        {kk: vv for kk, vv in res_rob.items() if kk not in internals},
     ]).round(4)
 
-    # Attach labels to df
-    df_out = df.copy()
+    # Attach labels to df (shallow: the input frame may be shared, e.g. cached demo features)
+    df_out = df.copy(deep=False)
     df_out["Cluster"] = best["labels"]
 
     # Cluster sizes
@@ -103,4 +385,10 @@ def run_kmeans_with_best_scaler(df: pd.DataFrame, k: int = 4) -> dict:
         "kmeans_model": best["model"],
         "scaled_X": best["Xs"],
         "scaler": best["scaler"],
+        "clustering_engine": engine_report(engine, resolved, batch_size, len(X), best["fit_seconds"]),
+        "silhouette_sampling": (
+            {r["Scaler"]: r["silhouette_sampling"] for r in (res_std, res_rob)}
+            if best["silhouette_sampling"] is not None
+            else None
+        ),
     }
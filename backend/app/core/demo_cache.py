@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+import pandas as pd
+
+from backend.app.core.artifact_store import artifact_key, get_artifact_store
+from backend.app.core.singleflight import SingleFlight
+from backend.app.core.pipeline import build_features, PIPELINE_VERSION
+from backend.app.core.insights import compute_business_insights
+from backend.app.core.clustering import run_kmeans_with_best_scaler, FINAL_FEATURES
+from backend.app.core.personas import attach_cluster_names, compute_cluster_tables, CLUSTER_NAMES
+from backend.app.core.visuals import build_normalized_heatmap, build_pca_payload, build_cluster_bar_data
+
+DEMO_K = 4
+# distinct PCA sample sizes kept per dataset version (sample_size is a query param)
+MAX_PCA_VARIANTS = 8
+
+class DemoArtifacts:
+    """
+    Everything the /api/demo/* endpoints derive from one version of the demo workbook.
+    Each stage is computed lazily on first use, then shared by every later request;
+    concurrent first requests for a stage coalesce onto a single computation.
+    The expensive stages (workbook parse, build_features, clustering) also go through the
+    host-wide ArtifactStore, so with several workers they are computed once per host.
+    Returned frames/dicts are shared: callers must treat them as read-only.
+    """
+
+    def __init__(self, path: Path, mtime_ns: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self._flight = SingleFlight()
+        self._values: dict[Any, Any] = {}
+
+    def _memo(self, key: Any, compute: Callable[[], Any], store: bool = True) -> Any:
+        if key in self._values:
+            return self._values[key]
+
+        def compute_once() -> Any:
+            if key in self._values:  # finished while this caller was queued
+                return self._values[key]
+            value = compute()
+            if store:
+                self._values[key] = value
+            return value
+
+        return self._flight.do(key, compute_once)
+
+    def _shared(self, stage: str, compute: Callable[[], Any]) -> Any:
+        key = artifact_key("demo", stage, str(self.path.resolve()), self.mtime_ns, PIPELINE_VERSION)
+        return get_artifact_store().get_or_compute(key, compute)
+
+    def raw(self) -> pd.DataFrame:
+        return self._memo("raw", lambda: self._shared("raw", lambda: pd.read_excel(self.path, engine="openpyxl")))
+
+    def features(self) -> tuple[pd.DataFrame, dict]:
+        # build_features mutates its input, so it gets its own copy of the raw frame
+        return self._memo("features", lambda: self._shared("features", lambda: build_features(self.raw().copy())))
+
+    def insights(self) -> dict:
+        return self._memo("insights", lambda: compute_business_insights(self.features()[0]))
+
+    def clustering(self) -> dict:
+        return self._memo(
+            "clustering",
+            lambda: self._shared(f"clustering_k{DEMO_K}", lambda: run_kmeans_with_best_scaler(self.features()[0], k=DEMO_K)),
+        )
+
+    def named_clusters(self) -> pd.DataFrame:
+        return self._memo("named_clusters", lambda: attach_cluster_names(self.clustering()["df_with_clusters"]))
+
+    def cluster_tables(self) -> dict:
+        return self._memo("cluster_tables", lambda: compute_cluster_tables(self.named_clusters()))
+
+    def visuals(self, sample_size: int) -> dict:
+        def compute_static() -> dict:
+            return {
+                "cluster_bar": build_cluster_bar_data(self.clustering()["cluster_counts"]),
+                "heatmap": build_normalized_heatmap(self.named_clusters(), FINAL_FEATURES),
+            }
+
+        def compute_pca() -> dict:
+            clustering = self.clustering()
+            return build_pca_payload(
+                scaled_X=clustering["scaled_X"],
+                labels=self.named_clusters()["Cluster"].values,
+                cluster_names=CLUSTER_NAMES,
+                kmeans_centers_scaled=clustering["kmeans_model"].cluster_centers_,
+                sample_size=sample_size,
+            )
+
+        static = self._memo("visuals", compute_static)
+        pca_variants = sum(1 for k in list(self._values) if isinstance(k, tuple) and k[0] == "pca")
+        pca = self._memo(("pca", sample_size), compute_pca, store=pca_variants < MAX_PCA_VARIANTS)
+        return {**static, "pca": pca}
+
+
+_artifacts: dict[str, DemoArtifacts] = {}
+_artifacts_lock = threading.Lock()
+
+def get_demo_artifacts(path: Path) -> DemoArtifacts:
+    """
+    Cached artifacts for the dataset at `path`, keyed by (resolved path, mtime).
+    Replacing the workbook on disk invalidates the cache on the next request.
+    """
+    key = str(path.resolve())
+    mtime_ns = path.stat().st_mtime_ns
+    with _artifacts_lock:
+        current = _artifacts.get(key)
+        if current is None or current.mtime_ns != mtime_ns:
+            current = DemoArtifacts(path, mtime_ns)
+            _artifacts[key] = current
+        return current
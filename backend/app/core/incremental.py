@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import copy
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from backend.app.core.clustering import feature_matrix
+from backend.app.core.bundle_arrays import AffineScaler
+from backend.app.core.demo_cache import get_demo_artifacts
+from backend.app.core.model_store import BUNDLE_FORMAT, ModelBundle, bundle_path, get_bundle, save_bundle, utc_now_iso
+from backend.app.core.run_base import base_path as run_base_path, load_base_df
+
+def _with_centers(kmeans, centers: np.ndarray):
+    # a copy of the fitted estimator predicting with other centroids
+    km = copy.deepcopy(kmeans)
+    km.cluster_centers_ = np.ascontiguousarray(centers, dtype=np.float64)
+    return km
+
+def _training_cluster_counts(bundle, training_data_path: Path | None) -> list[int] | None:
+    """
+    Rows per centroid for a bundle saved before counts were kept: its training data (the demo
+    workbook production bundles are trained on) assigned with the bundle itself. None when
+    that data is not available.
+    """
+    if training_data_path is None or not training_data_path.exists():
+        return None
+    df, _ = get_demo_artifacts(training_data_path).features()
+    features = list(bundle.final_features)
+    labels = bundle.kmeans.predict(bundle.scaler.transform(feature_matrix(df, features)))
+    return [int(c) for c in np.bincount(labels, minlength=bundle.k)]
+
+def _run_content(run_dir: Path) -> str | None:
+    # sha256 of the upload behind a run (None for runs saved before it was recorded)
+    try:
+        manifest = json.loads((run_dir / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return manifest.get("run", {}).get("content_sha256")
+
+def update_bundle_from_runs(
+    base_version: str,
+    version: str,
+    run_dirs: list[Path],
+    training_data_path: Path | None = None,
+) -> dict:
+    """
+    Folds scored run bases into a copy of the `base_version` bundle and saves it as `version`,
+    without revisiting earlier data (sequential / online k-means):
+      - each batch is assigned with the current model, then every centroid moves to the
+        count-weighted mean of its history and its new rows (in feature space, so it is the
+        exact running mean whatever the scaler does); counts are stored in the bundle
+      - a StandardScaler is updated with partial_fit (exact running mean / variance);
+        a RobustScaler's median / IQR cannot be merged from summaries, so it stays as trained
+      - frozen preprocessing statistics are kept as they are
+    Runs already folded into the base bundle (or its ancestors) are skipped, and so are runs of
+    an upload whose content was already folded (a re-upload gets a new run id).
+    A bundle saved without cluster counts gets them from its training data (training_data_path).
+    """
+    bundle = get_bundle(base_version)
+    cluster_counts, counts_source = bundle.cluster_counts, "bundle"
+    if cluster_counts is None:
+        cluster_counts, counts_source = _training_cluster_counts(bundle, training_data_path), "training_data"
+    if cluster_counts is None:
+        raise ValueError(
+            f"Bundle {base_version} has no cluster counts (trained before they were stored) and its "
+            "training data is not available; retrain it once with train-production."
+        )
+
+    folded = list(bundle.folded_runs or [])
+    folded_content = list(bundle.folded_content or [])
+    features = list(bundle.final_features)
+    counts = np.asarray(cluster_counts, dtype=np.float64)
+    centers = bundle.scaler.inverse_transform(bundle.kmeans.cluster_centers_)
+    # array bundles hold a plain affine scaler: updates go through the equivalent sklearn one
+    if isinstance(bundle.scaler, AffineScaler):
+        scaler = bundle.scaler.to_sklearn()
+    else:
+        scaler = copy.deepcopy(bundle.scaler)
+    kmeans = bundle.kmeans
+    scaler_updated = isinstance(scaler, StandardScaler)
+
+    added, added_content, skipped, rows = [], [], [], 0
+    for run_dir in run_dirs:
+        content = _run_content(run_dir)
+        if run_dir.name in folded or (content is not None and content in folded_content + added_content):
+            skipped.append(run_dir.name)
+            continue
+        base_path = run_base_path(run_dir)
+        if not base_path.exists():
+            skipped.append(run_dir.name)
+            continue
+
+        X = feature_matrix(load_base_df(base_path, columns=features), features)
+        labels = kmeans.predict(scaler.transform(X))
+
+        batch_counts = np.bincount(labels, minlength=bundle.k).astype(np.float64)
+        batch_sums = np.zeros_like(centers)
+        np.add.at(batch_sums, labels, X.to_numpy())
+        total = counts + batch_counts
+        hit = batch_counts > 0
+        centers[hit] = (counts[hit, None] * centers[hit] + batch_sums[hit]) / total[hit, None]
+        counts = total
+
+        if scaler_updated:
+            scaler.partial_fit(X)
+        kmeans = _with_centers(bundle.kmeans, scaler.transform(pd.DataFrame(centers, columns=features)))
+
+        added.append(run_dir.name)
+        if content is not None:
+            added_content.append(content)
+        rows += len(X)
+
+    if not added:
+        raise ValueError("No new runs to fold into the bundle.")
+
+    new_bundle = ModelBundle(
+        version=version,
+        trained_at_utc=utc_now_iso(),
+        k=bundle.k,
+        final_features=features,
+        selected_scaler=bundle.selected_scaler,
+        cluster_names=bundle.cluster_names,
+        scaler=scaler,
+        kmeans=kmeans,
+        preprocessing=bundle.preprocessing,
+        cluster_counts=[int(c) for c in counts],
+        parent_version=base_version,
+        folded_runs=folded + added,
+        folded_content=folded_content + added_content,
+    )
+    path = bundle_path(version, fmt=BUNDLE_FORMAT)
+    save_bundle(new_bundle, path)
+
+    # how far each centroid moved, in the base bundle's scaled space
+    shift = np.linalg.norm(
+        bundle.scaler.transform(pd.DataFrame(centers, columns=features)) - bundle.kmeans.cluster_centers_, axis=1
+    )
+    return {
+        "bundle_path": str(path),
+        "bundle_meta": new_bundle.to_dict(),
+        "update": {
+            "base_version": base_version,
+            "base_cluster_counts": counts_source,
+            "runs_folded": added,
+            "runs_skipped": skipped,
+            "rows_folded": rows,
+            "scaler_updated": scaler_updated,
+            "centroid_shift": [round(float(d), 4) for d in shift],
+        },
+    }
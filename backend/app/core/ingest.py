@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import BinaryIO, Iterator
+import mmap
+import re
+import zipfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+from backend.app.core.validation import ReadPlan, coerce_dtypes
+
+PREVIEW_ROWS = 5
+
+# Arrow IPC file format: .feather (v2) and .arrow are the same container
+COLUMNAR_EXTENSIONS = {".parquet", ".feather", ".arrow"}
+COUNT_CHUNK_BYTES = 1024 * 1024
+
+_SHEET_RID_RE = re.compile(rb'<sheet\b[^>]*?\br:id="([^"]+)"')
+_REL_RE = re.compile(rb"<Relationship\b[^>]*>")
+_ATTR_RE = re.compile(rb'\b(Id|Target)="([^"]+)"')
+_ROW_NUM_RE = re.compile(rb'^[^>]*?\br="(\d+)"')
+
+def _header_names(raw: tuple) -> list[str]:
+    """
+    Mirrors pandas' header handling: blank cells -> 'Unnamed: i', duplicates -> 'name.1', 'name.2', ...
+    """
+    names: list[str] = []
+    seen: dict[str, int] = {}
+    for i, v in enumerate(raw):
+        name = f"Unnamed: {i}" if v is None or str(v).strip() == "" else str(v)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _integral_floats_to_int(df: pd.DataFrame) -> pd.DataFrame:
+    # read_excel turns whole-number cells into ints; openpyxl's raw values keep them as floats
+    for c in df.select_dtypes(include="float").columns:
+        col = df[c]
+        if col.notna().all() and (col == col.round()).all():
+            df[c] = col.astype("int64")
+    return df
+
+def count_csv_rows(fh: BinaryIO) -> tuple[int, bool]:
+    """
+    Counts data rows by scanning raw bytes for newlines (no parsing).
+    Returns (rows, estimated): the count is flagged as an estimate when the file contains
+    quote characters, since quoted fields may embed newlines.
+    """
+    fh.seek(0)
+    lines = 0
+    quoted = False
+    last = b""
+    while chunk := fh.read(COUNT_CHUNK_BYTES):
+        lines += chunk.count(b"\n")
+        quoted = quoted or b'"' in chunk
+        last = chunk
+    if last and not last.endswith(b"\n"):
+        lines += 1
+    fh.seek(0)
+    return max(0, lines - 1), quoted
+
+def preview_csv(fh: BinaryIO, n_rows: int = PREVIEW_ROWS) -> dict:
+    fh.seek(0)
+    head = pd.read_csv(fh, nrows=n_rows)
+    rows, estimated = count_csv_rows(fh)
+    return {
+        "rows": rows,
+        "rows_estimated": estimated,
+        "columns": head.columns.tolist(),
+        "head": head,
+    }
+
+def _first_sheet_path(zf: zipfile.ZipFile) -> str:
+    # same sheet pandas reads with sheet_name=0: first <sheet> in workbook.xml, resolved via its rels
+    rid = _SHEET_RID_RE.search(zf.read("xl/workbook.xml")).group(1)
+    for rel in _REL_RE.findall(zf.read("xl/_rels/workbook.xml.rels")):
+        attrs = dict(_ATTR_RE.findall(rel))
+        if attrs.get(b"Id") == rid:
+            target = attrs[b"Target"].decode()
+            return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+    raise ValueError("Workbook has no readable first sheet.")
+
+def count_xlsx_rows(fh: BinaryIO) -> int:
+    """
+    Counts data rows of the first sheet by scanning the raw sheet XML for <row> elements that
+    hold at least one value (no cell parsing, no shared-string lookups). Styled-but-empty rows
+    are ignored, so trailing formatting does not inflate the count.
+    """
+    fh.seek(0)
+    first = last = None
+    row_num = 0
+
+    def scan(segments: list[bytes]) -> None:
+        nonlocal first, last, row_num
+        for seg in segments:
+            m = _ROW_NUM_RE.match(seg)
+            row_num = int(m.group(1)) if m else row_num + 1
+            if b"<v>" in seg or b"<v " in seg or b"<is>" in seg:
+                first = row_num if first is None else first
+                last = row_num
+
+    with zipfile.ZipFile(fh) as zf, zf.open(_first_sheet_path(zf)) as src:
+        carry = b""
+        while chunk := src.read(COUNT_CHUNK_BYTES):
+            buf = carry + chunk
+            cut = buf.rfind(b"<row ")
+            if cut <= 0:
+                carry = buf
+                continue
+            scan(buf[:cut].split(b"<row ")[1:])
+            carry = buf[cut:]
+        scan(carry.split(b"<row ")[1:])
+
+    fh.seek(0)
+    return 0 if first is None else last - first
+
+def preview_xlsx(fh: BinaryIO, n_rows: int = PREVIEW_ROWS) -> dict:
+    """
+    Reads the header and first n_rows of the first sheet via openpyxl read-only iteration;
+    the row count comes from count_xlsx_rows.
+    """
+    fh.seek(0)
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        it = ws.iter_rows(values_only=True)
+        header = next(it, ())
+        columns = _header_names(header)
+
+        body = [row[: len(columns)] for row in islice(it, n_rows)]
+    finally:
+        wb.close()
+
+    rows = count_xlsx_rows(fh)
+
+    head = pd.DataFrame(body, columns=columns) if body else pd.DataFrame(columns=columns)
+    return {
+        "rows": rows,
+        "rows_estimated": False,
+        "columns": columns,
+        "head": _integral_floats_to_int(head),
+    }
+
+def _ipc_reader(fh: BinaryIO) -> pa.ipc.RecordBatchFileReader:
+    """
+    Arrow IPC reader over a memory map of the upload (or its in-memory buffer): batches only
+    reference their bodies, so counting rows or selecting columns reads no column data.
+    """
+    fh.seek(0)
+    try:
+        source = pa.py_buffer(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+    except (AttributeError, OSError, ValueError):  # no descriptor, or an empty file
+        source = pa.py_buffer(fh.getbuffer()) if hasattr(fh, "getbuffer") else fh
+    return pa.ipc.open_file(source)
+
+def read_columnar_header(fh: BinaryIO, ext: str) -> list[str]:
+    """
+    Column names from Parquet / Arrow IPC schema metadata (no data pages are read).
+    """
+    fh.seek(0)
+    if ext == ".parquet":
+        names = pq.ParquetFile(fh).schema_arrow.names
+    else:
+        names = _ipc_reader(fh).schema.names
+    fh.seek(0)
+    return names
+
+def read_columnar(fh: BinaryIO, ext: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Reads only the requested columns; values arrive already typed, so there is no text/float parsing.
+    """
+    fh.seek(0)
+    if ext == ".parquet":
+        return pd.read_parquet(fh, columns=columns)
+    return pd.read_feather(fh, columns=columns)
+
+def count_columnar_rows(fh: BinaryIO, ext: str) -> int:
+    """
+    Exact row count from metadata: the Parquet footer, or the IPC record batch headers.
+    """
+    fh.seek(0)
+    if ext == ".parquet":
+        rows = pq.ParquetFile(fh).metadata.num_rows
+    else:
+        reader = _ipc_reader(fh)
+        rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    fh.seek(0)
+    return int(rows)
+
+def preview_columnar(fh: BinaryIO, ext: str, n_rows: int = PREVIEW_ROWS) -> dict:
+    # row counts are exact from file metadata; only the first batch is decoded
+    fh.seek(0)
+    if ext == ".parquet":
+        pf = pq.ParquetFile(fh)
+        rows = pf.metadata.num_rows
+        batch = next(pf.iter_batches(batch_size=n_rows), None)
+        schema = pf.schema_arrow
+    else:
+        reader = _ipc_reader(fh)
+        batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+        rows = sum(b.num_rows for b in batches)
+        batch = batches[0] if batches else None
+        schema = reader.schema
+
+    head = (
+        pa.Table.from_batches([batch.slice(0, n_rows)]).to_pandas()
+        if batch is not None
+        else schema.empty_table().to_pandas()
+    )
+    fh.seek(0)
+    return {
+        "rows": int(rows),
+        "rows_estimated": False,
+        "columns": schema.names,
+        "head": head,
+    }
+
+def read_header(fh: BinaryIO, ext: str) -> list[str]:
+    """
+    Column names only: CSV header line, first XLSX row (read-only mode) or columnar schema.
+    Lets validation reject a bad upload before any full parse.
+    """
+    if ext in COLUMNAR_EXTENSIONS:
+        return read_columnar_header(fh, ext)
+
+    fh.seek(0)
+    if ext == ".csv":
+        columns = pd.read_csv(fh, nrows=0).columns.tolist()
+    else:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            header = next(wb.worksheets[0].iter_rows(values_only=True, max_row=1), ())
+        finally:
+            wb.close()
+        columns = _header_names(header)
+    fh.seek(0)
+    return columns
+
+def read_table(fh: BinaryIO, ext: str, plan: ReadPlan) -> pd.DataFrame:
+    """
+    Full parse restricted to plan.usecols, with compact dtypes.
+    CSV takes the dtypes inside the parser; if a typed column holds stray values
+    (blanks in an int column, text in a numeric one) it is re-read untyped and coerced.
+    """
+    fh.seek(0)
+    if ext in COLUMNAR_EXTENSIONS:
+        return coerce_dtypes(read_columnar(fh, ext, columns=plan.usecols), plan)
+
+    if ext == ".csv":
+        try:
+            return pd.read_csv(fh, usecols=plan.usecols, dtype=plan.dtype, parse_dates=plan.parse_dates)
+        except (ValueError, TypeError, OverflowError):
+            fh.seek(0)
+            df = pd.read_csv(fh, usecols=plan.usecols, parse_dates=plan.parse_dates)
+    else:
+        df = pd.read_excel(fh, engine="openpyxl", usecols=plan.usecols)
+    return coerce_dtypes(df, plan)
+
+def count_rows(fh: BinaryIO, ext: str) -> tuple[int, bool]:
+    """
+    Fast (rows, estimated) without parsing: file metadata for columnar formats,
+    raw byte/XML scanning for CSV and XLSX.
+    """
+    if ext == ".csv":
+        return count_csv_rows(fh)
+    if ext == ".xlsx":
+        return count_xlsx_rows(fh), False
+    return count_columnar_rows(fh, ext), False
+
+def iter_table_chunks(fh: BinaryIO, ext: str, plan: ReadPlan, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Streams the upload as DataFrames of at most chunk_rows rows, restricted to plan.usecols and
+    coerced to the plan's dtypes chunk by chunk. Each call restarts from the top of the file,
+    so multi-pass consumers just call it again. Memory is bounded by one chunk.
+    """
+    fh.seek(0)
+    if ext == ".csv":
+        # dtypes are applied per chunk: a stray value late in the file must not abort the stream
+        for chunk in pd.read_csv(fh, usecols=plan.usecols, parse_dates=plan.parse_dates, chunksize=chunk_rows):
+            yield coerce_dtypes(chunk, plan)
+
+    elif ext == ".parquet":
+        for batch in pq.ParquetFile(fh).iter_batches(batch_size=chunk_rows, columns=plan.usecols):
+            yield coerce_dtypes(batch.to_pandas(), plan)
+
+    elif ext in COLUMNAR_EXTENSIONS:
+        reader = _ipc_reader(fh)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(plan.usecols)
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield coerce_dtypes(batch.slice(start, chunk_rows).to_pandas(), plan)
+
+    else:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            it = wb.worksheets[0].iter_rows(values_only=True)
+            columns = _header_names(next(it, ()))
+            positions = [columns.index(c) for c in plan.usecols]
+            while rows := [[row[i] if i < len(row) else None for i in positions] for row in islice(it, chunk_rows)]:
+                chunk = pd.DataFrame(rows, columns=plan.usecols)
+                # pandas drops trailing all-empty rows (styled but blank); do the same per chunk
+                chunk = chunk.loc[: chunk.last_valid_index()] if chunk.notna().any().any() else chunk.iloc[:0]
+                if len(chunk):
+                    yield coerce_dtypes(_integral_floats_to_int(chunk), plan)
+        finally:
+            wb.close()
+    fh.seek(0)
+
+def read_preview(fh: BinaryIO, ext: str, n_rows: int = PREVIEW_ROWS) -> dict:
+    """
+    Header + first n_rows only, plus a fast row count. Never parses the full file.
+    """
+    if ext == ".csv":
+        return preview_csv(fh, n_rows)
+    if ext in COLUMNAR_EXTENSIONS:
+        return preview_columnar(fh, ext, n_rows)
+    return preview_xlsx(fh, n_rows)
@@ -1,13 +1,36 @@
 from __future__ import annotations
+from collections import OrderedDict
 from dataclasses import dataclass
+import json
+import uuid
 from pathlib import Path
 from typing import Any, Dict, Optional
 import joblib
+import numpy as np
+import os
+import threading
 from datetime import datetime, timezone
 
+from backend.app.core.bundle_arrays import AffineScaler, CentroidModel, read_array_bundle, write_array_bundle
+from backend.app.core.pipeline import PreprocessingStats
+from backend.app.core.singleflight import SingleFlight
+
 DEFAULT_MODEL_DIR = Path("backend/models")
 DEFAULT_MODEL_DIR.mkdir(parents=True, exist_ok=True)
 
+# on-disk format new bundles are saved in, and preferred when a version exists in both:
+#   "joblib": the pickled ModelBundle (sklearn objects included)
+#   "arrays": JSON header + memory-mapped .npy arrays (no pickle, pages shared across workers)
+BUNDLE_FORMAT = os.getenv("BUNDLE_FORMAT", "joblib")
+
+# loaded bundles kept in memory (least recently used versions are dropped first)
+BUNDLE_CACHE_SIZE = int(os.getenv("BUNDLE_CACHE_SIZE", "4"))
+# versions loaded at app startup besides the active / shadow ones, so a missing / unreadable
+# bundle fails the boot
+PRELOAD_BUNDLES = [v.strip() for v in os.getenv("PRELOAD_BUNDLES", "").split(",") if v.strip()]
+# version serving uploads until one is promoted (active.json)
+DEFAULT_MODEL_VERSION = os.getenv("DEFAULT_MODEL_VERSION", "v1")
+
 @dataclass
 class ModelBundle:
     version: str
@@ -18,9 +41,20 @@ class ModelBundle:
     cluster_names: dict[int, str]
     scaler: Any
     kmeans: Any
+    # frozen cleaning / feature stats; None for bundles trained before they were stored,
+    # in which case inference falls back to per-batch statistics
+    preprocessing: Optional[PreprocessingStats] = None
+    # rows behind each centroid (index = cluster id), so incremental updates can weight new
+    # batches against the history; None for bundles saved before counts were kept
+    cluster_counts: Optional[list[int]] = None
+    # incremental updates: the version this one was derived from, every run folded in so far,
+    # and the upload content (sha256) of those runs, so a re-upload is not counted twice
+    parent_version: Optional[str] = None
+    folded_runs: Optional[list[str]] = None
+    folded_content: Optional[list[str]] = None
 
     def to_dict(self) -> Dict[str, Any]:
-        return {
+        out = {
             "version": self.version,
             "trained_at_utc": self.trained_at_utc,
             "k": self.k,
@@ -28,16 +62,242 @@ class ModelBundle:
             "selected_scaler": self.selected_scaler,
             "cluster_names": self.cluster_names,
         }
+        if self.preprocessing is not None:
+            out["preprocessing"] = self.preprocessing.to_dict()
+        if self.cluster_counts is not None:
+            out["cluster_counts"] = self.cluster_counts
+        if self.parent_version is not None:
+            out["parent_version"] = self.parent_version
+            out["folded_runs"] = len(self.folded_runs or [])
+        return out
 
-def bundle_path(version: str, model_dir: Path = DEFAULT_MODEL_DIR) -> Path:
-    return model_dir / f"customer_segmentation_bundle__{version}.joblib"
+def bundle_path(version: str, model_dir: Path = DEFAULT_MODEL_DIR, fmt: str | None = None) -> Path:
+    """
+    The version's bundle file in `fmt`; without fmt, whichever format exists (BUNDLE_FORMAT
+    first), or the BUNDLE_FORMAT path for a version not saved yet.
+    Array bundles are identified by their header, bundle.json.
+    """
+    paths = {
+        "joblib": model_dir / f"customer_segmentation_bundle__{version}.joblib",
+        "arrays": model_dir / f"customer_segmentation_bundle__{version}" / "bundle.json",
+    }
+    if fmt is not None:
+        return paths[fmt]
+    preferred = paths[BUNDLE_FORMAT]
+    if preferred.exists():
+        return preferred
+    other = next(p for f, p in paths.items() if f != BUNDLE_FORMAT)
+    return other if other.exists() else preferred
 
 def save_bundle(bundle: ModelBundle, path: Path) -> None:
+    """
+    Format follows the path: bundle.json -> arrays, anything else -> joblib pickle.
+    Convert an existing version with save_bundle(load_bundle(p), bundle_path(v, fmt="arrays")).
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(bundle, path)
+    if path.suffix == ".json":
+        _save_arrays(bundle, path)
+    else:
+        joblib.dump(bundle, path)
 
 def load_bundle(path: Path) -> ModelBundle:
+    if path.suffix == ".json":
+        return _load_arrays(path)
     return joblib.load(path)
 
+def _save_arrays(bundle: ModelBundle, path: Path) -> None:
+    scaler = bundle.scaler
+    if not isinstance(scaler, AffineScaler):
+        scaler = AffineScaler.from_sklearn(scaler, bundle.final_features)
+
+    arrays = {
+        "scaler_center": np.asarray(scaler.center, dtype=np.float64),
+        "scaler_scale": np.asarray(scaler.scale, dtype=np.float64),
+        "centroids": np.asarray(bundle.kmeans.cluster_centers_, dtype=np.float64),
+    }
+    if scaler.var is not None:
+        arrays["scaler_var"] = np.asarray(scaler.var, dtype=np.float64)
+
+    header = {
+        "version": bundle.version,
+        "trained_at_utc": bundle.trained_at_utc,
+        "k": bundle.k,
+        "final_features": list(bundle.final_features),
+        "selected_scaler": bundle.selected_scaler,
+        "cluster_names": {str(cid): name for cid, name in bundle.cluster_names.items()},
+        "scaler": {"kind": scaler.kind, "n_samples_seen": scaler.n_samples_seen},
+        "preprocessing": bundle.preprocessing.to_dict() if bundle.preprocessing is not None else None,
+        "cluster_counts": bundle.cluster_counts,
+        "parent_version": bundle.parent_version,
+        "folded_runs": bundle.folded_runs,
+        "folded_content": bundle.folded_content,
+    }
+    write_array_bundle(path, header, arrays)
+
+def _load_arrays(path: Path) -> ModelBundle:
+    header, arrays = read_array_bundle(path)
+    features = header["final_features"]
+    scaler = AffineScaler(
+        header["scaler"]["kind"],
+        arrays["scaler_center"],
+        arrays["scaler_scale"],
+        features,
+        var=arrays.get("scaler_var"),
+        n_samples_seen=header["scaler"].get("n_samples_seen"),
+    )
+    preprocessing = header.get("preprocessing")
+    return ModelBundle(
+        version=header["version"],
+        trained_at_utc=header["trained_at_utc"],
+        k=header["k"],
+        final_features=features,
+        selected_scaler=header["selected_scaler"],
+        cluster_names={int(cid): name for cid, name in header["cluster_names"].items()},
+        scaler=scaler,
+        kmeans=CentroidModel(arrays["centroids"]),
+        preprocessing=PreprocessingStats.from_dict(preprocessing) if preprocessing is not None else None,
+        cluster_counts=header.get("cluster_counts"),
+        parent_version=header.get("parent_version"),
+        folded_runs=header.get("folded_runs"),
+        folded_content=header.get("folded_content"),
+    )
+
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+class BundleRegistry:
+    """
+    Loaded bundles by version (LRU of `capacity` entries), so requests do not unpickle the
+    bundle file each time. Every get() stats the file: a bundle replaced on disk (new mtime or
+    size, e.g. retrained) is reloaded on its next use. Concurrent first loads of a version
+    coalesce onto one joblib.load. Bundles are shared: callers must treat them as read-only.
+    """
+
+    def __init__(self, model_dir: Path = DEFAULT_MODEL_DIR, capacity: int = BUNDLE_CACHE_SIZE):
+        self.model_dir = model_dir
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._bundles: OrderedDict[str, tuple[tuple[int, int], ModelBundle]] = OrderedDict()
+
+    def get(self, version: str) -> ModelBundle:
+        path = bundle_path(version, self.model_dir)
+        st = path.stat()  # FileNotFoundError for an unknown version
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._bundles.get(version)
+            if entry is not None and entry[0] == stamp:
+                self._bundles.move_to_end(version)
+                return entry[1]
+
+        bundle = self._flight.do((version, stamp), lambda: load_bundle(path))
+        with self._lock:
+            self._bundles[version] = (stamp, bundle)
+            self._bundles.move_to_end(version)
+            while len(self._bundles) > self.capacity:
+                self._bundles.popitem(last=False)
+        return bundle
+
+    def preload(self, versions: list[str]) -> None:
+        for version in versions:
+            self.get(version)
+
+    def invalidate(self, version: str | None = None) -> None:
+        with self._lock:
+            if version is None:
+                self._bundles.clear()
+            else:
+                self._bundles.pop(version, None)
+
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._bundles)
+
+
+_registry: BundleRegistry | None = None
+
+def get_bundle_registry() -> BundleRegistry:
+    global _registry
+    if _registry is None:
+        _registry = BundleRegistry()
+    return _registry
+
+def get_bundle(version: str) -> ModelBundle:
+    return get_bundle_registry().get(version)
+
+
+# Routing: which version scores uploads ("active") and which, if any, scores them alongside in
+# shadow. One small JSON file next to the bundles, replaced atomically, so every worker switches
+# on its next read.
+
+_routing_lock = threading.Lock()
+
+def routing_path() -> Path:
+    return get_bundle_registry().model_dir / "active.json"
+
+def read_routing() -> Dict[str, Any]:
+    path = routing_path()
+    if not path.exists():
+        return {"active": DEFAULT_MODEL_VERSION, "shadow": None, "previous": None, "updated_at_utc": None}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def _write_routing(routing: Dict[str, Any]) -> Dict[str, Any]:
+    routing = {**routing, "updated_at_utc": utc_now_iso()}
+    path = routing_path()
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp.write_text(json.dumps(routing, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return routing
+
+def promote_version(version: str) -> Dict[str, Any]:
+    """
+    Makes `version` the active one. The bundle is loaded first, so a missing / unreadable one
+    raises and leaves routing untouched; a version promoted out of shadow stops being the shadow.
+    """
+    get_bundle(version)
+    with _routing_lock:
+        routing = read_routing()
+        if routing["active"] == version:
+            return routing
+        shadow = None if routing.get("shadow") == version else routing.get("shadow")
+        return _write_routing({"active": version, "shadow": shadow, "previous": routing["active"]})
+
+def set_shadow_version(version: Optional[str]) -> Dict[str, Any]:
+    """
+    Scores every upload with `version` as well (None stops shadow scoring).
+    """
+    if version is not None:
+        get_bundle(version)
+    with _routing_lock:
+        routing = read_routing()
+        if version is not None and version == routing["active"]:
+            raise ValueError(f"{version} is the active version.")
+        return _write_routing({**routing, "shadow": version})
+
+def list_versions() -> list[Dict[str, Any]]:
+    """
+    Every saved version (either format) with its metadata and routing role.
+    """
+    model_dir = get_bundle_registry().model_dir
+    prefix = "customer_segmentation_bundle__"
+    versions = {p.stem[len(prefix):] for p in model_dir.glob(f"{prefix}*.joblib")}
+    versions |= {p.parent.name[len(prefix):] for p in model_dir.glob(f"{prefix}*/bundle.json")}
+    routing = read_routing()
+
+    out = []
+    for version in sorted(versions):
+        entry = {
+            "version": version,
+            "formats": [f for f in ("joblib", "arrays") if bundle_path(version, model_dir, fmt=f).exists()],
+            "active": version == routing["active"],
+            "shadow": version == routing.get("shadow"),
+        }
+        try:
+            entry["meta"] = get_bundle(version).to_dict()
+        except Exception as e:  # still listed: an unreadable bundle is what this view should surface
+            entry["error"] = str(e)
+        out.append(entry)
+    return out
@@ -31,7 +31,8 @@ CLUSTER_PERSONAS = {
 }
 
 def attach_cluster_names(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # shallow: only a column is added, the caller's frame is left as is
+    df = df.copy(deep=False)
     df["Cluster_Name"] = df["Cluster"].map(CLUSTER_NAMES).fillna("Unknown")
     return df
 
@@ -49,19 +50,73 @@ def build_persona_table() -> list[dict]:
         )
     return rows
 
-def _safe_mean_table(df: pd.DataFrame, group_col: str, cols: list[str], round_n: int) -> pd.DataFrame:
-    cols_present = [c for c in cols if c in df.columns]
-    if not cols_present:
-        return pd.DataFrame({group_col: sorted(df[group_col].unique())})
-    out = df.groupby(group_col)[cols_present].mean().round(round_n).reset_index()
+# numeric columns compute_cluster_tables sums or averages per cluster
+TABLE_COLUMNS = [
+    "Total_Spend", "Monetary_RFM", "Recency_RFM", "Frequency_RFM",
+    "Promo_Responsive", "Deal_Dependency",
+    "Web_Purchase_Ratio", "Store_Purchase_Ratio", "Catalog_Purchase_Ratio",
+    "Discount_Addicted", "CLV_Proxy", "Income", "Product_Variety",
+]
+
+def cluster_partials(df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Mergeable per-cluster aggregates: row count, non-null ID count and, for every column present,
+    its sum and non-null count (so means can be rebuilt exactly). Indexed by (Cluster, Cluster_Name)
+    when Cluster exists, else Cluster_Name. Partials of separate chunks combine with
+    merge_cluster_partials; compute_cluster_tables_from_partials turns them into the tables.
+    """
+    columns = TABLE_COLUMNS if columns is None else columns
+    keys = ["Cluster", "Cluster_Name"] if "Cluster" in df.columns else ["Cluster_Name"]
+    group = df.groupby(keys)
+
+    parts = {"Rows": group.size()}
+    if "ID" in df.columns:
+        parts["ID_count"] = group["ID"].count()
+    for c in dict.fromkeys(columns):
+        if c not in df.columns:
+            continue
+        values = df[c].astype("float64").groupby([df[k] for k in keys])
+        parts[f"{c}__sum"] = values.sum()
+        parts[f"{c}__count"] = values.count()
+    return pd.DataFrame(parts)
+
+def merge_cluster_partials(a: pd.DataFrame | None, b: pd.DataFrame) -> pd.DataFrame:
+    if a is None:
+        return b
+    out = a.add(b, fill_value=0)
+    count_cols = [c for c in out.columns if c in ("Rows", "ID_count") or c.endswith("__count")]
+    out[count_cols] = out[count_cols].astype("int64")
+    return out
+
+def partial_means(partials: pd.DataFrame, cols: list[str], by: str | list[str] = "Cluster_Name") -> pd.DataFrame:
+    """
+    Per-group means of `cols` (those present in partials), as df.groupby(by)[cols].mean() would give.
+    """
+    grouped = partials.groupby(level=by).sum()
+    out = pd.DataFrame(index=grouped.index)
+    for c in cols:
+        if f"{c}__sum" in grouped.columns:
+            out[c] = grouped[f"{c}__sum"] / grouped[f"{c}__count"].where(grouped[f"{c}__count"] > 0)
     return out
 
-def _safe_rate(df: pd.DataFrame, group_col: str, col: str, out_col: str, round_n: int = 3) -> pd.DataFrame:
-    if col not in df.columns:
-        return pd.DataFrame({group_col: sorted(df[group_col].unique()), out_col: [None] * df[group_col].nunique()})
+def _has(partials: pd.DataFrame, col: str) -> bool:
+    return f"{col}__sum" in partials.columns
+
+def _cluster_names(partials: pd.DataFrame) -> list[str]:
+    return sorted(partials.index.get_level_values("Cluster_Name").unique())
+
+def _safe_mean_table(partials: pd.DataFrame, group_col: str, cols: list[str], round_n: int) -> pd.DataFrame:
+    cols_present = [c for c in cols if _has(partials, c)]
+    if not cols_present:
+        return pd.DataFrame({group_col: _cluster_names(partials)})
+    return partial_means(partials, cols_present, by=group_col).round(round_n).reset_index()
+
+def _safe_rate(partials: pd.DataFrame, group_col: str, col: str, out_col: str, round_n: int = 3) -> pd.DataFrame:
+    if not _has(partials, col):
+        names = _cluster_names(partials)
+        return pd.DataFrame({group_col: names, out_col: [None] * len(names)})
     return (
-        df.groupby(group_col)[col]
-        .mean()
+        partial_means(partials, [col], by=group_col)[col]
         .round(round_n)
         .reset_index()
         .rename(columns={col: out_col})
@@ -78,24 +133,33 @@ def compute_cluster_tables(df: pd.DataFrame) -> dict:
     if "Cluster_Name" not in df.columns:
         raise ValueError("compute_cluster_tables requires df['Cluster_Name'].")
 
+    return compute_cluster_tables_from_partials(cluster_partials(df), total_rows=len(df))
+
+def compute_cluster_tables_from_partials(partials: pd.DataFrame, total_rows: int) -> dict:
+    """
+    Same tables as compute_cluster_tables, built from (merged) cluster_partials,
+    so chunked runs never need the full scored frame in memory.
+    """
+    by_name = partials.groupby(level="Cluster_Name").sum()
+
     # Revenue contribution by cluster
-    has_id = "ID" in df.columns
+    has_id = "ID_count" in partials.columns
 
     # Customers: ID count if available, else row count
-    customers_series = df.groupby("Cluster_Name")["ID"].count() if has_id else df.groupby("Cluster_Name").size()
-    customers = customers_series.rename("Customers").reset_index()
+    customers_series = by_name["ID_count"] if has_id else by_name["Rows"]
+    customers = customers_series.rename("Customers").rename_axis("Cluster_Name").reset_index()
 
     # Revenue: Total_Spend if available, else Monetary_RFM proxy (features mode)
     revenue_is_proxy = False
-    if "Total_Spend" in df.columns:
-        revenue_series = df.groupby("Cluster_Name")["Total_Spend"].sum()
-    elif "Monetary_RFM" in df.columns:
-        revenue_series = df.groupby("Cluster_Name")["Monetary_RFM"].sum()
+    if _has(partials, "Total_Spend"):
+        revenue_series = by_name["Total_Spend__sum"]
+    elif _has(partials, "Monetary_RFM"):
+        revenue_series = by_name["Monetary_RFM__sum"]
         revenue_is_proxy = True
     else:
         revenue_series = pd.Series(0.0, index=customers["Cluster_Name"])
 
-    revenue = revenue_series.rename("Total_Revenue").reset_index()
+    revenue = revenue_series.rename("Total_Revenue").rename_axis("Cluster_Name").reset_index()
 
     revenue_contribution = customers.merge(revenue, on="Cluster_Name", how="left")
     revenue_contribution["Customer_%"] = (
@@ -111,7 +175,7 @@ def compute_cluster_tables(df: pd.DataFrame) -> dict:
 
     # RFM summary (always available in features mode)
     rfm_summary = _safe_mean_table(
-        df,
+        partials,
         "Cluster_Name",
         ["Recency_RFM", "Frequency_RFM", "Monetary_RFM"],
         round_n=2,
@@ -120,15 +184,16 @@ def compute_cluster_tables(df: pd.DataFrame) -> dict:
     # Promo ROI
     # In raw mode Avg_Spend = Total_Spend mean
     # In features mode fallback Avg_Spend = Monetary_RFM mean (proxy)
-    promo_roi = df.groupby("Cluster_Name").agg(
-        Promo_Response_Rate=("Promo_Responsive", "mean"),
-        Avg_Deal_Dependency=("Deal_Dependency", "mean"),
-    )
-
-    if "Total_Spend" in df.columns:
-        promo_roi["Avg_Spend"] = df.groupby("Cluster_Name")["Total_Spend"].mean()
-    elif "Monetary_RFM" in df.columns:
-        promo_roi["Avg_Spend"] = df.groupby("Cluster_Name")["Monetary_RFM"].mean()
+    name_means = partial_means(partials, ["Promo_Responsive", "Deal_Dependency", "Total_Spend", "Monetary_RFM"])
+    promo_roi = pd.DataFrame({
+        "Promo_Response_Rate": name_means["Promo_Responsive"],
+        "Avg_Deal_Dependency": name_means["Deal_Dependency"],
+    })
+
+    if "Total_Spend" in name_means.columns:
+        promo_roi["Avg_Spend"] = name_means["Total_Spend"]
+    elif "Monetary_RFM" in name_means.columns:
+        promo_roi["Avg_Spend"] = name_means["Monetary_RFM"]
     else:
         promo_roi["Avg_Spend"] = None
 
@@ -141,73 +206,61 @@ def compute_cluster_tables(df: pd.DataFrame) -> dict:
     # Channel strategy matrix
     # Catalog_Purchase_Ratio exists only in raw mode; keep if present.
     channel_cols = ["Web_Purchase_Ratio", "Store_Purchase_Ratio", "Catalog_Purchase_Ratio"]
-    channel_strategy = _safe_mean_table(df, "Cluster_Name", channel_cols, round_n=3)
+    channel_strategy = _safe_mean_table(partials, "Cluster_Name", channel_cols, round_n=3)
 
     # Discount addiction risk
     # Exists only if computed upstream.If missing: return None values rather than crash.
-    discount_risk = _safe_rate(df, "Cluster_Name", "Discount_Addicted", "Discount_Addicted_Rate", round_n=3)
+    discount_risk = _safe_rate(partials, "Cluster_Name", "Discount_Addicted", "Discount_Addicted_Rate", round_n=3)
 
     # CLV proxy summary
     # Exists only if computed upstream.If missing: return None values rather than crash.
-    if "CLV_Proxy" in df.columns:
+    if _has(partials, "CLV_Proxy"):
         clv_summary = (
-            df.groupby("Cluster_Name")["CLV_Proxy"]
-            .mean()
+            partial_means(partials, ["CLV_Proxy"])["CLV_Proxy"]
             .round(0)
             .reset_index()
             .rename(columns={"CLV_Proxy": "Avg_CLV_Proxy"})
             .sort_values("Avg_CLV_Proxy", ascending=False)
         )
     else:
-        clv_summary = pd.DataFrame(
-            {"Cluster_Name": sorted(df["Cluster_Name"].unique()), "Avg_CLV_Proxy": [None] * df["Cluster_Name"].nunique()}
-        )
+        names = _cluster_names(partials)
+        clv_summary = pd.DataFrame({"Cluster_Name": names, "Avg_CLV_Proxy": [None] * len(names)})
 
     # Cluster summary
     # In features-only mode, remove columns that don't exist.
     # Avg_Total_Spend uses Total_Spend if present else Monetary_RFM proxy.
 
     agg_map = {
-        "Avg_Income": ("Income", "mean") if "Income" in df.columns else None,
-        "Avg_Frequency": ("Frequency_RFM", "mean") if "Frequency_RFM" in df.columns else None,
-        "Avg_Recency": ("Recency_RFM", "mean") if "Recency_RFM" in df.columns else None,
-        "Avg_Deal_Dependency": ("Deal_Dependency", "mean") if "Deal_Dependency" in df.columns else None,
-        "Avg_Product_Variety": ("Product_Variety", "mean") if "Product_Variety" in df.columns else None,
-        "Promo_Response_Rate": ("Promo_Responsive", "mean") if "Promo_Responsive" in df.columns else None,
-        "Avg_Web_Ratio": ("Web_Purchase_Ratio", "mean") if "Web_Purchase_Ratio" in df.columns else None,
-        "Avg_Store_Ratio": ("Store_Purchase_Ratio", "mean") if "Store_Purchase_Ratio" in df.columns else None,
+        "Avg_Income": "Income",
+        "Avg_Frequency": "Frequency_RFM",
+        "Avg_Recency": "Recency_RFM",
+        "Avg_Deal_Dependency": "Deal_Dependency",
+        "Avg_Product_Variety": "Product_Variety",
+        "Promo_Response_Rate": "Promo_Responsive",
+        "Avg_Web_Ratio": "Web_Purchase_Ratio",
+        "Avg_Store_Ratio": "Store_Purchase_Ratio",
     }
 
-    spend_col = "Total_Spend" if "Total_Spend" in df.columns else ("Monetary_RFM" if "Monetary_RFM" in df.columns else None)
-
-    group_cols = ["Cluster_Name"]
-    if "Cluster" in df.columns:
-        group_cols = ["Cluster", "Cluster_Name"]
+    spend_col = "Total_Spend" if _has(partials, "Total_Spend") else ("Monetary_RFM" if _has(partials, "Monetary_RFM") else None)
 
-    group = df.groupby(group_cols)
+    group_cols = list(partials.index.names)
+    group = partials.groupby(level=group_cols).sum()
+    group_means = partial_means(partials, [*agg_map.values(), *([spend_col] if spend_col else [])], by=group_cols)
 
     # Customers
-    if has_id:
-        customers_series2 = group["ID"].count()
-    else:
-        customers_series2 = group.size()
-    cluster_summary = customers_series2.rename("Customers").reset_index()
+    cluster_summary = (group["ID_count"] if has_id else group["Rows"]).rename("Customers").reset_index()
 
     # Add summary metrics safely
-    for out_col, spec in agg_map.items():
-        if spec is None:
-            cluster_summary[out_col] = None
-            continue
-        src, fn = spec
-        cluster_summary[out_col] = group[src].agg(fn).values
+    for out_col, src in agg_map.items():
+        cluster_summary[out_col] = group_means[src].values if src in group_means.columns else None
 
     # Add spend metric
     if spend_col is not None:
-        cluster_summary["Avg_Total_Spend"] = group[spend_col].mean().values
+        cluster_summary["Avg_Total_Spend"] = group_means[spend_col].values
     else:
         cluster_summary["Avg_Total_Spend"] = None
 
-    cluster_summary["Customer_%"] = (cluster_summary["Customers"] / max(1, len(df)) * 100).round(2)
+    cluster_summary["Customer_%"] = (cluster_summary["Customers"] / max(1, total_rows) * 100).round(2)
 
     # Rounding
     for c in ["Avg_Income", "Avg_Total_Spend", "Avg_Frequency", "Avg_Recency"]:
@@ -1,159 +1,348 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
 import numpy as np
 import pandas as pd
 from datetime import datetime
 
-def clean_data(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+from backend.app.core.profiler import FrameProfile, profile_frame
+
+# bump whenever cleaning / feature engineering changes output, so cached artifacts are not reused
+PIPELINE_VERSION = "1"
+
+SPEND_COLUMNS = ["MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts", "MntSweetProducts", "MntGoldProds"]
+PURCHASE_COLUMNS = ["NumWebPurchases", "NumCatalogPurchases", "NumStorePurchases"]
+
+def quality_summaries(missing_counts: pd.Series, zero_counts: pd.Series, n_rows: int, profile: FrameProfile | None = None) -> dict:
+    """
+    missing_summary / zero_summary report records from per-column counts
+    (computed on one frame, or summed over chunks).
+    profile: a sampled FrameProfile; its counts are estimates, so each record also carries the
+    95% bounds and the report says how many rows were inspected.
+    """
+    sampled = profile is not None and profile.sample_rows is not None
+
+    missing_pct = (missing_counts / n_rows * 100).round(2)
+    missing_summary = pd.DataFrame({"Missing_Value_Count": missing_counts, "Missing_value_percentage": missing_pct})
+    if sampled:
+        missing_summary["Missing_Value_Count_CI95"] = pd.Series({c: list(b) for c, b in profile.missing_ci.items()})
+    missing_summary = missing_summary.query("Missing_Value_Count > 0").sort_values("Missing_value_percentage", ascending=False)
+
+    zero_pct = (zero_counts / n_rows * 100).round(2)
+    zero_summary = pd.DataFrame({"Zero_Count": zero_counts, "Zero_Percentage": zero_pct})
+    if sampled:
+        zero_summary["Zero_Count_CI95"] = pd.Series({c: list(b) for c, b in profile.zeros_ci.items()})
+    zero_summary = zero_summary.query("Zero_Count > 0").sort_values("Zero_Percentage", ascending=False)
+
+    out = {
+        "missing_summary": missing_summary.reset_index().rename(columns={"index": "column"}).to_dict("records"),
+        "zero_summary": zero_summary.reset_index().rename(columns={"index": "column"}).to_dict("records"),
+    }
+    if sampled:
+        out["quality_sample"] = {"rows": profile.sample_rows, "of_rows": profile.n_rows, "confidence": 0.95}
+    return out
+
+@dataclass
+class PreprocessingStats:
+    """
+    Dataset-level statistics that cleaning + feature engineering derive from the data:
+    fitted once on the training set and stored in the ModelBundle, so inference only applies
+    them and every row is processed independently of the rest of its batch.
+    """
+    median_income: Optional[float] = None
+    constant_columns: list[str] = field(default_factory=list)
+    iqr_bounds: dict[str, tuple[float, float]] = field(default_factory=dict)
+    avg_spend_median: Optional[float] = None
+    fitted_rows: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "median_income": self.median_income,
+            "constant_columns": self.constant_columns,
+            "iqr_bounds": {c: list(b) for c, b in self.iqr_bounds.items()},
+            "avg_spend_median": self.avg_spend_median,
+            "fitted_rows": self.fitted_rows,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "PreprocessingStats":
+        return cls(
+            median_income=d.get("median_income"),
+            constant_columns=list(d.get("constant_columns", [])),
+            iqr_bounds={c: (float(lo), float(hi)) for c, (lo, hi) in d.get("iqr_bounds", {}).items()},
+            avg_spend_median=d.get("avg_spend_median"),
+            fitted_rows=int(d.get("fitted_rows", 0)),
+        )
+
+def clean_data(df: pd.DataFrame, stats: PreprocessingStats | None = None) -> tuple[pd.DataFrame, dict]:
+    """
+    stats: frozen training statistics (income median, constant columns); when omitted they are
+    fitted on df itself.
+    """
+    df, report, _ = _clean_data(df, stats)
+    return df, report
+
+def _clean_data(df: pd.DataFrame, stats: PreprocessingStats | None) -> tuple[pd.DataFrame, dict, PreprocessingStats]:
+    fitted = PreprocessingStats()
     report = {}
 
     # Datetime parsing
     if "Dt_Customer" in df.columns:
         df["Dt_Customer"] = pd.to_datetime(df["Dt_Customer"], errors="coerce")
 
-    # Missing + zeros summary
-    missing_counts = df.isnull().sum()
-    missing_pct = (missing_counts / len(df) * 100).round(2)
-    missing_summary = (
-        pd.DataFrame({"Missing_Value_Count": missing_counts, "Missing_value_percentage": missing_pct})
-        .query("Missing_Value_Count > 0")
-        .sort_values("Missing_value_percentage", ascending=False)
-    )
-
-    num_cols = df.select_dtypes(include=["int64", "float64"]).columns
-    zero_counts = (df[num_cols] == 0).sum()
-    zero_pct = (zero_counts / len(df) * 100).round(2)
-    zero_summary = (
-        pd.DataFrame({"Zero_Count": zero_counts, "Zero_Percentage": zero_pct})
-        .query("Zero_Count > 0")
-        .sort_values("Zero_Percentage", ascending=False)
-    )
-
-    report["missing_summary"] = missing_summary.reset_index().rename(columns={"index": "column"}).to_dict("records")
-    report["zero_summary"] = zero_summary.reset_index().rename(columns={"index": "column"}).to_dict("records")
-
-    # Income cleaning (Income=0 -> NaN -> median)
+    # Income cleaning (Income=0 -> NaN -> median); applied after profiling, which counts raw values
+    income = None
     if "Income" in df.columns:
-        income_zeros = int((df["Income"] == 0).sum())
-        df.loc[df["Income"] == 0, "Income"] = np.nan
-        median_income = float(df["Income"].median())
-        df["Income"] = df["Income"].fillna(median_income)
+        income_zero = df["Income"] == 0
+        income = df["Income"].mask(income_zero)
+        frozen = stats is not None and stats.median_income is not None
+        median_income = stats.median_income if frozen else float(income.median())
+        income = income.fillna(median_income)
+        fitted.median_income = median_income
+
+    # Corrupted IDs (a row duplicating a kept row has the same non-zero ID, so duplicate
+    # detection can run over the full frame)
+    id_ok = (df["ID"] != 0).to_numpy() if "ID" in df.columns else None
+
+    # Missing / zero counts, constant columns and duplicate rows in one pass over the columns;
+    # constants and duplicates see the imputed Income, and constants only need the ID mask
+    # (dropping duplicates never changes which values a column holds)
+    profile = profile_frame(
+        df,
+        keep=id_ok,
+        replace={"Income": income} if income is not None else None,
+        constants=stats is None,
+    )
+    report.update(quality_summaries(profile.missing, profile.zeros, len(df), profile))
 
+    if income is not None:
+        df["Income"] = income
         report["income_imputation"] = {
-            "income_zeros_converted_to_nan": income_zeros,
+            "income_zeros_converted_to_nan": int(income_zero.sum()),
             "median_income_used": round(median_income, 2),
         }
 
-    # Drop corrupted IDs if any
-    if "ID" in df.columns:
-        before = len(df)
-        df = df[df["ID"] != 0].copy()
-        report["removed_id_0_rows"] = int(before - len(df))
-
-    # Drop constant columns
-    constant_cols = [c for c in df.columns if df[c].nunique(dropna=False) == 1]
-    if constant_cols:
-        df = df.drop(columns=constant_cols)
+    # Rows to keep: corrupted IDs and duplicates are masked, then selected in one copy
+    keep = np.ones(len(df), dtype=bool)
+    if id_ok is not None:
+        keep &= id_ok
+        report["removed_id_0_rows"] = int((~id_ok).sum())
+
+    duplicated = profile.duplicated & keep
+    keep &= ~duplicated
+
+    # Drop constant columns (frozen: the columns that were constant in training)
+    if stats is not None:
+        constant_cols = [c for c in stats.constant_columns if c in df.columns]
+    else:
+        constant_cols = profile.constant_columns
+    fitted.constant_columns = constant_cols
     report["dropped_constant_columns"] = constant_cols
 
     # Duplicates
-    duplicates = int(df.duplicated().sum())
-    df = df.drop_duplicates().reset_index(drop=True)
-    report["duplicates_removed"] = duplicates
+    report["duplicates_removed"] = int(duplicated.sum())
 
-    report["shape_after_cleaning"] = {"rows": int(df.shape[0]), "cols": int(df.shape[1])}
-
-    return df, report
+    if not keep.all() or constant_cols:
+        df = df.loc[keep, [c for c in df.columns if c not in constant_cols]]
+    df.index = pd.RangeIndex(len(df))
 
-def cap_outliers_iqr(df: pd.DataFrame) -> pd.DataFrame:
-    cap_cols = [
-        "Income",
-        "MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts",
-        "MntSweetProducts", "MntGoldProds",
-        "NumWebPurchases", "NumCatalogPurchases", "NumWebVisitsMonth",
-    ]
+    report["shape_after_cleaning"] = {"rows": int(df.shape[0]), "cols": int(df.shape[1])}
 
-    for col in cap_cols:
+    return df, report, fitted
+
+IQR_CAP_COLUMNS = [
+    "Income",
+    "MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts",
+    "MntSweetProducts", "MntGoldProds",
+    "NumWebPurchases", "NumCatalogPurchases", "NumWebVisitsMonth",
+]
+
+def iqr_bounds(values: pd.Series) -> tuple[float, float]:
+    q1 = values.quantile(0.25)
+    q3 = values.quantile(0.75)
+    iqr = q3 - q1
+    return q1 - 1.5 * iqr, q3 + 1.5 * iqr
+
+def cap_outliers_iqr(df: pd.DataFrame, bounds: dict[str, tuple[float, float]] | None = None) -> pd.DataFrame:
+    """
+    Clips IQR_CAP_COLUMNS to [Q1 - 1.5*IQR, Q3 + 1.5*IQR].
+    bounds: precomputed per-column (lower, upper); when omitted they are computed from df itself.
+    """
+    for col in IQR_CAP_COLUMNS:
         if col not in df.columns:
             continue
+        if bounds is not None and col not in bounds:
+            continue
 
-        q1 = df[col].quantile(0.25)
-        q3 = df[col].quantile(0.75)
-        iqr = q3 - q1
-        lower = q1 - 1.5 * iqr
-        upper = q3 + 1.5 * iqr
+        lower, upper = bounds[col] if bounds is not None else iqr_bounds(df[col])
 
         df[col] = df[col].clip(lower, upper)
 
     return df
 
-def feature_engineering(df: pd.DataFrame) -> pd.DataFrame:
-    # Age
+CAMPAIGN_COLUMNS = ["AcceptedCmp1", "AcceptedCmp2", "AcceptedCmp3", "AcceptedCmp4", "AcceptedCmp5", "Response"]
+FEATURE_INPUT_COLUMNS = [
+    "Year_Birth", "Kidhome", "Teenhome", "Recency", "NumDealsPurchases",
+    *SPEND_COLUMNS, *PURCHASE_COLUMNS, *CAMPAIGN_COLUMNS,
+]
+
+# engineered counts and flags: integer columns, as pandas arithmetic on integer inputs gives
+# (a count stays float only where an input was missing)
+INTEGER_FEATURES = [
+    "Age", "Total_Children", "Total_Spend", "Total_Purchases", "Customer_Tenure",
+    "Total_Campaign_Accepted", "Recency_RFM", "Frequency_RFM", "Monetary_RFM",
+    "Has_Children", "Promo_Responsive", "Product_Variety", "Discount_Addicted",
+]
+
+def _column(df: pd.DataFrame, col: str, dtype) -> np.ndarray | None:
+    return df[col].to_numpy(dtype=dtype, na_value=np.nan) if col in df.columns else None
+
+def _row_sum(df: pd.DataFrame, cols: list[str], out: np.ndarray) -> np.ndarray:
+    # df[cols].sum(axis=1): missing values count as 0
+    out[:] = 0
+    for c in cols:
+        if c in df.columns:
+            v = _column(df, c, out.dtype)
+            out += np.where(np.isnan(v), 0, v)
+    return out
+
+def feature_engineering(df: pd.DataFrame, avg_spend_median: float | None = None) -> pd.DataFrame:
+    """
+    Adds the engineered columns in one vectorized pass: every derived column is written into a
+    single preallocated 2-D block (float32 when the inputs are compact, float64 otherwise) that is
+    attached to df without copying the input columns. INTEGER_FEATURES without missing values
+    are then stored as int64, so counts and flags keep their integer type.
+    avg_spend_median: precomputed median of Avg_Spend_Per_Purchase for the Discount_Addicted flag;
+    when omitted it is taken from df itself.
+    """
+    now = datetime.now()
+    inputs = [c for c in FEATURE_INPUT_COLUMNS if c in df.columns]
+    dtype = np.float32 if all(df[c].dtype.itemsize <= 4 for c in inputs) else np.float64
+
+    names = []
     if "Year_Birth" in df.columns:
-        df["Age"] = datetime.now().year - df["Year_Birth"]
-        df["Age"] = df["Age"].clip(lower=10, upper=100)
-
-    # Total Children
+        names.append("Age")
     if "Kidhome" in df.columns and "Teenhome" in df.columns:
-        df["Total_Children"] = df["Kidhome"] + df["Teenhome"]
+        names.append("Total_Children")
+    names += ["Total_Spend", "Total_Purchases"]
+    if "Dt_Customer" in df.columns:
+        names.append("Customer_Tenure")
+    names.append("Total_Campaign_Accepted")
+    if "Recency" in df.columns:
+        names.append("Recency_RFM")
+    names += [
+        "Frequency_RFM", "Monetary_RFM",
+        "Web_Purchase_Ratio", "Store_Purchase_Ratio", "Catalog_Purchase_Ratio",
+        "Avg_Spend_Per_Purchase", "Has_Children", "Promo_Responsive",
+        "Deal_Dependency", "Product_Variety", "Discount_Addicted", "CLV_Proxy",
+    ]
+    block = np.empty((len(df), len(names)), dtype=dtype, order="F")
+    col = {name: block[:, i] for i, name in enumerate(names)}
 
-    # Spend
-    spend_cols = ["MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts", "MntSweetProducts", "MntGoldProds"]
-    existing_spend_cols = [c for c in spend_cols if c in df.columns]
-    df["Total_Spend"] = df[existing_spend_cols].sum(axis=1)
+    # Age
+    if "Age" in col:
+        np.clip(now.year - _column(df, "Year_Birth", dtype), 10, 100, out=col["Age"])
 
-    # Purchases
-    purchase_cols = ["NumWebPurchases", "NumCatalogPurchases", "NumStorePurchases"]
-    existing_purchase_cols = [c for c in purchase_cols if c in df.columns]
-    df["Total_Purchases"] = df[existing_purchase_cols].sum(axis=1)
+    # Total Children
+    if "Total_Children" in col:
+        np.add(_column(df, "Kidhome", dtype), _column(df, "Teenhome", dtype), out=col["Total_Children"])
 
-    # Customer tenure
-    if "Dt_Customer" in df.columns:
-        df["Customer_Tenure"] = (datetime.now() - df["Dt_Customer"]).dt.days
+    # Spend / purchases / campaigns accepted
+    total_spend = _row_sum(df, SPEND_COLUMNS, col["Total_Spend"])
+    total_purchases = _row_sum(df, PURCHASE_COLUMNS, col["Total_Purchases"])
+    _row_sum(df, CAMPAIGN_COLUMNS, col["Total_Campaign_Accepted"])
 
-    # Campaign accepted
-    campaign_cols = ["AcceptedCmp1", "AcceptedCmp2", "AcceptedCmp3", "AcceptedCmp4", "AcceptedCmp5", "Response"]
-    existing_campaign_cols = [c for c in campaign_cols if c in df.columns]
-    df["Total_Campaign_Accepted"] = df[existing_campaign_cols].sum(axis=1)
+    # Customer tenure
+    if "Customer_Tenure" in col:
+        col["Customer_Tenure"][:] = (now - df["Dt_Customer"]).dt.days.to_numpy(dtype=dtype, na_value=np.nan)
 
     # RFM style
-    if "Recency" in df.columns:
-        df["Recency_RFM"] = df["Recency"]
-    df["Frequency_RFM"] = df["Total_Purchases"]
-    df["Monetary_RFM"] = df["Total_Spend"]
+    if "Recency_RFM" in col:
+        col["Recency_RFM"][:] = _column(df, "Recency", dtype)
+    col["Frequency_RFM"][:] = total_purchases
+    col["Monetary_RFM"][:] = total_spend
 
     # Ratios + behavior
-    df["Web_Purchase_Ratio"] = df.get("NumWebPurchases", 0) / (df["Total_Purchases"] + 1)
-    df["Store_Purchase_Ratio"] = df.get("NumStorePurchases", 0) / (df["Total_Purchases"] + 1)
-    df["Catalog_Purchase_Ratio"] = df.get("NumCatalogPurchases", 0) / (df["Total_Purchases"] + 1)
-
-    df["Avg_Spend_Per_Purchase"] = df["Total_Spend"] / (df["Total_Purchases"] + 1)
+    denom = total_purchases + 1
+    for name, src in [
+        ("Web_Purchase_Ratio", "NumWebPurchases"),
+        ("Store_Purchase_Ratio", "NumStorePurchases"),
+        ("Catalog_Purchase_Ratio", "NumCatalogPurchases"),
+        ("Deal_Dependency", "NumDealsPurchases"),
+    ]:
+        v = _column(df, src, dtype)
+        if v is None:
+            col[name][:] = 0
+        else:
+            np.divide(v, denom, out=col[name])
+
+    np.divide(total_spend, denom, out=col["Avg_Spend_Per_Purchase"])
 
     # Flags
-    df["Has_Children"] = (df.get("Total_Children", 0) > 0).astype(int)
-    df["Promo_Responsive"] = (df["Total_Campaign_Accepted"] > 0).astype(int)
-
-    # Deal Dependency
-    df["Deal_Dependency"] = df.get("NumDealsPurchases", 0) / (df["Total_Purchases"] + 1)
+    col["Has_Children"][:] = col["Total_Children"] > 0 if "Total_Children" in col else 0
+    col["Promo_Responsive"][:] = col["Total_Campaign_Accepted"] > 0
 
     # Product variety
-    product_cols = ["MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts", "MntSweetProducts", "MntGoldProds"]
-    existing_product_cols = [c for c in product_cols if c in df.columns]
-    df["Product_Variety"] = (df[existing_product_cols] > 0).sum(axis=1)
+    col["Product_Variety"][:] = 0
+    for c in SPEND_COLUMNS:
+        if c in df.columns:
+            col["Product_Variety"] += _column(df, c, dtype) > 0
 
     # Discount addiction index
-    df["Discount_Addicted"] = (
-        (df["Deal_Dependency"] > 0.5) &
-        (df["Avg_Spend_Per_Purchase"] < df["Avg_Spend_Per_Purchase"].median())
-    ).astype(int)
+    if avg_spend_median is None:
+        avg_spend_median = float(np.nanmedian(col["Avg_Spend_Per_Purchase"])) if len(df) else np.nan
+    col["Discount_Addicted"][:] = (col["Deal_Dependency"] > 0.5) & (col["Avg_Spend_Per_Purchase"] < avg_spend_median)
 
     # CLV proxy
-    df["CLV_Proxy"] = df["Avg_Spend_Per_Purchase"] * df["Frequency_RFM"] * df.get("Customer_Tenure", 0)
+    if "Customer_Tenure" in col:
+        np.multiply(col["Avg_Spend_Per_Purchase"] * total_purchases, col["Customer_Tenure"], out=col["CLV_Proxy"])
+    else:
+        col["CLV_Proxy"][:] = 0
+
+    derived = pd.DataFrame(block, columns=names, index=df.index, copy=False)
+    for name in INTEGER_FEATURES:
+        if name in col:
+            v = col[name]
+            if np.isfinite(v).all() and (v == np.round(v)).all():
+                derived[name] = v.astype(np.int64)
+    existing = [c for c in names if c in df.columns]
+    for c in existing:  # recomputed in place, keeping the column position
+        df[c] = derived[c]
+    if len(existing) == len(names):
+        return df
+    return pd.concat([df, derived.drop(columns=existing) if existing else derived], axis=1, copy=False)
+
+def build_features(df: pd.DataFrame, stats: PreprocessingStats | None = None) -> tuple[pd.DataFrame, dict]:
+    """
+    stats: frozen PreprocessingStats (inference with a bundle that carries them);
+    when omitted every statistic is computed from df itself, as in training.
+    """
+    df, report, _ = _build_features(df, stats)
+    return df, report
 
-    return df
+def fit_features(df: pd.DataFrame) -> tuple[pd.DataFrame, dict, PreprocessingStats]:
+    """
+    build_features on a training set, also returning the statistics it fitted.
+    """
+    return _build_features(df, None)
 
-def build_features(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
-    df, report = clean_data(df)
-    df = cap_outliers_iqr(df)
-    df = feature_engineering(df)
+def _build_features(df: pd.DataFrame, stats: PreprocessingStats | None) -> tuple[pd.DataFrame, dict, PreprocessingStats]:
+    df, report, fitted = _clean_data(df, stats)
 
+    if stats is not None:
+        fitted.iqr_bounds = stats.iqr_bounds
+    else:
+        fitted.iqr_bounds = {c: tuple(float(b) for b in iqr_bounds(df[c])) for c in IQR_CAP_COLUMNS if c in df.columns}
+    df = cap_outliers_iqr(df, fitted.iqr_bounds)
+
+    df = feature_engineering(df, stats.avg_spend_median if stats is not None else None)
+    fitted.avg_spend_median = (
+        stats.avg_spend_median if stats is not None else float(df["Avg_Spend_Per_Purchase"].median())
+    )
+    fitted.fitted_rows = int(df.shape[0])
+
+    if stats is not None:
+        report["preprocessing_stats"] = "bundle"
     report["final_shape_with_features"] = {"rows": int(df.shape[0]), "cols": int(df.shape[1])}
-    return df, report
+    return df, report, fitted
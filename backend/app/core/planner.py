@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+
+from backend.app.core.chunked import CHUNK_ROWS, CHUNKED_MIN_ROWS, STATS_RESERVOIR_ROWS
+from backend.app.core.validation import ReadPlan
+
+# per-request memory budget for scoring an upload (0 = unlimited)
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "2048"))
+# smallest chunk the planner shrinks to before refusing an upload
+MIN_CHUNK_ROWS = int(os.getenv("MIN_CHUNK_ROWS", "5000"))
+
+# Cost model, checked against observed_peak_mb on the marketing schema (csv / xlsx / parquet uploads):
+# columns build_features adds, plus Cluster / Cluster_Name
+DERIVED_COLUMNS = 19
+# raw + engineered frame, float64 feature matrix, arrow table of base.parquet and its encode buffers
+WORK_COPIES = 5
+# read_excel loads every cell of the sheet, projected columns or not
+XLSX_READ_CELL_BYTES = 48
+# chunked runs: dedupe hash set entry per distinct row
+DEDUPE_ROW_BYTES = 16
+# chunked runs: writers / reservoirs / pools that exist whatever the upload size
+CHUNKED_FIXED_BYTES = 40 * 1024 * 1024
+
+class MemoryBudgetExceeded(ValueError):
+    pass
+
+def _mb(n_bytes: int | None) -> float | None:
+    return None if n_bytes is None else round(n_bytes / (1024 * 1024), 1)
+
+def _status_bytes(key: str) -> int | None:
+    # VmRSS (resident now) / VmHWM (resident high-water mark) of this process, Linux only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _reset_peak_rss() -> bool:
+    # "5" lowers VmHWM to the current RSS, so the mark only covers what comes after
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+# plans of the runs being observed right now (the RSS high-water mark is per process)
+_observed: list["ExecutionPlan"] = []
+_observed_lock = threading.Lock()
+
+def frame_row_bytes(plan: ReadPlan) -> int:
+    """
+    Bytes per row of the parsed upload: the plan's compact dtypes, 8 for parsed dates and
+    untyped (ID) columns.
+    """
+    return sum(
+        8 if c in plan.parse_dates else np.dtype(plan.dtype.get(c, "float64")).itemsize
+        for c in plan.usecols
+    )
+
+@dataclass
+class ExecutionPlan:
+    """
+    How one upload is scored ("in_memory" or "chunked", with its chunk size) and the peak
+    memory that was estimated for it. Inside observe(), report() adds the observed peak: how
+    far the process RSS rose above its level when the run started, from the RSS high-water
+    mark reset at that point (Linux only, None elsewhere). The mark is per process, so a run
+    that overlapped another observed run reports observed_peak_shared: its peak includes the
+    other run's memory.
+    """
+    mode: str
+    n_rows: int
+    estimated_peak_bytes: int
+    budget_bytes: int
+    chunk_rows: int | None = None
+    _rss_start: int | None = None
+    _shared: bool = False
+
+    @contextmanager
+    def observe(self):
+        with _observed_lock:
+            if _observed:
+                self._shared = True
+                for other in _observed:
+                    other._shared = True
+                tracked = _observed[-1]._rss_start is not None
+            else:
+                tracked = _reset_peak_rss()
+            self._rss_start = _status_bytes("VmRSS") if tracked else None
+            _observed.append(self)
+        try:
+            yield self
+        finally:
+            with _observed_lock:
+                _observed[:] = [p for p in _observed if p is not self]
+
+    def report(self) -> dict:
+        peak = _status_bytes("VmHWM") if self._rss_start is not None else None
+        out = {
+            "mode": self.mode,
+            "rows": self.n_rows,
+            "memory_budget_mb": _mb(self.budget_bytes) if self.budget_bytes else None,
+            "estimated_peak_mb": _mb(self.estimated_peak_bytes),
+            "observed_peak_mb": _mb(None if peak is None else max(0, peak - self._rss_start)),
+        }
+        if self._shared:
+            out["observed_peak_shared"] = True
+        if self.chunk_rows is not None:
+            out["chunk_rows"] = self.chunk_rows
+        return out
+
+def estimate_in_memory_bytes(n_rows: int, n_columns: int, ext: str, mode: str, plan: ReadPlan) -> int:
+    """
+    Peak of parse + build_features + scoring + writing base.parquet as whole frames (scored.xlsx
+    is built later, see scored_export). n_columns is the upload's full header width (read_excel
+    loads unprojected columns too).
+    """
+    derived = DERIVED_COLUMNS if mode == "raw" else 2
+    row = WORK_COPIES * (frame_row_bytes(plan) + 8 * derived)
+    if ext == ".xlsx":
+        row += XLSX_READ_CELL_BYTES * n_columns
+    return n_rows * row
+
+def chunked_row_bytes(mode: str, plan: ReadPlan) -> int:
+    # per row of one chunk in flight
+    derived = DERIVED_COLUMNS if mode == "raw" else 2
+    return WORK_COPIES * (frame_row_bytes(plan) + 8 * derived)
+
+def estimate_chunked_bytes(n_rows: int, chunk_rows: int, mode: str, plan: ReadPlan, frozen_stats: bool) -> int:
+    """
+    Peak of run_chunked_inference: one chunk in flight, the dedupe set over every row, and the
+    cleaning-stats reservoir when the bundle has no frozen statistics.
+    """
+    total = CHUNKED_FIXED_BYTES + min(chunk_rows, n_rows) * chunked_row_bytes(mode, plan)
+    total += n_rows * DEDUPE_ROW_BYTES
+    if mode == "raw" and not frozen_stats:
+        total += min(n_rows, STATS_RESERVOIR_ROWS) * WORK_COPIES * frame_row_bytes(plan)
+    return total
+
+def plan_execution(
+    n_rows: int,
+    n_columns: int,
+    ext: str,
+    mode: str,
+    plan: ReadPlan,
+    frozen_stats: bool,
+    budget_mb: int | None = None,
+) -> ExecutionPlan:
+    """
+    Picks how to score an upload before it is parsed, from the sniffed row count / header and
+    the read plan's dtypes:
+      - in memory below CHUNKED_MIN_ROWS when the estimated peak fits the budget
+      - otherwise chunked, shrinking the chunk (down to MIN_CHUNK_ROWS) until it fits
+      - otherwise MemoryBudgetExceeded
+    """
+    budget = (MEMORY_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024
+
+    if n_rows < CHUNKED_MIN_ROWS:
+        estimate = estimate_in_memory_bytes(n_rows, n_columns, ext, mode, plan)
+        if not budget or estimate <= budget:
+            return ExecutionPlan("in_memory", n_rows, estimate, budget)
+
+    chunk_rows = CHUNK_ROWS
+    estimate = estimate_chunked_bytes(n_rows, chunk_rows, mode, plan, frozen_stats)
+    if budget and estimate > budget:
+        # the chunk is the only term the planner controls
+        fixed = estimate_chunked_bytes(n_rows, 0, mode, plan, frozen_stats)
+        chunk_rows = min(CHUNK_ROWS, max(0, budget - fixed) // chunked_row_bytes(mode, plan))
+        if chunk_rows < MIN_CHUNK_ROWS:
+            needed = estimate_chunked_bytes(n_rows, MIN_CHUNK_ROWS, mode, plan, frozen_stats)
+            raise MemoryBudgetExceeded(
+                f"Scoring this upload ({n_rows} rows) needs an estimated {_mb(needed)} MB, "
+                f"over the per-request memory budget of {_mb(budget)} MB."
+            )
+        estimate = estimate_chunked_bytes(n_rows, chunk_rows, mode, plan, frozen_stats)
+    return ExecutionPlan("chunked", n_rows, estimate, budget, chunk_rows=chunk_rows)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# 0 = exact counts; otherwise missing / zero counts are estimated from this many sampled rows
+# (with 95% bounds) once a frame is larger than that
+PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "0"))
+PROFILE_Z = 1.96
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+_CONSTANT_PROBE = 1024
+
+@dataclass
+class FrameProfile:
+    n_rows: int
+    missing: pd.Series
+    zeros: pd.Series
+    constant_columns: list[str] = field(default_factory=list)
+    duplicated: Optional[np.ndarray] = None
+    # sampled mode only: rows inspected and 95% bounds per column
+    sample_rows: Optional[int] = None
+    missing_ci: dict[str, tuple[int, int]] = field(default_factory=dict)
+    zeros_ci: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+def _number_values_hash(values: pd.Series) -> np.ndarray:
+    # whole numbers hash as int64 (exact beyond 2^53), everything else by its float64 value,
+    # so 7 (int8) and 7.0 (float32) agree while large distinct integer IDs stay distinct
+    if pd.api.types.is_integer_dtype(values) and not values.isna().any():
+        return pd.util.hash_array(values.to_numpy().astype(np.int64, copy=False))
+    f = values.to_numpy(dtype=np.float64, na_value=np.nan) + 0.0  # +0.0 folds -0.0 into 0.0
+    h = pd.util.hash_array(f)
+    whole = np.isfinite(f) & (f == np.round(f)) & (np.abs(f) < 2.0 ** 63)
+    if whole.any():
+        h[whole] = pd.util.hash_array(f[whole].astype(np.int64))
+    return h
+
+def column_hash(values: pd.Series, position: int) -> np.ndarray:
+    """
+    Per-row uint64 hash of one column, salted by its position so the XOR of several columns
+    still depends on which value sits in which column. Numbers hash by value, so an int8 chunk
+    and a float32 chunk holding the same numbers agree.
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        h = _number_values_hash(values)
+    else:
+        h = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return h * np.uint64((2 * position + 1) * _GOLDEN & _MASK64)
+
+def row_hashes(df: pd.DataFrame, replace: dict[str, pd.Series] | None = None, skip: Iterable[str] = ()) -> np.ndarray:
+    """
+    XOR of the salted column hashes: equal rows hash equally, and a column's contribution can be
+    added or swapped later (h ^ column_hash(old, i) ^ column_hash(new, i)).
+    replace: substitute values for some columns; skip: columns left out.
+    """
+    replace = replace or {}
+    skip = set(skip)
+    h = np.zeros(len(df), dtype=np.uint64)
+    for i, c in enumerate(df.columns):
+        if c not in skip:
+            h ^= column_hash(replace.get(c, df[c]), i)
+    return h
+
+def _is_constant(values: pd.Series) -> bool:
+    # values.nunique(dropna=False) == 1, without hashing columns that differ early on
+    n = len(values)
+    if n == 0:
+        return False
+    na = values.isna().to_numpy()
+    if na.all():
+        return True
+    if na.any():
+        return False
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+        arr = values.to_numpy()
+        return bool(arr.min() == arr.max())
+    head = values.iloc[:_CONSTANT_PROBE]
+    if (head != head.iloc[0]).any():
+        return False
+    return values.nunique(dropna=False) == 1
+
+def _confirmed_duplicates(df: pd.DataFrame, replace: dict[str, pd.Series], h: np.ndarray) -> np.ndarray:
+    """
+    df.duplicated() (first occurrence kept) with `replace` applied: the row hashes only pick the
+    candidate rows, an exact comparison of those decides, so a hash collision never drops a row.
+    """
+    candidates = np.flatnonzero(pd.Series(h).duplicated(keep=False).to_numpy())
+    duplicated = np.zeros(len(h), dtype=bool)
+    if len(candidates):
+        rows = df.iloc[candidates]
+        swapped = {c: np.asarray(v)[candidates] for c, v in replace.items() if c in df.columns}
+        if swapped:
+            rows = rows.assign(**swapped)
+        duplicated[candidates] = rows.duplicated().to_numpy()
+    return duplicated
+
+def _wilson_bounds(hits: int, m: int, n: int) -> tuple[int, int]:
+    # 95% Wilson interval for the proportion, scaled to the frame's row count
+    if m == 0:
+        return 0, n
+    p = hits / m
+    z2 = PROFILE_Z * PROFILE_Z
+    center = (p + z2 / (2 * m)) / (1 + z2 / m)
+    half = PROFILE_Z * math.sqrt(p * (1 - p) / m + z2 / (4 * m * m)) / (1 + z2 / m)
+    return max(hits, math.floor((center - half) * n)), min(n - (m - hits), math.ceil((center + half) * n))
+
+def profile_frame(
+    df: pd.DataFrame,
+    keep: np.ndarray | None = None,
+    replace: dict[str, pd.Series] | None = None,
+    constants: bool = True,
+    duplicates: bool = True,
+    sample_rows: int | None = None,
+    seed: int = 42,
+) -> FrameProfile:
+    """
+    One pass over the columns collecting everything the data-quality report needs:
+      - missing counts (all columns) and zero counts (numeric columns), on the values as given
+      - constant columns (nunique(dropna=False) == 1) among the `keep` rows
+      - a duplicated-row mask (first occurrence kept): rows sharing an XOR-salted row hash,
+        confirmed by comparing their values
+    replace: cleaned values (e.g. imputed Income) used for constants / duplicates instead of df's.
+    sample_rows: when set and smaller than the frame, missing / zero counts are estimated from a
+    uniform row sample and reported with 95% bounds; constants and duplicates stay exact since
+    they decide what gets dropped.
+    """
+    n = len(df)
+    replace = replace or {}
+    sample_rows = PROFILE_SAMPLE_ROWS if sample_rows is None else sample_rows
+    sample_idx = None
+    if sample_rows and sample_rows < n:
+        sample_idx = np.sort(np.random.default_rng(seed).choice(n, size=sample_rows, replace=False))
+    kept = None if keep is None or keep.all() else keep
+
+    missing: dict[str, int] = {}
+    zeros: dict[str, int] = {}
+    missing_ci: dict[str, tuple[int, int]] = {}
+    zeros_ci: dict[str, tuple[int, int]] = {}
+    constant_cols: list[str] = []
+    h = np.zeros(n, dtype=np.uint64) if duplicates else None
+
+    for i, c in enumerate(df.columns):
+        s = df[c]
+        counted = s if sample_idx is None else s.iloc[sample_idx]
+        na = int(counted.isna().sum())
+        # same columns as select_dtypes(include="number"): bools are not counted as zeros
+        is_number = pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+        zero = int((counted == 0).sum()) if is_number else 0
+        if sample_idx is None:
+            missing[c] = na
+            if is_number:
+                zeros[c] = zero
+        else:
+            missing[c] = round(na / sample_rows * n)
+            missing_ci[c] = _wilson_bounds(na, sample_rows, n)
+            if is_number:
+                zeros[c] = round(zero / sample_rows * n)
+                zeros_ci[c] = _wilson_bounds(zero, sample_rows, n)
+
+        values = replace.get(c, s)
+        if constants and _is_constant(values if kept is None else values[kept]):
+            constant_cols.append(c)
+        if h is not None:
+            h ^= column_hash(values, i)
+
+    return FrameProfile(
+        n_rows=n,
+        missing=pd.Series(missing, dtype="int64"),
+        zeros=pd.Series(zeros, dtype="int64"),
+        constant_columns=constant_cols,
+        duplicated=_confirmed_duplicates(df, replace, h) if h is not None else None,
+        sample_rows=sample_rows if sample_idx is not None else None,
+        missing_ci=missing_ci,
+        zeros_ci=zeros_ci,
+    )
@@ -1,44 +1,230 @@
 from __future__ import annotations
 
-import io
-import gzip
 import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import RobustScaler, StandardScaler
 
-from backend.app.core.clustering import FINAL_FEATURES
+from backend.app.core.clustering import (
+    FINAL_FEATURES,
+    MINIBATCH_BATCH_SIZE,
+    SILHOUETTE_EXACT_MAX_ROWS,
+    engine_report,
+    feature_matrix,
+    fit_kmeans,
+    make_kmeans,
+    resolve_engine,
+    silhouette_summary,
+)
+from backend.app.core.model_store import bundle_path, get_bundle
 from backend.app.core.personas import attach_cluster_names, CLUSTER_NAMES
+from backend.app.core.run_base import base_path as run_base_path, load_base_df
 from backend.app.core.visuals import build_normalized_heatmap, build_pca_payload, build_cluster_bar_data
 from backend.app.core.simulation_clusters import run_cluster_budget_simulation
+from backend.app.core.singleflight import SingleFlight
+
+# identical recompute requests (same run + same params) arriving together share one computation
+_recompute_flight = SingleFlight()
+_sweep_flight = SingleFlight()
+
+# silhouette evaluations of a k-sweep run next to the (sequential) warm-started fits
+KSWEEP_SILHOUETTE_THREADS = int(os.getenv("KSWEEP_SILHOUETTE_THREADS", "4"))
+# rows per sampled silhouette in a sweep (one per k, each O(rows * n)); curves need less precision
+KSWEEP_SILHOUETTE_ROWS = int(os.getenv("KSWEEP_SILHOUETTE_ROWS", "2000"))
+# base columns a recompute reads: the contract features plus what the simulation aggregates
+RECOMPUTE_COLUMNS = FINAL_FEATURES + ["ID", "Total_Spend"]
+
+def make_scaler(name: str):
+    return RobustScaler() if name.lower() == "robust" else StandardScaler()
+
+def _sweep_dir(run_dir: Path, scaler: str, engine: str, batch_size: int | None) -> Path:
+    # one cache per clustering setup: solutions from another scaler / engine are not reusable
+    name = f"{scaler.lower()}-{engine}"
+    if engine == "minibatch":
+        name += f"-b{batch_size or MINIBATCH_BATCH_SIZE}"
+    return run_dir / "ksweep" / name
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def load_sweep_solution(run_dir: Path, scaler: str, engine: str, batch_size: int | None, k: int) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    (labels, centers) cached by a k-sweep of this run for the same scaler / engine, or None.
+    """
+    path = _sweep_dir(run_dir, scaler, engine, batch_size) / f"k{k}.npz"
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        return z["labels"], z["centers"]
+
+def _save_solution(path: Path, labels: np.ndarray, centers: np.ndarray) -> None:
+    # through a file object: np.savez would append ".npz" to the temp name
+    with open(path, "wb") as f:
+        np.savez(f, labels=labels, centers=centers)
+
+def _grow_centers(Xs: np.ndarray, centers: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Warm start for k+1 (bisecting step): the cluster with the largest within-cluster SSE is split
+    in two by a small 2-means, the other centroids are kept as they are. A worst cluster that
+    cannot be split (fewer than 2 distinct rows: minibatch centers are not cluster means, so a
+    single / duplicated row can carry the largest SSE) keeps its centroid, and the row farthest
+    from its own centroid seeds the new one.
+    """
+    d2 = ((Xs - centers[labels]) ** 2).sum(axis=1)
+    sse = np.bincount(labels, weights=d2, minlength=len(centers))
+    worst = int(np.argmax(sse))
+    members = Xs[labels == worst]
+    if len(members) < 2 or (members == members[0]).all():
+        return np.vstack([centers, Xs[int(np.argmax(d2))]])
+    halves = KMeans(n_clusters=2, random_state=42, n_init=3).fit(members).cluster_centers_
+    return np.vstack([np.delete(centers, worst, axis=0), halves])
+
+def sweep_k_for_run(run_dir, params) -> dict:
+    key = (str(run_dir), json.dumps(params.model_dump(), sort_keys=True))
+    return _sweep_flight.do(key, lambda: _sweep_k(run_dir, params))
+
+def _sweep_k(run_dir, params) -> dict:
+    """
+    Clusters the run's base for every k in [k_min, k_max]: k_min is a full fit, each next k
+    starts from the previous centroids plus one new seed (a single warm-started run), while the
+    (sampled, see silhouette_summary) silhouettes are computed in a thread pool alongside.
+    Labels / centroids per k are cached in the run dir, so recompute at those k skips the fit
+    (except at the bundle's k, which keeps its warm start for persona-aligned ids);
+    a repeated sweep with the same setup is answered from the cached curves.
+    """
+    base_path = run_base_path(run_dir)
+    if not base_path.exists():
+        raise FileNotFoundError(f"{base_path.name} not found")
+
+    X = feature_matrix(load_base_df(base_path, columns=FINAL_FEATURES), FINAL_FEATURES)
+    engine = resolve_engine(params.engine, len(X))
 
-def load_base_df(base_path: str) -> pd.DataFrame:
-    with gzip.open(base_path, "rb") as f:
-        raw_bytes = f.read()
-    return pd.read_csv(io.BytesIO(raw_bytes))
+    cache_dir = _sweep_dir(run_dir, params.scaler, engine, params.batch_size)
+    curves_path = cache_dir / "curves.json"
+    if curves_path.exists():
+        cached = json.loads(curves_path.read_text(encoding="utf-8"))
+        by_k = {c["k"]: c for c in cached["curves"]}
+        if all(k in by_k for k in range(params.k_min, params.k_max + 1)):
+            cached["curves"] = [by_k[k] for k in range(params.k_min, params.k_max + 1)]
+            cached["cached"] = True
+            return cached
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    Xs = make_scaler(params.scaler).fit_transform(X)
+
+    silhouette_rows = KSWEEP_SILHOUETTE_ROWS if len(Xs) > SILHOUETTE_EXACT_MAX_ROWS else 0
+
+    started = time.perf_counter()
+    curves = []
+    with ThreadPoolExecutor(max_workers=KSWEEP_SILHOUETTE_THREADS) as pool:
+        silhouettes = {}
+        centers = labels = None
+        for k in range(params.k_min, params.k_max + 1):
+            fit_started = time.perf_counter()
+            if centers is None:
+                km = fit_kmeans(Xs, k, engine=engine, batch_size=params.batch_size)
+            else:
+                km = make_kmeans(k, engine=engine, batch_size=params.batch_size, init=_grow_centers(Xs, centers, labels))
+                km.fit(Xs)
+            labels, centers = km.labels_, km.cluster_centers_
+            # minibatch inertia_ is only the last batch's: score every engine on the full data
+            inertia = float(((Xs - centers[labels]) ** 2).sum())
+            curves.append({"k": k, "inertia": round(inertia, 4), "fit_seconds": round(time.perf_counter() - fit_started, 3)})
+
+            _write_atomic(cache_dir / f"k{k}.npz", lambda tmp, l=labels, c=centers: _save_solution(tmp, l, c))
+            silhouettes[k] = pool.submit(silhouette_summary, Xs, labels, silhouette_rows)
+
+        for row in curves:
+            sil = silhouettes[row["k"]].result()
+            row["silhouette_mean"] = round(sil["mean"], 4)
+            row["negative_silhouette_pct"] = round(sil["negative_pct"], 4)
+            if sil["sampling"] is not None:
+                row["silhouette_mean_ci95"] = sil["sampling"]["mean_ci95"]
+
+    sweep = {
+        "scaler": params.scaler,
+        "clustering_engine": engine_report(params.engine, engine, params.batch_size, len(Xs), time.perf_counter() - started),
+        "silhouette_sampled": any("silhouette_mean_ci95" in row for row in curves),
+        "curves": curves,
+    }
+    _write_atomic(curves_path, lambda tmp: tmp.write_text(json.dumps(sweep, indent=2), encoding="utf-8"))
+    return {**sweep, "cached": False}
+
+def bundle_init_centers(model_info: dict, scaler, k: int) -> np.ndarray | None:
+    """
+    Centroids of the production bundle that labelled the run, mapped back to feature space and
+    into the newly fitted scaler's space: a warm start for recompute that also keeps cluster
+    ids aligned with CLUSTER_NAMES. None when k differs or the bundle is not available.
+    """
+    if not model_info or model_info.get("k") != k or model_info.get("final_features") != FINAL_FEATURES:
+        return None
+    path = bundle_path(model_info["version"])
+    if not path.exists():
+        return None
+    bundle = get_bundle(model_info["version"])
+    if bundle.k != k or list(bundle.final_features) != FINAL_FEATURES:
+        return None
+    centers = bundle.scaler.inverse_transform(bundle.kmeans.cluster_centers_)
+    return scaler.transform(pd.DataFrame(centers, columns=FINAL_FEATURES))
 
 def recompute_manifest_for_run(run_dir, params) -> dict:
-    base_path = run_dir / "base.csv.gz"
+    key = (str(run_dir), json.dumps(params.model_dump(), sort_keys=True))
+    return _recompute_flight.do(key, lambda: _recompute_manifest(run_dir, params))
+
+def _recompute_manifest(run_dir, params) -> dict:
+    base_path = run_base_path(run_dir)
     manifest_path = run_dir / "manifest.json"
 
     if not base_path.exists():
-        raise FileNotFoundError("base.csv.gz not found")
+        raise FileNotFoundError(f"{base_path.name} not found")
     if not manifest_path.exists():
         raise FileNotFoundError("manifest.json not found")
 
-    df_base = load_base_df(str(base_path))
+    df_base = load_base_df(base_path, columns=RECOMPUTE_COLUMNS)
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
 
     # Build X from the same contract features
-    X = df_base[FINAL_FEATURES].copy()
+    X = feature_matrix(df_base, FINAL_FEATURES)
 
-    scaler = RobustScaler() if params.scaler.lower() == "robust" else StandardScaler()
+    scaler = make_scaler(params.scaler)
     Xs = scaler.fit_transform(X)
 
-    km = KMeans(n_clusters=params.k, random_state=42, n_init=10)
-    labels = km.fit_predict(Xs)
+    # when k matches the bundle, its centroids are the warm start (one run), which also keeps
+    # cluster ids aligned with CLUSTER_NAMES; sweep ids are not, so a k-sweep of this run with
+    # the same setup is only reused at other k, before falling back to k-means++ restarts
+    engine = resolve_engine(params.engine, len(Xs))
+    started = time.perf_counter()
+    init = bundle_init_centers(manifest.get("model"), scaler, params.k)
+    solution = None if init is not None else load_sweep_solution(
+        run_dir, params.scaler, engine, params.batch_size, params.k
+    )
+    if init is not None:
+        km = make_kmeans(params.k, engine=engine, batch_size=params.batch_size, init=init).fit(Xs)
+        labels, centers = km.labels_, km.cluster_centers_
+        source = "bundle_warm_start"
+    elif solution is not None:
+        labels, centers = solution
+        source = "k_sweep_cache"
+    else:
+        km = fit_kmeans(Xs, params.k, engine=engine, batch_size=params.batch_size)
+        labels, centers = km.labels_, km.cluster_centers_
+        source = "fit"
+    fit_seconds = time.perf_counter() - started
 
-    df_out = df_base.copy()
+    df_out = df_base.copy(deep=False)
     df_out["Cluster"] = labels
 
     # Names: only meaningful for k=4
@@ -58,7 +244,7 @@ def recompute_manifest_for_run(run_dir, params) -> dict:
         scaled_X=Xs,
         labels=labels,
         cluster_names=CLUSTER_NAMES if params.k == 4 else {},
-        kmeans_centers_scaled=km.cluster_centers_,
+        kmeans_centers_scaled=centers,
         sample_size=params.pca_sample_size,
     )
 
@@ -74,9 +260,10 @@ def recompute_manifest_for_run(run_dir, params) -> dict:
             loss_source=params.loss_source,
         )
 
-    # Load and update manifest
-    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    # Update manifest
     manifest["tuning_params"] = params.model_dump()
+    manifest["clustering_engine"] = engine_report(params.engine, engine, params.batch_size, len(Xs), fit_seconds)
+    manifest["clustering_engine"]["source"] = source
 
     manifest["visuals"]["heatmap"] = heatmap
     manifest["visuals"]["cluster_bar"] = cluster_bar
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import gzip
+import io
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# the scored base of a run: every cleaned / engineered column with Cluster / Cluster_Name
+BASE_FILE = "base.parquet"
+# runs saved before the columnar base; still read, no longer written
+LEGACY_BASE_FILE = "base.csv.gz"
+# parquet codec of the base (snappy: fast to write, ~4x smaller than the gzip csv)
+BASE_COMPRESSION = os.getenv("BASE_COMPRESSION", "snappy")
+
+def base_path(run_dir: Path) -> Path:
+    """
+    The run's base file: base.parquet, or base.csv.gz for older runs (base.parquet when neither exists).
+    """
+    path = run_dir / BASE_FILE
+    legacy = run_dir / LEGACY_BASE_FILE
+    return legacy if not path.exists() and legacy.exists() else path
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # object columns mixing numbers and text (e.g. an untyped ID) are stored as text
+        mixed = {c: df[c].astype("string") for c in df.columns if df[c].dtype == object}
+        return pa.Table.from_pandas(df.assign(**mixed), preserve_index=False)
+
+def _promote(current: pa.Schema, incoming: pa.Schema) -> pa.Schema:
+    # per column: the wider of both types (int8 + float32 -> float32, null + string -> string),
+    # text when they have no common type
+    fields = []
+    for field, other in zip(current, incoming):
+        try:
+            pair = [pa.schema([field]), pa.schema([other.with_name(field.name)])]
+            fields.append(pa.unify_schemas(pair, promote_options="permissive").field(0))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields.append(field.with_type(pa.string()))
+    return pa.schema(fields, metadata=current.metadata)
+
+def write_base(df: pd.DataFrame, run_dir: Path) -> Path:
+    path = run_dir / BASE_FILE
+    pq.write_table(_to_table(df), path, compression=BASE_COMPRESSION)
+    return path
+
+class BaseWriter:
+    """
+    base.parquet written chunk by chunk, one row group per chunk, under the first chunk's schema.
+    A later chunk that needs a wider column type (an integer column with gaps reads as float32,
+    an all-empty text column as null) promotes the schema: the row groups written so far are
+    rewritten once under it, so the file keeps a single schema.
+    """
+
+    def __init__(self, run_dir: Path):
+        self.path = run_dir / BASE_FILE
+        self.schema: pa.Schema | None = None
+        self._writer: pq.ParquetWriter | None = None
+
+    def append(self, df: pd.DataFrame) -> None:
+        table = _to_table(df)
+        if self._writer is None:
+            self.schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self.schema, compression=BASE_COMPRESSION)
+        elif not table.schema.equals(self.schema):
+            promoted = _promote(self.schema, table.schema)
+            if not promoted.equals(self.schema):
+                self._rewrite(promoted)
+            table = table.cast(self.schema)
+        self._writer.write_table(table)
+
+    def _rewrite(self, schema: pa.Schema) -> None:
+        self._writer.close()
+        previous = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}.tmp")
+        os.replace(self.path, previous)
+        try:
+            self._writer = pq.ParquetWriter(self.path, schema, compression=BASE_COMPRESSION)
+            source = pq.ParquetFile(previous)
+            for i in range(source.num_row_groups):
+                self._writer.write_table(source.read_row_group(i).cast(schema))
+        finally:
+            previous.unlink(missing_ok=True)
+        self.schema = schema
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> "BaseWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def load_base_df(path: Path | str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    The run base with its saved dtypes. `columns` restricts the read to those of them present in
+    the base; for base.parquet only their column chunks are read, from a memory-mapped file.
+    Legacy base.csv.gz files are parsed as before.
+    """
+    path = Path(path)
+    if path.name.endswith(".csv.gz"):
+        with gzip.open(path, "rb") as f:
+            raw_bytes = f.read()
+        wanted = None if columns is None else set(columns)
+        return pd.read_csv(io.BytesIO(raw_bytes), usecols=None if wanted is None else lambda c: c in wanted)
+
+    if columns is not None:
+        present = set(pq.read_schema(path).names)
+        columns = [c for c in columns if c in present]
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+def take_base_rows(path: Path | str, positions: np.ndarray, columns: list[str]) -> pd.DataFrame:
+    """
+    Rows at `positions` (0-based, in that order) of a base.parquet, with only `columns`; just
+    the row groups holding them are read, one at a time.
+    """
+    source = pq.ParquetFile(path, memory_map=True)
+    order = np.argsort(positions, kind="stable")
+    wanted = np.asarray(positions)[order]
+
+    parts, start = [], 0
+    for i in range(source.num_row_groups):
+        n = source.metadata.row_group(i).num_rows
+        lo, hi = np.searchsorted(wanted, [start, start + n])
+        if hi > lo:
+            parts.append(source.read_row_group(i, columns=columns).take(pa.array(wanted[lo:hi] - start)))
+        start += n
+
+    rows = pa.concat_tables(parts).to_pandas() if parts else pd.DataFrame(columns=columns)
+    return rows.iloc[np.argsort(order)].reset_index(drop=True)
@@ -2,19 +2,23 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+import copy
 import uuid
 import json
 import pandas as pd
-import io
-import gzip
 
 from datetime import datetime, timezone
 
-from backend.app.core.model_store import load_bundle, bundle_path
-from backend.app.core.pipeline import build_features
+from backend.app.core.artifact_store import artifact_key, get_scored_store
+from backend.app.core.model_store import get_bundle, bundle_path
+from backend.app.core.pipeline import build_features, PIPELINE_VERSION
+from backend.app.core.run_base import base_path, write_base
+from backend.app.core.clustering import feature_matrix
 from backend.app.core.personas import attach_cluster_names, compute_cluster_tables, CLUSTER_NAMES
-from backend.app.core.visuals import build_normalized_heatmap, build_pca_payload, build_cluster_bar_data
+from backend.app.core.scoring import CentroidScorer
+from backend.app.core.shadow import ShadowScorer
+from backend.app.core.visuals import build_normalized_heatmap, build_pca_payload, build_cluster_bar_data, pca_sample_index
 from backend.app.core.simulation_clusters import run_cluster_budget_simulation
 from backend.app.core.ttl import compute_expires_at
 
@@ -28,6 +32,10 @@ def utc_now_iso() -> str:
 class RunConfig:
     model_version: str = "v1"
     sample_size: int = 1200
+    # rows per chunk for out-of-core runs (None -> chunked.CHUNK_ROWS)
+    chunk_rows: Optional[int] = None
+    # candidate version scoring the same rows in shadow (manifest["shadow"]: label agreement)
+    shadow_version: Optional[str] = None
 
 def create_run_id() -> str:
     return uuid.uuid4().hex[:12]
@@ -39,23 +47,27 @@ def run_inference_pipeline(
     input_mode: str = "raw"
 ) -> dict:
     # 1) load production bundle
-    bundle = load_bundle(bundle_path(config.model_version))
+    bundle = get_bundle(config.model_version)
 
     # 2) build features
+    # raw_df is owned by the pipeline from here on: it is modified instead of copied
     if input_mode == "features":
-        df_feat = raw_df.copy()
+        df_feat = raw_df
         report = {"mode": "features", "note": "Uploaded dataset already contains engineered FINAL_FEATURES."}
     else:
-        df_feat, report = build_features(raw_df)
+        df_feat, report = build_features(raw_df, bundle.preprocessing)
 
-    # 3) select final features
-    X = df_feat[bundle.final_features].copy()
+    # 3) + 4) predict clusters straight from the final features (the scaler is folded into
+    # the centroids, so the scaled matrix is never materialised)
+    labels, _ = CentroidScorer.from_bundle(bundle).predict(df_feat)
 
-    # 4) scale + predict clusters
-    X_scaled = bundle.scaler.transform(X)
-    labels = bundle.kmeans.predict(X_scaled)
+    # candidate version in shadow: same engineered frame, one more predict
+    shadow = None
+    if config.shadow_version:
+        shadow = ShadowScorer(bundle, config.shadow_version)
+        shadow.add(df_feat, labels)
 
-    df_out = df_feat.copy()
+    df_out = df_feat
     df_out["Cluster"] = labels
     df_out = attach_cluster_names(df_out)
 
@@ -73,12 +85,15 @@ def run_inference_pipeline(
 
     cluster_bar = build_cluster_bar_data(cluster_counts_records)
 
+    # only the rows PCA plots are scaled
+    pca_idx = pca_sample_index(len(df_out), config.sample_size)
+    pca_rows = df_out if pca_idx is None else df_out.iloc[pca_idx]
     pca_payload = build_pca_payload(
-        scaled_X=X_scaled,
-        labels=labels,
+        scaled_X=bundle.scaler.transform(feature_matrix(pca_rows, bundle.final_features)),
+        labels=labels if pca_idx is None else labels[pca_idx],
         cluster_names=CLUSTER_NAMES,
         kmeans_centers_scaled=bundle.kmeans.cluster_centers_,
-        sample_size=config.sample_size,
+        sample_size=None,
     )
 
     # 7) simulation
@@ -92,7 +107,28 @@ def run_inference_pipeline(
     )
 
     # 8) build manifest
-    manifest = {
+    manifest = build_run_manifest(
+        filename=filename,
+        bundle=bundle,
+        report=report,
+        tables=tables,
+        visuals={
+            "cluster_bar": cluster_bar,
+            "heatmap": heatmap,
+            "pca": pca_payload,
+        },
+        sim=sim,
+    )
+    if shadow is not None:
+        manifest["shadow"] = shadow.report()
+
+    return {
+        "df_scored": df_out,
+        "manifest": manifest,
+    }
+
+def build_run_manifest(filename: str, bundle, report: dict, tables: dict, visuals: dict, sim: dict) -> dict:
+    return {
         "run": {
             "run_id": None,  # filled later
             "created_at_utc": utc_now_iso(),
@@ -102,48 +138,98 @@ def run_inference_pipeline(
         "model": bundle.to_dict(),
         "data_quality_report": report,
         "tables": tables,
-        "visuals": {
-            "cluster_bar": cluster_bar,
-            "heatmap": heatmap,
-            "pca": pca_payload,
-        },
+        "visuals": visuals,
         "simulation": sim,
     }
 
+def scored_cache_key(content_sha256: str, filename: str, config: RunConfig) -> str:
+    """
+    Identity of a scoring result: upload bytes + file type + pipeline version + exact model file
+    + the config knobs that shape the manifest (shadow version and its file included).
+    A retrained bundle (new mtime) never hits old entries.
+    """
+    st = bundle_path(config.model_version).stat()
+    shadow = None
+    if config.shadow_version:
+        shadow_path = bundle_path(config.shadow_version)
+        shadow_st = shadow_path.stat() if shadow_path.exists() else None
+        shadow = [config.shadow_version, shadow_st and shadow_st.st_mtime_ns, shadow_st and shadow_st.st_size]
+    return artifact_key(
+        "scored",
+        content_sha256,
+        Path(filename or "").suffix.lower(),
+        PIPELINE_VERSION,
+        config.model_version,
+        st.st_mtime_ns,
+        st.st_size,
+        config.sample_size,
+        shadow,
+    )
+
+def run_inference_pipeline_cached(
+    content_sha256: str,
+    filename: str,
+    config: RunConfig,
+    compute: Callable[[], dict],
+    ttl_seconds: int,
+) -> dict:
+    """
+    Re-uploads of the same extract reuse the engineered + scored frame and its manifest from
+    the shared scored store; `compute` (parse + run_inference_pipeline) only runs on a miss.
+    The entry holds customer data, so it expires with the run (ttl_seconds), extended by every
+    later run that reuses it.
+    Concurrent identical uploads coalesce onto one computation. Per-run fields
+    (filename, created_at; run_id/TTL later in save_run_outputs) are always regenerated.
+    """
+    computed = False
+
+    def compute_and_flag() -> dict:
+        nonlocal computed
+        computed = True
+        return compute()
+
+    cached = get_scored_store().get_or_compute(
+        scored_cache_key(content_sha256, filename, config),
+        compute_and_flag,
+        ttl_seconds=ttl_seconds,
+    )
+
+    # the cached manifest is shared between callers: each run gets its own copy
+    manifest = copy.deepcopy(cached["manifest"])
+    manifest["run"]["filename"] = filename
+    manifest["run"]["created_at_utc"] = utc_now_iso()
+    manifest["run"]["content_sha256"] = content_sha256
+    manifest["run"]["scored_cache_hit"] = not computed
+
     return {
-        "df_scored": df_out,
+        "df_scored": cached["df_scored"],
         "manifest": manifest,
     }
 
-def save_run_outputs(
-    df_scored: pd.DataFrame,
-    manifest: dict,
-    ttl_seconds: int,
-) -> dict:
+def new_run_dir() -> tuple[str, Path]:
     run_id = create_run_id()
     run_dir = RUNS_DIR / run_id
     run_dir.mkdir(parents=True, exist_ok=True)
+    return run_id, run_dir
 
-    base_path = run_dir / "base.csv.gz"
-    buf = io.BytesIO()
-    df_scored.to_csv(buf, index=False)
-    buf.seek(0)
-    with gzip.open(base_path, "wb") as f:
-        f.write(buf.read())
-
+def finalize_run(run_id: str, run_dir: Path, manifest: dict, ttl_seconds: int, execution=None) -> dict:
+    """
+    Stamps run_id / expiry into the manifest and writes manifest.json + expires_at_utc.txt
+    next to the already written base.parquet (scored.xlsx is built from it on demand).
+    `execution` (planner.ExecutionPlan) adds the estimated vs observed peak memory of the run.
+    """
     expires_at_dt = compute_expires_at(ttl_seconds)
     expires_at_iso = expires_at_dt.replace(microsecond=0).isoformat()
 
     # update manifest
     manifest["run"]["run_id"] = run_id
     manifest["run"]["expires_at_utc"] = expires_at_iso
+    if execution is not None:
+        manifest["execution"] = execution.report()
 
-    scored_path = run_dir / "scored.xlsx"
     manifest_path = run_dir / "manifest.json"
     expires_path = run_dir / "expires_at_utc.txt"
 
-    df_scored.to_excel(scored_path, index=False)
-
     with open(manifest_path, "w", encoding="utf-8") as f:
         json.dump(manifest, f, indent=2)
 
@@ -152,10 +238,23 @@ def save_run_outputs(
     return {
         "run_id": run_id,
         "run_dir": str(run_dir),
-        "scored_path": str(scored_path),
+        "scored_path": str(run_dir / "scored.xlsx"),
         "manifest_path": str(manifest_path),
         "expires_at_utc": expires_at_iso,
         "manifest": manifest,
-        "base_path": str(base_path),
+        "base_path": str(base_path(run_dir)),
 
     }
+
+def save_run_outputs(
+    df_scored: pd.DataFrame,
+    manifest: dict,
+    ttl_seconds: int,
+    execution=None,
+) -> dict:
+    run_id, run_dir = new_run_dir()
+
+    # scored.xlsx is built from the base on its first download (scored_export)
+    write_base(df_scored, run_dir)
+
+    return finalize_run(run_id, run_dir, manifest, ttl_seconds, execution)
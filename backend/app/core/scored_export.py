@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+from backend.app.core.run_base import base_path
+from backend.app.core.singleflight import SingleFlight
+
+# build scored.xlsx in a background task right after an upload instead of on its first download
+PREBUILD_SCORED_XLSX = os.getenv("PREBUILD_SCORED_XLSX", "0") == "1"
+# base rows converted per step while streaming scored.xlsx (memory stays at one batch)
+XLSX_BATCH_ROWS = int(os.getenv("XLSX_BATCH_ROWS", "20000"))
+
+XLSX_MAX_ROWS = 1_048_576
+SCORED_XLSX = "scored.xlsx"
+
+# concurrent downloads of a run whose scored.xlsx is not built yet wait on one build
+_build_flight = SingleFlight()
+
+class _XlsxStream:
+    """
+    scored.xlsx written row by row (openpyxl write-only mode); continues on a new sheet
+    when Excel's row limit is reached.
+    """
+
+    def __init__(self):
+        self.wb = Workbook(write_only=True)
+        self.ws = None
+        self.sheet_rows = 0
+        self.columns: list[str] = []
+
+    def _new_sheet(self) -> None:
+        self.ws = self.wb.create_sheet(f"Sheet{len(self.wb.worksheets) + 1}")
+        self.ws.append(self.columns)
+        self.sheet_rows = 1
+
+    def append(self, df: pd.DataFrame) -> None:
+        if self.ws is None:
+            self.columns = df.columns.tolist()
+            self._new_sheet()
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.ws.append(row)
+            self.sheet_rows += 1
+
+    def save(self, path) -> None:
+        if self.ws is None:
+            self._new_sheet()
+        self.wb.save(path)
+
+def _base_batches(path: Path, batch_rows: int) -> Iterator[pd.DataFrame]:
+    if path.name.endswith(".csv.gz"):
+        yield from pd.read_csv(path, chunksize=batch_rows)
+        return
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+def build_scored_xlsx(run_dir: Path) -> Path:
+    """
+    Streams the run base into scored.xlsx a batch at a time, into a temp file that replaces
+    scored.xlsx only once complete.
+    """
+    source = base_path(run_dir)
+    if not source.exists():
+        raise FileNotFoundError(f"{source.name} not found")
+
+    path = run_dir / SCORED_XLSX
+    xlsx = _XlsxStream()
+    for batch in _base_batches(source, XLSX_BATCH_ROWS):
+        xlsx.append(batch)
+
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        xlsx.save(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return path
+
+def scored_xlsx_for_run(run_dir: Path) -> Path:
+    """
+    The run's scored.xlsx, built from its base on first request and kept in the run dir for
+    later downloads (it expires with the run).
+    """
+    path = run_dir / SCORED_XLSX
+    if path.exists():
+        return path
+    return _build_flight.do(str(run_dir), lambda: path if path.exists() else build_scored_xlsx(run_dir))
+
+def prebuild_scored_xlsx(run_dir: Path) -> None:
+    # background task: the run may expire (or the build fail) before anyone downloads it;
+    # the download endpoint then reports it, not the finished upload
+    try:
+        scored_xlsx_for_run(run_dir)
+    except (OSError, ValueError):
+        pass
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+# working set per block (input rows + their distances to every centroid), sized for L2 / L3
+SCORING_BLOCK_BYTES = int(os.getenv("SCORING_BLOCK_BYTES", str(1024 * 1024)))
+# float32 score gaps within this fraction of the row's magnitude are re-decided in float64
+NEAR_TIE_RTOL = 1e-5
+
+class CentroidScorer:
+    """
+    Nearest-centroid assignment for a fitted per-feature affine scaler (StandardScaler,
+    RobustScaler, ...) followed by KMeans, without materialising the scaled matrix.
+
+    The scaler is folded into the centroids: scaled = X * w + b, so the distance to centroid c
+    is ||X * w - c'|| with c' = c - b, and the argmin over 0.5 * ||c'||^2 - X . (w * c') needs
+    no scaled copy of X. Rows are processed in cache-sized float32 blocks scored into buffers
+    reused across blocks. Rows whose best and second-best scores are too close for float32 are
+    re-decided by the fitted scaler and kmeans.predict in float64, so labels match kmeans.predict.
+    """
+
+    def __init__(self, scaler, kmeans, features: list[str]):
+        self.scaler = scaler
+        self.kmeans = kmeans
+        self.features = list(features)
+
+        # same transform on plain arrays: the near-tie rows are rescored without building a
+        # frame for the fitted feature names (that check alone costs more than the rescoring)
+        self._array_scaler = copy.copy(scaler)
+        if hasattr(self._array_scaler, "feature_names_in_"):
+            del self._array_scaler.feature_names_in_
+
+        d = len(self.features)
+        offset = self._array_scaler.transform(np.zeros((1, d)))[0]
+        unit = self._array_scaler.transform(np.eye(d)) - offset
+        weight = np.diag(unit).copy()
+        if not np.allclose(unit, np.diag(weight)):
+            raise ValueError("CentroidScorer needs a per-feature affine scaler.")
+
+        centers = np.asarray(kmeans.cluster_centers_, dtype=np.float64) - offset
+        self.k = centers.shape[0]
+        self._weighted_centers = np.ascontiguousarray(centers * weight, dtype=np.float32)
+        self._half_weight_sq = (0.5 * weight ** 2).astype(np.float32)
+        self._half_norms = (0.5 * (centers ** 2).sum(axis=1)).astype(np.float32)[:, None]
+        self._max_half_norm = float(self._half_norms.max())
+        # first index of the minimum: k - 1 - max over rows of (is minimum) * (k - 1 - j)
+        self._reverse_index = np.arange(self.k - 1, -1, -1, dtype=np.uint16)[:, None]
+        self.block_rows = max(256, SCORING_BLOCK_BYTES // (4 * (d + self.k)))
+
+    @classmethod
+    def from_bundle(cls, bundle) -> "CentroidScorer":
+        return cls(bundle.scaler, bundle.kmeans, bundle.final_features)
+
+    def _matrix(self, df: pd.DataFrame) -> np.ndarray:
+        # column by column into a Fortran-ordered float32 matrix: one pass per column, no
+        # intermediate frame (df[features] would copy them all first)
+        X = np.empty((len(df), len(self.features)), dtype=np.float32, order="F")
+        for j, col in enumerate(self.features):
+            values = df[col]
+            if isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+                X[:, j] = values.to_numpy(dtype=np.float32, na_value=np.nan)
+            else:
+                X[:, j] = values.to_numpy()
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        return X
+
+    def predict(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (labels, distance to the assigned centroid in scaled space) for df[features].
+        """
+        X = self._matrix(df)
+        n, d = X.shape
+        labels = np.empty(n, dtype=np.int32)
+        distances = np.empty(n, dtype=np.float32)
+        near_ties = []
+
+        width = min(self.block_rows, n)
+        scores_buf = np.empty((self.k, width), dtype=np.float32)
+        minimum_buf = np.empty((self.k, width), dtype=bool)
+        index_buf = np.empty((self.k, width), dtype=np.uint16)
+        square_buf = np.empty((width, d), dtype=np.float32, order="F")
+
+        for start in range(0, n, self.block_rows):
+            block = X[start : start + self.block_rows]
+            m = block.shape[0]
+
+            # k x m, so every reduction below runs over k contiguous rows of length m
+            scores = np.matmul(self._weighted_centers, block.T, out=scores_buf[:, :m])
+            np.subtract(self._half_norms, scores, out=scores)
+            best = scores.min(axis=0)
+            is_min = np.equal(scores, best, out=minimum_buf[:, :m])
+            ties = is_min.sum(axis=0, dtype=np.uint16) > 1
+            first = np.multiply(is_min, self._reverse_index, out=index_buf[:, :m]).max(axis=0)
+            labels[start : start + m] = (self.k - 1) - first.astype(np.int32)
+            np.copyto(scores, np.inf, where=is_min)
+            gap = scores.min(axis=0) - best
+
+            half_zz = np.square(block, out=square_buf[:m]) @ self._half_weight_sq
+            out = distances[start : start + m]
+            np.add(best, half_zz, out=out)
+            np.multiply(out, 2.0, out=out)
+            np.maximum(out, 0.0, out=out)
+            np.sqrt(out, out=out)
+
+            near = ties | (gap <= NEAR_TIE_RTOL * (half_zz + self._max_half_norm))
+            near_ties.append(start + np.flatnonzero(near))
+
+        if near_ties:
+            at = np.concatenate(near_ties)
+            if len(at):
+                self._rescore(df, at, labels, distances)
+        return labels, distances
+
+    def _rescore(self, df: pd.DataFrame, at: np.ndarray, labels: np.ndarray, distances: np.ndarray) -> None:
+        # one float64 pass over every near-tie row of the batch, through the fitted models
+        rows = np.column_stack([df[col].to_numpy()[at].astype(np.float64) for col in self.features])
+        Xs = self._array_scaler.transform(rows)
+        exact = self.kmeans.predict(Xs)
+        labels[at] = exact
+        distances[at] = np.linalg.norm(Xs - self.kmeans.cluster_centers_[exact], axis=1)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+from backend.app.core.model_store import get_bundle
+from backend.app.core.scoring import CentroidScorer
+
+class ShadowScorer:
+    """
+    Scores the rows the active bundle just labelled with a candidate bundle as well, on the same
+    engineered frame (the active bundle's preprocessing), so shadowing costs one predict per
+    batch. Agreement is accumulated as an active x shadow confusion matrix, which merges across
+    chunks. A failing shadow is reported, never raised: it must not break the upload.
+    """
+
+    def __init__(self, active_bundle, version: str):
+        self.version = version
+        self.active_k = active_bundle.k
+        self.seconds = 0.0
+        self.error: str | None = None
+        try:
+            shadow_bundle = get_bundle(version)
+            self._scorer = CentroidScorer.from_bundle(shadow_bundle)
+        except (OSError, ValueError) as e:
+            self.error = f"{type(e).__name__}: {e}"
+            shadow_bundle = None
+        self.shadow_k = shadow_bundle.k if shadow_bundle is not None else 0
+        self.confusion = np.zeros((self.active_k, self.shadow_k), dtype=np.int64)
+
+    def add(self, df_feat: pd.DataFrame, active_labels: np.ndarray) -> None:
+        if self.error is not None:
+            return
+        started = time.perf_counter()
+        try:
+            labels, _ = self._scorer.predict(df_feat)
+        except (KeyError, ValueError) as e:
+            self.error = f"{type(e).__name__}: {e}"
+            return
+        pairs = np.asarray(active_labels, dtype=np.int64) * self.shadow_k + labels
+        self.confusion += np.bincount(pairs, minlength=self.active_k * self.shadow_k).reshape(self.confusion.shape)
+        self.seconds += time.perf_counter() - started
+
+    def report(self) -> dict:
+        """
+        label_agreement: rows with the same cluster id in both versions.
+        matched_label_agreement: the same after the best one-to-one relabelling of shadow ids, for
+        retrained models whose clusters match but are numbered differently.
+        """
+        if self.error is not None:
+            return {"version": self.version, "error": self.error}
+
+        rows = int(self.confusion.sum())
+        same = int(np.trace(self.confusion[: min(self.active_k, self.shadow_k), : min(self.active_k, self.shadow_k)]))
+        active_ids, shadow_ids = linear_sum_assignment(self.confusion, maximize=True)
+        matched = int(self.confusion[active_ids, shadow_ids].sum())
+        return {
+            "version": self.version,
+            "rows": rows,
+            "label_agreement": round(same / rows, 6) if rows else None,
+            "matched_label_agreement": round(matched / rows, 6) if rows else None,
+            "shadow_to_active": {int(s): int(a) for a, s in zip(active_ids, shadow_ids)},
+            "confusion": self.confusion.tolist(),  # rows: active cluster id, columns: shadow cluster id
+            "shadow_cluster_counts": [int(c) for c in self.confusion.sum(axis=0)],
+            "predict_seconds": round(self.seconds, 4),
+        }
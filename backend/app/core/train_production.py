@@ -3,17 +3,18 @@ from __future__ import annotations
 import pandas as pd
 from pathlib import Path
 
-from backend.app.core.pipeline import build_features
+from backend.app.core.pipeline import fit_features
 from backend.app.core.clustering import run_kmeans_with_best_scaler, FINAL_FEATURES
 from backend.app.core.personas import CLUSTER_NAMES
-from backend.app.core.model_store import ModelBundle, bundle_path, save_bundle, utc_now_iso
+from backend.app.core.model_store import BUNDLE_FORMAT, ModelBundle, bundle_path, save_bundle, utc_now_iso
 
 def train_and_save_production_bundle(
     demo_data_path: Path,
     version: str = "v1",
 ) -> dict:
     raw_df = pd.read_excel(demo_data_path, engine="openpyxl")
-    df, report = build_features(raw_df)
+    # fit the cleaning / feature statistics once; inference applies them as-is
+    df, report, preprocessing = fit_features(raw_df)
 
     clustering = run_kmeans_with_best_scaler(df, k=4)
 
@@ -26,13 +27,19 @@ def train_and_save_production_bundle(
         cluster_names=CLUSTER_NAMES,
         scaler=clustering["scaler"],
         kmeans=clustering["kmeans_model"],
+        preprocessing=preprocessing,
+        cluster_counts=[int(c["customers"]) for c in sorted(clustering["cluster_counts"], key=lambda c: c["cluster_id"])],
     )
 
-    path = bundle_path(version)
+    path = bundle_path(version, fmt=BUNDLE_FORMAT)
     save_bundle(bundle, path)
 
-    return {
+    out = {
         "bundle_path": str(path),
         "bundle_meta": bundle.to_dict(),
         "data_quality_report": report,
+        "clustering_engine": clustering["clustering_engine"],
     }
+    if clustering["silhouette_sampling"] is not None:
+        out["silhouette_sampling"] = clustering["silhouette_sampling"]
+    return out
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict, List, Tuple
+import numpy as np
 import pandas as pd
 
 # Column normalization helpers
@@ -75,6 +76,38 @@ ALIASES: Dict[str, List[str]] = {
     "Teenhome": ["teenhome", "teens_home", "teensathome"],
 }
 
+# columns read alongside the contract when present (downstream tables/simulation use them)
+ID_COLUMN = "ID"
+OPTIONAL_FEATURE_COLUMNS = ["Total_Spend", "Catalog_Purchase_Ratio", "Discount_Addicted", "CLV_Proxy"]
+
+# compact dtypes for the real parse (canonical name -> dtype); values are range-checked in coerce_dtypes
+RAW_DTYPES: Dict[str, str] = {
+    **{c: "int8" for c in ["AcceptedCmp1", "AcceptedCmp2", "AcceptedCmp3", "AcceptedCmp4", "AcceptedCmp5", "Response"]},
+    **{c: "int8" for c in ["Kidhome", "Teenhome"]},
+    **{c: "int16" for c in [
+        "Year_Birth", "Recency",
+        "NumWebPurchases", "NumStorePurchases", "NumCatalogPurchases", "NumDealsPurchases",
+    ]},
+    **{c: "float32" for c in [
+        "Income",
+        "MntWines", "MntFruits", "MntMeatProducts", "MntFishProducts", "MntSweetProducts", "MntGoldProds",
+    ]},
+}
+DATE_COLUMNS = ["Dt_Customer"]
+
+@dataclass
+class ReadPlan:
+    """
+    How to parse an upload that already passed header validation.
+    Keys are the upload's actual column names (renames happen after the read).
+    """
+    usecols: List[str]
+    dtype: Dict[str, str] = field(default_factory=dict)
+    parse_dates: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {"usecols": self.usecols, "dtype": self.dtype, "parse_dates": self.parse_dates}
+
 @dataclass
 class ValidationResult:
     mode: str  # "raw" or "features"
@@ -84,12 +117,19 @@ class ValidationResult:
     message: str
 
 def detect_and_validate(df: pd.DataFrame) -> ValidationResult:
-    df, norm_map = normalize_columns(df)
+    return detect_and_validate_columns(list(df.columns))
 
-    # Helper: find canonical in df via exact or alias
+def detect_and_validate_columns(columns: List[str]) -> ValidationResult:
+    """
+    Same contract as detect_and_validate, but needs only the header,
+    so it can run before (or instead of) a full parse.
+    """
+    norm_map = {_norm(c): c for c in columns}
+
+    # Helper: find canonical in columns via exact or alias
     def find_col(canonical: str) -> str | None:
         # exact
-        if canonical in df.columns:
+        if canonical in columns:
             return canonical
         # by normalization exact match
         n = _norm(canonical)
@@ -137,6 +177,53 @@ def detect_and_validate(df: pd.DataFrame) -> ValidationResult:
         message="Detected raw dataset (required columns present).",
     )
 
+def projected_columns(vr: ValidationResult, columns: List[str]) -> List[str]:
+    """
+    Actual column names the pipeline needs for this upload: the matched contract columns,
+    plus ID (and, in features mode, the optional engineered extras) when present.
+    Keeps the upload's column order.
+    """
+    wanted = set(vr.renamed.values())
+    wanted.add(ID_COLUMN)
+    if vr.mode == "features":
+        wanted.update(OPTIONAL_FEATURE_COLUMNS)
+    return [c for c in columns if c in wanted]
+
+def build_read_plan(vr: ValidationResult, columns: List[str]) -> ReadPlan:
+    """
+    Column-projected, typed read plan for a validated header.
+    Raw mode: integer flags/counts as int8/int16, spend and Income as float32, Dt_Customer parsed.
+    Features mode: every engineered column as float32.
+    """
+    usecols = projected_columns(vr, columns)
+
+    if vr.mode == "features":
+        dtype = {c: "float32" for c in usecols if c != ID_COLUMN}
+        return ReadPlan(usecols=usecols, dtype=dtype)
+
+    dtype = {vr.renamed[c]: t for c, t in RAW_DTYPES.items() if c in vr.renamed}
+    parse_dates = [vr.renamed[c] for c in DATE_COLUMNS if c in vr.renamed]
+    return ReadPlan(usecols=usecols, dtype=dtype, parse_dates=parse_dates)
+
+def coerce_dtypes(df: pd.DataFrame, plan: ReadPlan) -> pd.DataFrame:
+    """
+    Applies plan.dtype after a read that could not take it directly (XLSX, columnar, or a CSV
+    with stray values). Non-numeric cells become NaN; integer targets fall back to float32
+    when a column has gaps or values outside the integer range.
+    """
+    for col, target in plan.dtype.items():
+        if col not in df.columns or str(df[col].dtype) == target:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if target.startswith("int"):
+            info = np.iinfo(target)
+            fits = values.notna().all() and values.between(info.min, info.max).all()
+            fits = fits and bool((values == values.round()).all())
+            df[col] = values.astype(target if fits else "float32")
+        else:
+            df[col] = values.astype(target)
+    return df
+
 def apply_renames(df: pd.DataFrame, renamed: Dict[str, str]) -> pd.DataFrame:
     """
     renamed: canonical -> actual. We rename actual columns to canonical names.
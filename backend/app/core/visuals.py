@@ -14,8 +14,16 @@ def build_normalized_heatmap(df: pd.DataFrame, features: list[str]) -> dict:
     values = z-score of cluster mean vs overall mean/std
     """
     profile = df.groupby("Cluster_Name")[features].mean()
+    return build_normalized_heatmap_from_profile(profile)
 
+def build_normalized_heatmap_from_profile(profile: pd.DataFrame) -> dict:
+    """
+    Same payload from precomputed cluster means (rows = Cluster_Name, cols = features),
+    e.g. rebuilt from mergeable cluster partials in chunked runs.
+    """
     # z-score normalize across clusters for each feature
+    # (in float64: means of compact float32 columns would otherwise serialize as 0.035999998...)
+    profile = profile.astype("float64")
     profile_norm = (profile - profile.mean()) / profile.std(ddof=0)
 
     return {
@@ -24,6 +32,14 @@ def build_normalized_heatmap(df: pd.DataFrame, features: list[str]) -> dict:
         "values": profile_norm.round(3).values.tolist(),
     }
 
+def pca_sample_index(n: int, sample_size: int | None, random_state: int = 42) -> np.ndarray | None:
+    """
+    Rows build_pca_payload plots out of n (None = all of them), so callers can scale only those.
+    """
+    if sample_size is None or sample_size >= n:
+        return None
+    return np.random.default_rng(random_state).choice(n, size=sample_size, replace=False)
+
 def build_pca_payload(
     scaled_X: np.ndarray,
     labels: np.ndarray,
@@ -37,15 +53,11 @@ def build_pca_payload(
     scaled_X is the scaled feature matrix used for clustering.
     kmeans_centers_scaled is KMeans cluster_centers_ in scaled space.
     """
-    rng = np.random.default_rng(random_state)
-
-    n = scaled_X.shape[0]
-    if sample_size is not None and sample_size < n:
-        idx = rng.choice(n, size=sample_size, replace=False)
+    idx = pca_sample_index(scaled_X.shape[0], sample_size, random_state)
+    if idx is not None:
         X_use = scaled_X[idx]
         y_use = labels[idx]
     else:
-        idx = np.arange(n)
         X_use = scaled_X
         y_use = labels
 
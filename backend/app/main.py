@@ -1,30 +1,73 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 import pandas as pd
-from io import BytesIO
 from pathlib import Path
+import hashlib
 import os
-
-from backend.app.core.pipeline import build_features
-from backend.app.core.insights import compute_business_insights
-from backend.app.schemas import SimulationRequest, RunTuningParams
+from contextlib import asynccontextmanager
+from typing import BinaryIO
+
+from backend.app.schemas import (
+    SimulationRequest,
+    RunTuningParams,
+    KSweepParams,
+    IncrementalUpdateRequest,
+    PromoteRequest,
+    ShadowRequest,
+)
 from backend.app.core.simulation import run_budget_simulation
-from backend.app.core.clustering import run_kmeans_with_best_scaler, FINAL_FEATURES
-from backend.app.core.personas import attach_cluster_names, compute_cluster_tables
-from backend.app.core.visuals import build_normalized_heatmap, build_pca_payload, build_cluster_bar_data
-from backend.app.core.personas import CLUSTER_NAMES
+from backend.app.core.demo_cache import get_demo_artifacts
 from backend.app.core.simulation_clusters import run_cluster_budget_simulation
 from backend.app.core.train_production import train_and_save_production_bundle
-from backend.app.core.runs import RunConfig, run_inference_pipeline, save_run_outputs
+from backend.app.core.incremental import update_bundle_from_runs
+from backend.app.core.model_store import (
+    PRELOAD_BUNDLES,
+    bundle_path,
+    get_bundle,
+    get_bundle_registry,
+    list_versions,
+    promote_version,
+    read_routing,
+    set_shadow_version,
+)
+from backend.app.core.artifact_store import get_scored_store
+from backend.app.core.runs import RunConfig, run_inference_pipeline, run_inference_pipeline_cached, save_run_outputs
 from backend.app.core.ttl import parse_ttl_to_seconds, cleanup_expired_runs
 from backend.app.core.runs import RUNS_DIR
 from fastapi.responses import FileResponse
-from backend.app.core.recompute import recompute_manifest_for_run
-from backend.app.core.validation import detect_and_validate, apply_renames
+from backend.app.core.recompute import recompute_manifest_for_run, sweep_k_for_run
+from backend.app.core.validation import (
+    ValidationResult,
+    ReadPlan,
+    detect_and_validate_columns,
+    build_read_plan,
+    apply_renames,
+)
+from backend.app.core.ingest import (
+    COLUMNAR_EXTENSIONS,
+    PREVIEW_ROWS,
+    count_rows,
+    iter_table_chunks,
+    read_header,
+    read_table,
+    read_preview,
+)
+from backend.app.core.chunked import run_chunked_inference
+from backend.app.core.planner import MemoryBudgetExceeded, plan_execution
+from backend.app.core.scored_export import PREBUILD_SCORED_XLSX, prebuild_scored_xlsx, scored_xlsx_for_run
 
 from fastapi.middleware.cors import CORSMiddleware
 
 
-app = FastAPI(title="Customer Segmentation API", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # production bundles are loaded once at boot: a missing one fails here, not on the first upload
+    routing = read_routing()
+    routed = [v for v in (routing["active"], routing.get("shadow")) if v]
+    get_bundle_registry().preload(list(dict.fromkeys(routed + PRELOAD_BUNDLES)))
+    yield
+
+app = FastAPI(title="Customer Segmentation API", version="0.2.0", lifespan=lifespan)
 
 # CORS
 # Set this on Render:
@@ -50,8 +93,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ALLOWED_EXTENSIONS = {".csv", ".xlsx"}
-MAX_FILE_MB = 25
+ALLOWED_EXTENSIONS = {".csv", ".xlsx"} | COLUMNAR_EXTENSIONS
+MAX_FILE_MB = int(os.getenv("MAX_FILE_MB", "25"))
+
+# upload bodies are hashed in chunks of this size
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# multipart framing around the file (boundaries, part headers, other form fields)
+UPLOAD_FRAMING_BYTES = 64 * 1024
 
 @app.get("/health")
 def health():
@@ -66,37 +114,87 @@ def _validate_upload(file: UploadFile) -> str:
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type '{ext}'. Please upload CSV or XLSX only."
+            detail=f"Unsupported file type '{ext}'. Please upload CSV, XLSX, Parquet or Feather/Arrow only."
         )
     return ext
 
+def _too_large(size_bytes: int) -> HTTPException:
+    size_mb = size_bytes / (1024 * 1024)
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large ({size_mb:.2f} MB). Max allowed is {MAX_FILE_MB} MB."
+    )
+
+class _BodySizeLimit:
+    """
+    Refuses request bodies over MAX_FILE_MB (plus multipart framing) before they are parsed:
+    FastAPI reads the whole multipart form, spooling the file to disk, before the endpoint
+    runs. A declared Content-Length over the cap is refused on the first read, and a body sent
+    without one is counted as it arrives, so at most the cap is ever received.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        max_bytes = MAX_FILE_MB * 1024 * 1024 + UPLOAD_FRAMING_BYTES
+        declared = dict(scope["headers"]).get(b"content-length")
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            # raised inside the body read: FastAPI re-raises HTTPExceptions from form parsing
+            if declared is not None and declared.isdigit() and int(declared) > max_bytes:
+                raise _too_large(int(declared))
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise _too_large(received)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(_BodySizeLimit)
+
+async def _hash_upload(file: UploadFile) -> tuple[BinaryIO, str]:
+    """
+    The parsed upload's file (already spooled by the form parser, whose size _BodySizeLimit
+    capped) and its sha256, read in UPLOAD_CHUNK_BYTES chunks from that same file.
+    Returns (handle rewound to 0, sha256 hex digest); the caller owns the handle and must close it.
+    """
+    max_bytes = MAX_FILE_MB * 1024 * 1024
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(file.size)
+
+    digest = hashlib.sha256()
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        digest.update(chunk)
+    await file.seek(0)
+    return file.file, digest.hexdigest()
+
 @app.post("/api/upload/preview")
 async def upload_preview(file: UploadFile = File(...)):
     ext = _validate_upload(file)
 
-    content = await file.read()
-    size_mb = len(content) / (1024 * 1024)
-    if size_mb > MAX_FILE_MB:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large ({size_mb:.2f} MB). Max allowed is {MAX_FILE_MB} MB."
-        )
-
-    try:
-        if ext == ".csv":
-            df = pd.read_csv(BytesIO(content))
-        else:  # .xlsx
-            df = pd.read_excel(BytesIO(content), engine="openpyxl")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
+    # header + first rows only; the row count comes from a fast counter (see core/ingest.py)
+    fh, _ = await _hash_upload(file)
+    with fh:
+        try:
+            pv = await run_in_threadpool(read_preview, fh, ext, n_rows=PREVIEW_ROWS)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
 
-    preview_rows = min(5, len(df))
     return {
         "filename": file.filename,
-        "rows": int(df.shape[0]),
-        "cols": int(df.shape[1]),
-        "columns": df.columns.tolist(),
-        "preview": df.head(preview_rows).to_dict(orient="records"),
+        "rows": int(pv["rows"]),
+        "rows_estimated": pv["rows_estimated"],
+        "cols": len(pv["columns"]),
+        "columns": pv["columns"],
+        "preview": pv["head"].to_dict(orient="records"),
     }
 
 DATA_PATH = Path("backend/data/marketing_campaign.xlsx")
@@ -109,7 +207,7 @@ def demo_summary():
             detail="Demo dataset not found. Place marketing_campaign.xlsx inside backend/data/"
         )
 
-    df = pd.read_excel(DATA_PATH, engine="openpyxl")
+    df = get_demo_artifacts(DATA_PATH).raw()
 
     # Minimal demo KPIs ( will expand later)
     total_customers = df["ID"].nunique() if "ID" in df.columns else len(df)
@@ -121,10 +219,11 @@ def demo_summary():
     ]
     existing_spend_cols = [c for c in spend_cols if c in df.columns]
 
-    df["Total_Spend"] = df[existing_spend_cols].sum(axis=1) if existing_spend_cols else 0
+    # computed as a Series: the cached raw frame is shared and must not be mutated
+    total_spend = df[existing_spend_cols].sum(axis=1) if existing_spend_cols else pd.Series(0.0, index=df.index)
 
-    total_revenue = float(df["Total_Spend"].sum())
-    avg_revenue_per_customer = float(df["Total_Spend"].mean())
+    total_revenue = float(total_spend.sum())
+    avg_revenue_per_customer = float(total_spend.mean())
 
     # Personas (static for demo now — later driven from real clustering output)
     personas = [
@@ -174,8 +273,9 @@ def demo_features():
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, report = build_features(raw_df)
+    artifacts = get_demo_artifacts(DATA_PATH)
+    raw_df = artifacts.raw()
+    df, report = artifacts.features()
 
     return {
         "mode": "demo",
@@ -194,10 +294,10 @@ def demo_insights():
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, report = build_features(raw_df)
+    artifacts = get_demo_artifacts(DATA_PATH)
+    _, report = artifacts.features()
 
-    insights = compute_business_insights(df)
+    insights = artifacts.insights()
 
     return {
         "mode": "demo",
@@ -210,8 +310,7 @@ def demo_simulate(payload: SimulationRequest):
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, _ = build_features(raw_df)
+    df, _ = get_demo_artifacts(DATA_PATH).features()
 
     sim = run_budget_simulation(
         df=df,
@@ -227,10 +326,10 @@ def demo_clusters():
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, report = build_features(raw_df)
+    artifacts = get_demo_artifacts(DATA_PATH)
+    _, report = artifacts.features()
 
-    clustering = run_kmeans_with_best_scaler(df, k=4)
+    clustering = artifacts.clustering()
 
     return {
         "mode": "demo",
@@ -248,14 +347,11 @@ def demo_cluster_insights():
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, report = build_features(raw_df)
+    artifacts = get_demo_artifacts(DATA_PATH)
+    _, report = artifacts.features()
 
-    clustering = run_kmeans_with_best_scaler(df, k=4)
-    dfc = clustering["df_with_clusters"]
-    dfc = attach_cluster_names(dfc)
-
-    tables = compute_cluster_tables(dfc)
+    clustering = artifacts.clustering()
+    tables = artifacts.cluster_tables()
 
     return {
         "mode": "demo",
@@ -271,34 +367,15 @@ def demo_cluster_visuals(sample_size: int = 1200):
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, _ = build_features(raw_df)
-
-    clustering = run_kmeans_with_best_scaler(df, k=4)
-    dfc = attach_cluster_names(clustering["df_with_clusters"])
-
-    # heatmap uses FINAL_FEATURES
-    heatmap = build_normalized_heatmap(dfc, FINAL_FEATURES)
-
-    # bar chart data
-    cluster_bar = build_cluster_bar_data(clustering["cluster_counts"])
-
-    # PCA payload uses scaled_X + centers (scaled space)
-    labels = dfc["Cluster"].values
-    pca_payload = build_pca_payload(
-        scaled_X=clustering["scaled_X"],
-        labels=labels,
-        cluster_names=CLUSTER_NAMES,
-        kmeans_centers_scaled=clustering["kmeans_model"].cluster_centers_,
-        sample_size=sample_size,
-    )
+    # cluster bar + heatmap are shared; PCA is cached per sample_size
+    visuals = get_demo_artifacts(DATA_PATH).visuals(sample_size)
 
     return {
         "mode": "demo",
         "visuals": {
-            "cluster_bar": cluster_bar,
-            "heatmap": heatmap,
-            "pca": pca_payload,
+            "cluster_bar": visuals["cluster_bar"],
+            "heatmap": visuals["heatmap"],
+            "pca": visuals["pca"],
         },
     }
 
@@ -307,12 +384,8 @@ def demo_cluster_simulation(payload: SimulationRequest):
     if not DATA_PATH.exists():
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
-    raw_df = pd.read_excel(DATA_PATH, engine="openpyxl")
-    df, _ = build_features(raw_df)
-
-    # clustering step
-    clustering = run_kmeans_with_best_scaler(df, k=4)
-    dfc = attach_cluster_names(clustering["df_with_clusters"])
+    # clustering step (shared)
+    dfc = get_demo_artifacts(DATA_PATH).named_clusters()
 
     # Fixed persona names
     source_cluster = "Budget-Conscious Families"
@@ -338,58 +411,175 @@ def train_production(version: str = "v1"):
         raise HTTPException(status_code=404, detail="Demo dataset missing in backend/data/")
 
     out = train_and_save_production_bundle(Path(DATA_PATH), version=version)
+    # retrained in place: do not wait for the mtime check to drop the old one
+    get_bundle_registry().invalidate(version)
     return {"status": "ok", **out}
 
-@app.post("/api/runs/upload")
-async def upload_run(
-    file: UploadFile = File(...),
-    sample_size: int = 1200,
-    ttl: str = "30m",   # default 30 min
-):
-    # cleanup before new run (keeps storage clean even without cron)
-    cleanup_expired_runs(RUNS_DIR)
+@app.post("/api/admin/update-production")
+def update_production(req: IncrementalUpdateRequest):
+    # incremental refresh: scored runs are folded into a copy of base_version, no full retrain
+    if not bundle_path(req.base_version).exists():
+        raise HTTPException(status_code=404, detail=f"Bundle {req.base_version} not found.")
+    if bundle_path(req.version).exists():
+        raise HTTPException(status_code=409, detail=f"Bundle {req.version} already exists.")
 
-    filename = (file.filename or "").lower()
-    if not (filename.endswith(".xlsx") or filename.endswith(".csv")):
-        raise HTTPException(status_code=400, detail="Only .xlsx and .csv are supported (xlsm not allowed).")
+    cleanup_expired_runs(RUNS_DIR)
+    if req.run_ids is None:
+        run_dirs = sorted(d for d in RUNS_DIR.iterdir() if d.is_dir())
+    else:
+        run_dirs = [RUNS_DIR / run_id for run_id in req.run_ids]
+        missing = [d.name for d in run_dirs if not d.is_dir()]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Runs not found (maybe expired): {missing}")
 
     try:
-        ttl_seconds = parse_ttl_to_seconds(ttl)
+        out = update_bundle_from_runs(req.base_version, req.version, run_dirs, training_data_path=DATA_PATH)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", **out}
 
-    content = await file.read()
+@app.get("/api/admin/models")
+def list_models():
+    return {"routing": read_routing(), "versions": list_versions()}
 
-    # Read into df
-    import io
-    if filename.endswith(".csv"):
-        raw_df = pd.read_csv(io.BytesIO(content))
-    else:
-        raw_df = pd.read_excel(io.BytesIO(content), engine="openpyxl")
+@app.post("/api/admin/models/promote")
+def promote_model(req: PromoteRequest):
+    # atomic switch of the version scoring uploads (active.json); "previous" keeps the rollback target
+    try:
+        routing = promote_version(req.version)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Bundle {req.version} not found.")
+    return {"status": "ok", "routing": routing}
+
+@app.post("/api/admin/models/shadow")
+def set_shadow_model(req: ShadowRequest):
+    try:
+        routing = set_shadow_version(req.version)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Bundle {req.version} not found.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "routing": routing}
+
+def _invalid_schema(vr: ValidationResult) -> HTTPException:
+    return HTTPException(
+        status_code=422,
+        detail={
+            "error": "INVALID_SCHEMA",
+            "message": vr.message,
+            "missing_columns": vr.missing,
+            "how_to_fix": [
+                "Option A: Upload the original raw marketing dataset (with Year_Birth, Dt_Customer, etc.)",
+                "Option B: Upload a dataset that already includes the 13 engineered FINAL_FEATURES columns",
+            ],
+        },
+    )
 
-    vr = detect_and_validate(raw_df)
+def _upload_read_plan(fh, ext: str) -> tuple[ValidationResult, ReadPlan, list[str]]:
+    """
+    Sniffs the header first: a wrong schema is rejected before any full parse,
+    and a valid one yields a column-projected, typed read plan for the real parse
+    (plus the full header, for memory planning).
+    """
+    try:
+        columns = read_header(fh, ext)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
 
+    vr = detect_and_validate_columns(columns)
     if not vr.ok:
-        raise HTTPException(
-            status_code=422,
-            detail={
-                "error": "INVALID_SCHEMA",
-                "message": vr.message,
-                "missing_columns": vr.missing,
-                "how_to_fix": [
-                    "Option A: Upload the original raw marketing dataset (with Year_Birth, Dt_Customer, etc.)",
-                    "Option B: Upload a dataset that already includes the 13 engineered FINAL_FEATURES columns",
-                ],
-            },
-        )
+        raise _invalid_schema(vr)
+    return vr, build_read_plan(vr, columns), columns
+
+def _score_upload(fh: BinaryIO, ext: str, filename: str, sample_size: int, ttl_seconds: int, content_sha256: str) -> dict:
+    """
+    Plans and scores one hashed upload, returns save_run_outputs' dict. Blocking (parsing,
+    scoring, store locks): upload_run calls it in the threadpool.
+    """
+    # cleanup before new run (keeps storage clean even without cron), including cached
+    # scored uploads whose runs have all expired
+    cleanup_expired_runs(RUNS_DIR)
+    get_scored_store().purge_expired()
+
+    routing = read_routing()
+    config = RunConfig(model_version=routing["active"], shadow_version=routing.get("shadow"), sample_size=sample_size)
+
+    try:
+        n_rows, _ = count_rows(fh, ext)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
+
+    vr, plan, columns = _upload_read_plan(fh, ext)
+
+    # in memory, chunked or refused, from the estimated peak against the per-request budget
+    frozen_stats = get_bundle(config.model_version).preprocessing is not None
+    try:
+        execution = plan_execution(n_rows, len(columns), ext, vr.mode, plan, frozen_stats)
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    # the run's own peak memory, recorded next to the estimate
+    with execution.observe():
+        if execution.mode == "chunked":
+            # too large for one frame: stream it in chunks (two passes, bypasses the scored cache)
+            config.chunk_rows = execution.chunk_rows
+
+            def read_chunks(chunk_rows: int):
+                try:
+                    for chunk in iter_table_chunks(fh, ext, plan, chunk_rows):
+                        yield apply_renames(chunk, vr.renamed)
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
+
+            saved = run_chunked_inference(
+                read_chunks,
+                filename,
+                config,
+                ttl_seconds,
+                input_mode=vr.mode,
+                execution=execution,
+                content_sha256=content_sha256,
+            )
+        else:
+            def score_upload() -> dict:
+                try:
+                    raw_df = read_table(fh, ext, plan)
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"Failed to read file: {str(e)}")
+
+                #  rename alias columns to canonical names
+                raw_df = apply_renames(raw_df, vr.renamed)
+
+                return run_inference_pipeline(raw_df, filename, config, input_mode=vr.mode)
+
+            # identical content (same pipeline + model) reuses the scored frame without re-parsing
+            out = run_inference_pipeline_cached(content_sha256, filename, config, score_upload, ttl_seconds)
+            saved = save_run_outputs(out["df_scored"], out["manifest"], ttl_seconds=ttl_seconds, execution=execution)
+    return saved
+
+@app.post("/api/runs/upload")
+async def upload_run(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    sample_size: int = 1200,
+    ttl: str = "30m",   # default 30 min
+):
+    ext = _validate_upload(file)
 
-    #  rename alias columns to canonical names
-    raw_df = apply_renames(raw_df, vr.renamed)
+    try:
+        ttl_seconds = parse_ttl_to_seconds(ttl)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    config = RunConfig(model_version="v1", sample_size=sample_size)
+    fh, content_sha256 = await _hash_upload(file)
+    with fh:
+        # minutes for a large chunked upload: off the event loop, so other requests (and
+        # identical uploads waiting on the scored cache's single-flight) are still served
+        saved = await run_in_threadpool(_score_upload, fh, ext, file.filename, sample_size, ttl_seconds, content_sha256)
 
-    out = run_inference_pipeline(raw_df, file.filename, config,input_mode=vr.mode)
-    saved = save_run_outputs(out["df_scored"], out["manifest"], ttl_seconds=ttl_seconds)
+    # scored.xlsx is not part of the upload: built on first download, or right after the response
+    if PREBUILD_SCORED_XLSX:
+        background_tasks.add_task(prebuild_scored_xlsx, Path(saved["run_dir"]))
 
     return {
         "status": "ok",
@@ -411,8 +601,14 @@ def get_manifest(run_id: str):
 
 @app.get("/api/runs/{run_id}/scored.xlsx")
 def get_scored_xlsx(run_id: str):
-    path = RUNS_DIR / run_id / "scored.xlsx"
-    if not path.exists():
+    run_dir = RUNS_DIR / run_id
+    if not run_dir.exists():
+        raise HTTPException(status_code=404, detail="Run not found (maybe expired).")
+
+    # streamed from the run base on the first download, then served from the run dir
+    try:
+        path = scored_xlsx_for_run(run_dir)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Run not found (maybe expired).")
     return FileResponse(
         path,
@@ -434,3 +630,20 @@ def recompute_run(run_id: str, params: RunTuningParams):
         raise HTTPException(status_code=500, detail=f"Recompute failed: {e}")
 
     return {"status": "ok", "run_id": run_id, "manifest": manifest}
+
+@app.post("/api/runs/{run_id}/k-sweep")
+def k_sweep_run(run_id: str, params: KSweepParams):
+    run_dir = RUNS_DIR / run_id
+    if not run_dir.exists():
+        raise HTTPException(status_code=404, detail="Run not found (maybe expired).")
+    if params.k_min > params.k_max:
+        raise HTTPException(status_code=400, detail="k_min must not exceed k_max.")
+
+    try:
+        sweep = sweep_k_for_run(run_dir, params)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"k-sweep failed: {e}")
+
+    return {"status": "ok", "run_id": run_id, "sweep": sweep}
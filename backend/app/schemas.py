@@ -1,3 +1,5 @@
+from typing import Annotated, Optional
+
 from pydantic import BaseModel, Field
 
 class SimulationRequest(BaseModel):
@@ -9,6 +11,8 @@ class RunTuningParams(BaseModel):
     # clustering
     k: int = Field(4, ge=2, le=10)
     scaler: str = Field("robust")  # "robust" or "standard"
+    engine: str = Field("auto", pattern="^(auto|kmeans|minibatch)$")  # auto: minibatch on large runs
+    batch_size: Optional[int] = Field(None, ge=256, le=100000)  # minibatch only; None = server default
 
     # PCA visual sampling
     pca_sample_size: int = Field(1200, ge=200, le=10000)
@@ -17,3 +21,27 @@ class RunTuningParams(BaseModel):
     budget_shift_pct: float = Field(0.15, ge=0.0, le=1.0)
     uplift_target: float = Field(0.05, ge=0.0, le=1.0)
     loss_source: float = Field(0.02, ge=0.0, le=1.0)
+
+class KSweepParams(BaseModel):
+    k_min: int = Field(2, ge=2, le=10)
+    k_max: int = Field(10, ge=2, le=10)
+    scaler: str = Field("robust")  # "robust" or "standard"
+    engine: str = Field("auto", pattern="^(auto|kmeans|minibatch)$")
+    batch_size: Optional[int] = Field(None, ge=256, le=100000)
+
+# bundle versions become file names
+VERSION_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$"
+
+class PromoteRequest(BaseModel):
+    version: str = Field(..., pattern=VERSION_PATTERN)
+
+class ShadowRequest(BaseModel):
+    version: Optional[str] = Field(None, pattern=VERSION_PATTERN)  # None = stop shadow scoring
+
+# run ids become run dir names (runs.create_run_id)
+RUN_ID_PATTERN = r"^[0-9a-f]{12}$"
+
+class IncrementalUpdateRequest(BaseModel):
+    version: str = Field(..., pattern=VERSION_PATTERN)  # new bundle version to save
+    base_version: str = Field("v1", pattern=VERSION_PATTERN)
+    run_ids: Optional[list[Annotated[str, Field(pattern=RUN_ID_PATTERN)]]] = None  # None = every unexpired run
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# the app resolves backend/models, backend/data and backend/app/storage from the repository root
+ROOT = Path(__file__).resolve().parents[2]
+os.chdir(ROOT)
+
+from backend.app.core import runs  # noqa: E402
+from backend.app.core.model_store import bundle_path, load_bundle  # noqa: E402
+
+DEMO_XLSX = ROOT / "backend" / "data" / "marketing_campaign.xlsx"
+
+@pytest.fixture(scope="session")
+def demo_raw() -> pd.DataFrame:
+    """
+    The demo workbook as read_excel returns it; tests take a copy before changing it.
+    """
+    return pd.read_excel(DEMO_XLSX, engine="openpyxl")
+
+@pytest.fixture(scope="session")
+def bundle():
+    return load_bundle(bundle_path("v1"))
+
+@pytest.fixture
+def runs_dir(tmp_path, monkeypatch) -> Path:
+    # runs written by the test go to a temp dir, not backend/app/storage/runs
+    path = tmp_path / "runs"
+    monkeypatch.setattr(runs, "RUNS_DIR", path)
+    return path
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.app.core import chunked
+from backend.app.core.ingest import iter_table_chunks, read_header, read_table
+from backend.app.core.run_base import load_base_df
+from backend.app.core.runs import RunConfig, run_inference_pipeline, save_run_outputs
+from backend.app.core.validation import apply_renames, build_read_plan, detect_and_validate_columns
+
+CHUNK_ROWS = 500
+
+def _with_duplicates(raw: pd.DataFrame) -> pd.DataFrame:
+    # 300 rows copied once and 50 of them twice, shuffled so copies land in other chunks
+    copies = raw.sample(300, random_state=1)
+    return pd.concat([raw, copies, copies.iloc[:50]], ignore_index=True).sample(frac=1, random_state=2)
+
+def _with_missing_income(raw: pd.DataFrame) -> pd.DataFrame:
+    out = raw.copy()
+    out.loc[out.sample(200, random_state=3).index, "Income"] = np.nan
+    # duplicated rows whose Income is missing (deduped on the imputed value)
+    dup = out[out["Income"].isna()].iloc[:40]
+    return pd.concat([out, dup], ignore_index=True)
+
+UPLOADS = {
+    "csv": (".csv", lambda raw: raw),
+    "parquet": (".parquet", lambda raw: raw),
+    "duplicates": (".csv", _with_duplicates),
+    "missing_income": (".parquet", _with_missing_income),
+}
+
+def _write(df: pd.DataFrame, path) -> None:
+    if path.suffix == ".csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+def _without_run_fields(manifest: dict) -> dict:
+    out = {k: v for k, v in manifest.items() if k != "run"}
+    out["data_quality_report"] = {k: v for k, v in manifest["data_quality_report"].items() if k != "chunked"}
+    return out
+
+def _assert_same(a, b, path="manifest"):
+    if isinstance(a, dict):
+        assert isinstance(b, dict) and a.keys() == b.keys(), path
+        for k in a:
+            _assert_same(a[k], b[k], f"{path}.{k}")
+    elif isinstance(a, list):
+        assert isinstance(b, list) and len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            _assert_same(x, y, f"{path}[{i}]")
+    elif isinstance(a, float) and isinstance(b, float):
+        assert a == pytest.approx(b, rel=1e-9, abs=1e-12, nan_ok=True), path
+    else:
+        assert a == b, path
+
+@pytest.mark.parametrize("upload", sorted(UPLOADS))
+def test_chunked_run_matches_in_memory_run(upload, demo_raw, runs_dir, tmp_path):
+    ext, make = UPLOADS[upload]
+    path = tmp_path / f"upload{ext}"
+    _write(make(demo_raw.copy()), path)
+
+    with open(path, "rb") as fh:
+        columns = read_header(fh, ext)
+        vr = detect_and_validate_columns(columns)
+        plan = build_read_plan(vr, columns)
+        config = RunConfig(chunk_rows=CHUNK_ROWS)
+
+        raw = apply_renames(read_table(fh, ext, plan), vr.renamed)
+        out = run_inference_pipeline(raw, path.name, config, input_mode=vr.mode)
+        in_memory = save_run_outputs(out["df_scored"], out["manifest"], ttl_seconds=60)
+
+        def read_chunks(chunk_rows: int):
+            for chunk in iter_table_chunks(fh, ext, plan, chunk_rows):
+                yield apply_renames(chunk, vr.renamed)
+
+        chunked_run = chunked.run_chunked_inference(read_chunks, path.name, config, 60, input_mode=vr.mode)
+
+    assert chunked_run["manifest"]["data_quality_report"]["chunked"]["chunks"] > 1
+    _assert_same(_without_run_fields(in_memory["manifest"]), _without_run_fields(chunked_run["manifest"]))
+    pd.testing.assert_frame_equal(load_base_df(in_memory["base_path"]), load_base_df(chunked_run["base_path"]))
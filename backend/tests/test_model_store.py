@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+from backend.app.core.bundle_arrays import AffineScaler, CentroidModel
+from backend.app.core.model_store import bundle_path, load_bundle, save_bundle
+from backend.app.core.pipeline import build_features
+from backend.app.core.scoring import CentroidScorer
+
+@pytest.fixture(scope="module")
+def features(demo_raw, bundle) -> pd.DataFrame:
+    df, _ = build_features(demo_raw.copy(), bundle.preprocessing)
+    return df[bundle.final_features]
+
+@pytest.fixture(scope="module")
+def standard_bundle(bundle, features):
+    scaler = StandardScaler().fit(features)
+    kmeans = KMeans(n_clusters=bundle.k, n_init=1, random_state=0).fit(scaler.transform(features))
+    return dataclasses.replace(bundle, version="standard", selected_scaler="standard", scaler=scaler, kmeans=kmeans)
+
+@pytest.mark.parametrize("which", ["v1", "standard"])
+def test_array_bundle_round_trip_gives_identical_labels(which, bundle, standard_bundle, features, tmp_path):
+    original = bundle if which == "v1" else standard_bundle
+    path = bundle_path(original.version, tmp_path, fmt="arrays")
+    save_bundle(original, path)
+    loaded = load_bundle(path)
+
+    assert isinstance(loaded.scaler, AffineScaler) and isinstance(loaded.kmeans, CentroidModel)
+    assert loaded.to_dict() == original.to_dict()
+    assert not loaded.kmeans.cluster_centers_.flags.writeable  # memory-mapped, read-only
+
+    expected_scaled = original.scaler.transform(features)
+    np.testing.assert_array_equal(loaded.scaler.transform(features), expected_scaled)
+    expected = original.kmeans.predict(expected_scaled)
+    np.testing.assert_array_equal(loaded.kmeans.predict(loaded.scaler.transform(features)), expected)
+    np.testing.assert_array_equal(CentroidScorer.from_bundle(loaded).predict(features)[0], expected)
+
+def test_standard_scaler_exports_back_to_sklearn(standard_bundle, features, tmp_path):
+    path = bundle_path("standard", tmp_path, fmt="arrays")
+    save_bundle(standard_bundle, path)
+    restored = load_bundle(path).scaler.to_sklearn()
+    np.testing.assert_array_equal(restored.var_, standard_bundle.scaler.var_)
+    assert restored.n_samples_seen_ == len(features)
+    np.testing.assert_array_equal(restored.transform(features), standard_bundle.scaler.transform(features))
+
+def test_resave_keeps_the_current_and_previous_arrays(bundle, tmp_path):
+    path = bundle_path("v1", tmp_path, fmt="arrays")
+    for _ in range(3):
+        save_bundle(bundle, path)
+    # one generation per array name for the current header, one for readers still mapping the last
+    assert len(list(path.parent.glob("centroids.*.npy"))) == 2
+    np.testing.assert_array_equal(load_bundle(path).kmeans.cluster_centers_, bundle.kmeans.cluster_centers_)
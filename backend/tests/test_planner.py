@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.app.core.chunked import CHUNK_ROWS, CHUNKED_MIN_ROWS
+from backend.app.core.planner import (
+    MIN_CHUNK_ROWS,
+    MemoryBudgetExceeded,
+    estimate_chunked_bytes,
+    estimate_in_memory_bytes,
+    plan_execution,
+)
+from backend.app.core.validation import build_read_plan, detect_and_validate_columns
+
+MB = 1024 * 1024
+
+@pytest.fixture(scope="module")
+def raw_plan(demo_raw):
+    columns = list(demo_raw.columns)
+    vr = detect_and_validate_columns(columns)
+    assert vr.ok and vr.mode == "raw"
+    return build_read_plan(vr, columns), len(columns)
+
+def test_small_upload_runs_in_memory(raw_plan):
+    plan, n_columns = raw_plan
+    execution = plan_execution(2240, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=2048)
+    assert execution.mode == "in_memory"
+    assert execution.chunk_rows is None
+    assert execution.estimated_peak_bytes == estimate_in_memory_bytes(2240, n_columns, ".csv", "raw", plan)
+
+def test_rows_from_chunked_min_rows_are_chunked(raw_plan):
+    plan, n_columns = raw_plan
+    execution = plan_execution(CHUNKED_MIN_ROWS, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=0)
+    assert execution.mode == "chunked"
+    assert execution.chunk_rows == CHUNK_ROWS
+
+def test_in_memory_estimate_over_budget_is_chunked(raw_plan):
+    plan, n_columns = raw_plan
+    n_rows = CHUNKED_MIN_ROWS // 2
+    in_memory = estimate_in_memory_bytes(n_rows, n_columns, ".xlsx", "raw", plan)
+    budget_mb = in_memory // MB - 1
+    execution = plan_execution(n_rows, n_columns, ".xlsx", "raw", plan, frozen_stats=True, budget_mb=budget_mb)
+    assert execution.mode == "chunked"
+    assert execution.estimated_peak_bytes <= budget_mb * MB
+
+def test_chunk_shrinks_to_fit_the_budget(raw_plan):
+    plan, n_columns = raw_plan
+    n_rows = 5 * CHUNKED_MIN_ROWS
+    full = estimate_chunked_bytes(n_rows, CHUNK_ROWS, "raw", plan, frozen_stats=True)
+    budget_mb = full // MB - 1
+    execution = plan_execution(n_rows, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=budget_mb)
+    assert execution.mode == "chunked"
+    assert MIN_CHUNK_ROWS <= execution.chunk_rows < CHUNK_ROWS
+    assert execution.estimated_peak_bytes <= budget_mb * MB
+
+def test_upload_over_budget_at_min_chunk_is_refused(raw_plan):
+    plan, n_columns = raw_plan
+    with pytest.raises(MemoryBudgetExceeded):
+        plan_execution(5 * CHUNKED_MIN_ROWS, n_columns, ".csv", "raw", plan, frozen_stats=False, budget_mb=1)
+
+def test_report_records_estimate_and_observed_peak(raw_plan):
+    plan, n_columns = raw_plan
+    execution = plan_execution(2240, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=2048)
+    with execution.observe():
+        block = b"x" * (64 * MB)
+        report = execution.report()
+    del block
+    assert report["mode"] == "in_memory"
+    assert report["estimated_peak_mb"] == round(execution.estimated_peak_bytes / MB, 1)
+    assert "observed_peak_shared" not in report
+    if report["observed_peak_mb"] is not None:  # Linux only
+        assert report["observed_peak_mb"] >= 60
+
+def test_overlapping_runs_report_a_shared_peak(raw_plan):
+    plan, n_columns = raw_plan
+    first = plan_execution(2240, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=2048)
+    second = plan_execution(2240, n_columns, ".csv", "raw", plan, frozen_stats=True, budget_mb=2048)
+    with first.observe():
+        with second.observe():
+            pass
+        assert first.report().get("observed_peak_shared") is True
+    assert second.report().get("observed_peak_shared") is True
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.app.core import profiler
+from backend.app.core.profiler import profile_frame
+
+def _frame() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 400
+    df = pd.DataFrame({
+        "ID": np.arange(n, dtype=np.int64) + 2 ** 60,
+        "Income": rng.choice([np.nan, 1000.0, 2500.5, 7.0], n),
+        "Kids": rng.integers(0, 3, n).astype(np.int8),
+        "Education": rng.choice(["Basic", "Master", None], n),
+    })
+    # exact copies, copies differing by one in an ID above 2^53, and copies differing only in text
+    df = pd.concat([df, df.iloc[:60], df.iloc[60:80].assign(ID=lambda d: d["ID"] + 1)], ignore_index=True)
+    last = df.iloc[80:100].copy()
+    last["Education"] = "PhD"
+    return pd.concat([df, last], ignore_index=True)
+
+def _colliding_hash(values: pd.Series, position: int) -> np.ndarray:
+    # every row hashes to one of two values: the hash flags nearly all rows as candidates
+    return (np.arange(len(values)) % 2).astype(np.uint64)
+
+def test_duplicates_match_pandas():
+    df = _frame()
+    np.testing.assert_array_equal(profile_frame(df).duplicated, df.duplicated().to_numpy())
+
+@pytest.mark.parametrize("hash_fn", [_colliding_hash, lambda values, position: np.zeros(len(values), np.uint64)])
+def test_duplicates_match_pandas_when_row_hashes_collide(monkeypatch, hash_fn):
+    monkeypatch.setattr(profiler, "column_hash", hash_fn)
+    df = _frame()
+    expected = df.duplicated().to_numpy()
+    assert expected.any()
+    np.testing.assert_array_equal(profile_frame(df).duplicated, expected)
+    assert len(df.drop_duplicates()) == (~profile_frame(df).duplicated).sum()
+
+def test_duplicates_use_replaced_values(monkeypatch):
+    monkeypatch.setattr(profiler, "column_hash", lambda values, position: np.zeros(len(values), np.uint64))
+    df = _frame()
+    imputed = df["Income"].fillna(df["Income"].median())
+    expected = df.assign(Income=imputed).duplicated().to_numpy()
+    np.testing.assert_array_equal(profile_frame(df, replace={"Income": imputed}).duplicated, expected)
+
+def test_constant_columns_match_nunique():
+    df = _frame().assign(Same=3, Empty=np.nan, Text="x")
+    expected = [c for c in df.columns if df[c].nunique(dropna=False) == 1]
+    assert profile_frame(df).constant_columns == expected
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import numpy as np
+
+from backend.app.core.recompute import _grow_centers
+
+def test_grow_centers_splits_the_worst_cluster():
+    X = np.random.default_rng(0).normal(size=(200, 3))
+    labels = (X[:, 0] > 0).astype(int)
+    centers = np.array([X[labels == i].mean(axis=0) for i in range(2)])
+    grown = _grow_centers(X, centers, labels)
+    assert grown.shape == (3, 3)
+
+def test_grow_centers_seeds_from_the_farthest_row_when_the_worst_cluster_cannot_split():
+    # minibatch centers are not cluster means: a single row / duplicated rows can carry the largest SSE
+    single = np.vstack([np.zeros((50, 3)), np.full((50, 3), 5.0), [[9.0, 9.0, 9.0]]])
+    grown = _grow_centers(single, np.array([[0.0] * 3, [5.0] * 3, [8.0] * 3]), np.repeat([0, 1, 2], [50, 50, 1]))
+    np.testing.assert_array_equal(grown, [[0.0] * 3, [5.0] * 3, [8.0] * 3, [9.0] * 3])
+
+    duplicated = np.vstack([np.zeros((50, 3)), np.full((4, 3), 7.0)])
+    grown = _grow_centers(duplicated, np.array([[0.0] * 3, [6.0] * 3]), np.repeat([0, 1], [50, 4]))
+    np.testing.assert_array_equal(grown, [[0.0] * 3, [6.0] * 3, [7.0] * 3])
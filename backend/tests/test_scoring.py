@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.app.core import scoring
+from backend.app.core.pipeline import build_features
+from backend.app.core.scoring import CentroidScorer
+
+@pytest.fixture(scope="module")
+def features(demo_raw, bundle) -> pd.DataFrame:
+    df, _ = build_features(demo_raw.copy(), bundle.preprocessing)
+    return df
+
+def _reference(bundle, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    X = bundle.scaler.transform(df[bundle.final_features].astype(np.float64))
+    labels = bundle.kmeans.predict(X)
+    return labels, np.linalg.norm(X - bundle.kmeans.cluster_centers_[labels], axis=1)
+
+def _midpoints(bundle, n_per_pair: int, jitter: float) -> pd.DataFrame:
+    # rows (almost) equidistant from two centroids, mapped back to raw feature units
+    centers = bundle.kmeans.cluster_centers_
+    t = np.random.default_rng(0).normal(0.5, jitter, n_per_pair)[:, None]
+    scaled = [centers[i] * (1 - t) + centers[j] * t for i in range(len(centers)) for j in range(i + 1, len(centers))]
+    return pd.DataFrame(bundle.scaler.inverse_transform(np.vstack(scaled)), columns=bundle.final_features)
+
+def test_labels_match_kmeans_predict(bundle, features):
+    labels, distances = CentroidScorer.from_bundle(bundle).predict(features)
+    ref_labels, ref_distances = _reference(bundle, features)
+    np.testing.assert_array_equal(labels, ref_labels)
+    np.testing.assert_allclose(distances, ref_distances, rtol=1e-4, atol=1e-4)
+
+@pytest.mark.parametrize("jitter", [0.0, 1e-9, 1e-6])
+def test_near_tie_rows_match_kmeans_predict(bundle, jitter):
+    df = _midpoints(bundle, 200, jitter)
+    labels, _ = CentroidScorer.from_bundle(bundle).predict(df)
+    np.testing.assert_array_equal(labels, _reference(bundle, df)[0])
+
+def test_blocks_and_dtypes_do_not_change_labels(bundle, features, monkeypatch):
+    # many small blocks, compact / nullable column dtypes and a non-default index
+    monkeypatch.setattr(scoring, "SCORING_BLOCK_BYTES", 1)
+    df = features.assign(
+        Age=features["Age"].astype(np.int16),
+        Total_Children=features["Total_Children"].astype(np.int8),
+        Income=features["Income"].astype("Float64"),
+    )
+    df.index = df.index * 3 + 7
+    scorer = CentroidScorer.from_bundle(bundle)
+    assert scorer.block_rows == 256
+    np.testing.assert_array_equal(scorer.predict(df)[0], _reference(bundle, features)[0])
+
+def test_missing_values_are_rejected(bundle, features):
+    df = features.copy()
+    df.iloc[3, df.columns.get_loc(bundle.final_features[0])] = np.nan
+    with pytest.raises(ValueError, match="NaN"):
+        CentroidScorer.from_bundle(bundle).predict(df)